@@ -0,0 +1,127 @@
+from channel import Channel, Overflow
+
+
+# Разделитель КМ в сообщении камеры; им же завершается сообщение
+STACK_SEPARATOR = "\n\r"
+SEPARATOR_BYTES = STACK_SEPARATOR.encode()
+
+
+class StackBuffer:
+    # Пачка камеры: содержимое короба или паллеты. Слоты выделяются один
+    # раз под размер пачки: на КМ два слота - байты КМ и готовый хвост
+    # (флаг качества с разделителем). Пачка отдается списком частей,
+    # которые уходят отдельными буферами sendmsg, без склейки сообщения
+    __slots__ = ('size', 'slots', 'count', 'codes')
+
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError(f"stack size must be positive, got {size}")
+        self.size = size
+        self.slots: list[bytes] = [b''] * (2 * size)
+        self.count = 0
+        # Сколько в пачке настоящих КМ (не 'error')
+        self.codes = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, message: bytes, suffix: bytes = SEPARATOR_BYTES,
+            code: bool = True) -> bool:
+        # True, когда пачка заполнена
+        at = 2 * self.count
+        self.slots[at] = message
+        self.slots[at + 1] = suffix
+        self.count += 1
+        if code:
+            self.codes += 1
+        return self.count == self.size
+
+    def take(self) -> tuple[tuple[bytes, ...], int]:
+        # Части сообщения пачки (с завершающим разделителем) и число КМ в
+        # нем; копируются только ссылки, буфер готов к следующей пачке
+        if self.count == self.size:
+            parts = tuple(self.slots)
+        else:
+            parts = tuple(self.slots[:2 * self.count])
+        codes = self.codes
+        self.count = self.codes = 0
+        return parts, codes
+
+
+class BoxRouter:
+    # Передает КМ следующим камерам коробами: размер короба КМ подряд в
+    # один буфер, затем в следующий, чтобы в пачку камеры агрегации
+    # попадали соседние КМ. box_size - общий размер или размеры по именам
+    # буферов (по умолчанию 1 - по очереди)
+    def __init__(self, buffers: list[Channel],
+                 box_size: int | dict[str, int] = 1):
+        self.buffers = buffers
+        self.box_size = box_size
+        self.index = 0
+        self.filled = 0
+        # Размер текущего короба; буферы могут добавляться после создания
+        self.limit = 0
+
+    def __bool__(self):
+        return bool(self.buffers)
+
+    def capacity(self, buffer: Channel) -> int:
+        if isinstance(self.box_size, int):
+            return self.box_size
+        return self.box_size.get(buffer.name, 1)
+
+    def writable(self, count: int = 1) -> bool:
+        # Поместятся ли следующие count КМ в буферы с переполнением BLOCK,
+        # с учетом того, что короб может закончиться посередине
+        buffers = self.buffers
+        index, filled, limit = self.index, self.filled, self.limit
+        if count == 1:
+            return buffers[index].writable()
+        while count > 0:
+            buffer = buffers[index]
+            take = min(count, (limit or self.capacity(buffer)) - filled)
+            if (
+                buffer.overflow is Overflow.BLOCK and
+                buffer.capacity - len(buffer) < take
+            ):
+                return False
+            count -= take
+            filled = limit = 0
+            index = index + 1 if index + 1 < len(buffers) else 0
+        return True
+
+    def route(self, code: str) -> Channel | None:
+        # None - буфер с переполнением BLOCK полон, КМ не принят
+        buffer = self.buffers[self.index]
+        if not buffer.append(code):
+            return None
+        self.filled += 1
+        if not self.limit:
+            self.limit = self.capacity(buffer)
+        if self.filled >= self.limit:
+            self._next()
+        return buffer
+
+    def route_all(self, codes: list[str]) -> int:
+        # Пачка раскладывается отрезками по коробам, а не по одному КМ.
+        # Возвращает, сколько КМ принято: остальные не поместились
+        start = 0
+        while start < len(codes):
+            buffer = self.buffers[self.index]
+            if not self.limit:
+                self.limit = self.capacity(buffer)
+            end = min(len(codes), start + self.limit - self.filled)
+            accepted = buffer.extend(codes[start:end])
+            self.filled += accepted
+            if self.filled >= self.limit:
+                self._next()
+            start += accepted
+            if start < end:
+                break
+        return start
+
+    def _next(self):
+        self.filled = self.limit = 0
+        self.index += 1
+        if self.index >= len(self.buffers):
+            self.index = 0
@@ -0,0 +1,392 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import socket
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from time import monotonic, perf_counter, process_time
+
+import line_emulator
+from bench_parsers import JOBS, sample_code
+from devices import AGR_STACK, DEVICES, MAX_AGR_COUNT, start_ser_line
+from event_loop import EventLoop, get_event_loop
+
+
+GS = b'\x1d'
+PORT_BASE = 40000
+# Сколько кодов агрегации составляют короб для принтера PRNAGR
+BOX_SIZE = AGR_STACK
+BOX_GTIN = '09999999999999'
+DRAIN_TIMEOUT = 5.0
+STOP_POLL = 0.1
+
+
+def serial_of(line: bytes) -> int | None:
+    # Серийный номер sample_code: 13 цифр перед первым GS
+    gs = line.find(GS)
+    if gs < 13:
+        return None
+    try:
+        return int(line[gs - 13:gs])
+    except ValueError:
+        return None
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {'p50': None, 'p99': None, 'max': None, 'count': 0}
+    values = sorted(values)
+
+    def at(q: float) -> float:
+        return round(values[int(q * (len(values) - 1))] * 1000, 3)
+
+    return {
+        'p50': at(0.5), 'p99': at(0.99), 'max': at(1.0),
+        'count': len(values),
+    }
+
+
+def emulator(port_offset: int, options: dict, stop, results):
+    # Линия в отдельном процессе: ее процессорное время не смешивается
+    # с нагрузочными клиентами
+    line_emulator.setup_logging(logging.WARNING, 'BENCH')
+    args = argparse.Namespace(**options)
+    loop = get_event_loop()
+    loop.enable_cpu_accounting()
+    line_emulator.setup_recorders(args)
+    if start_ser_line(args, port_offset) is None:
+        results.put(None)
+        return
+    results.put('ready')
+    started = process_time()
+
+    def poll():
+        if not stop.is_set():
+            loop.call_later(STOP_POLL, poll)
+            return
+        results.put({
+            'devices': [d.stats() for d in DEVICES],
+            'cpu': dict(loop.cpu_time),
+            'process_cpu': process_time() - started,
+        })
+        loop.stop()
+
+    loop.call_later(STOP_POLL, poll)
+    loop.run_forever()
+
+
+class StreamClient:
+    # Неблокирующий клиент устройства: отправка с буфером, чтение строк
+    def __init__(self, loop: EventLoop, port: int, on_line=None):
+        self.loop = loop
+        self.on_line = on_line
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.tx = bytearray()
+        self.rx = bytearray()
+        self.waiting = False
+        loop.add_reader(self.sock, self.receive)
+
+    def send(self, data: bytes):
+        self.tx += data
+        self.flush()
+
+    def flush(self):
+        try:
+            sent = self.sock.send(self.tx)
+        except BlockingIOError:
+            sent = 0
+        del self.tx[:sent]
+        if self.tx and not self.waiting:
+            self.waiting = True
+            self.loop.add_writer(self.sock, self.flush)
+        elif not self.tx and self.waiting:
+            self.waiting = False
+            self.loop.remove_writer(self.sock)
+
+    def receive(self):
+        try:
+            data = self.sock.recv(1 << 16)
+        except BlockingIOError:
+            return
+        if not data:
+            self.loop.forget(self.sock)
+            return
+        if self.on_line is None:
+            return
+        self.rx += data
+        end = self.rx.rfind(b'\n')
+        if end < 0:
+            return
+        lines = bytes(self.rx[:end]).split(b'\n')
+        del self.rx[:end + 1]
+        now = perf_counter()
+        for line in lines:
+            line = line.strip(b'\r')
+            if line:
+                self.on_line(line, now)
+
+    def close(self):
+        self.loop.forget(self.sock)
+        self.sock.close()
+
+
+class LineDriver:
+    # Синтетический MES: печатает этикетки на PRNSER, читает DMSER и
+    # камеры агрегации, печатает короба на PRNAGR и читает VERIF
+    def __init__(self, loop: EventLoop, port_offset: int, agr_count: int,
+                 window: int, rate: float):
+        self.loop = loop
+        self.port_offset = port_offset
+        self.window = window
+        self.rate = rate
+        self.next_serial = 0
+        self.next_box = 0
+        self.sent_at: dict[int, float] = {}
+        self.agr_sent_at: dict[int, float] = {}
+        self.box_sent_at: dict[int, float] = {}
+        self.agr_read = 0
+        self.camera = StreamClient(loop, 23 + port_offset, self.on_code)
+        self.agr = [
+            StreamClient(loop, 27 + port_offset + i, self.on_agr_code)
+            for i in range(agr_count)
+        ]
+        self.box_printer = None
+        self.verif = None
+        if agr_count:
+            self.box_printer = StreamClient(loop, 9102 + port_offset)
+            self.verif = StreamClient(loop, 32 + port_offset, self.on_box)
+        self.reset()
+
+    def reset(self):
+        self.printed = 0
+        self.read = 0
+        self.latencies: list[float] = []
+        self.agr_latencies: list[float] = []
+        self.box_latencies: list[float] = []
+        self.first_sent = 0.0
+        self.last_read = 0.0
+
+    def on_code(self, line: bytes, now: float):
+        sent = self.sent_at.pop(serial_of(line), None)
+        if sent is None:
+            return
+        self.read += 1
+        self.last_read = now
+        self.latencies.append(now - sent)
+
+    def on_agr_code(self, line: bytes, now: float):
+        sent = self.agr_sent_at.pop(serial_of(line), None)
+        if sent is None:
+            return
+        self.agr_latencies.append(now - sent)
+        self.agr_read += 1
+        if self.box_printer is not None and self.agr_read % BOX_SIZE == 0:
+            code = sample_code(self.next_box, BOX_GTIN)
+            self.box_sent_at[self.next_box] = perf_counter()
+            self.next_box += 1
+            self.box_printer.send(
+                JOBS['zpl'][1].format(code=code).encode() + b'~HS'
+            )
+
+    def on_box(self, line: bytes, now: float):
+        sent = self.box_sent_at.pop(serial_of(line), None)
+        if sent is not None:
+            self.box_latencies.append(now - sent)
+
+    def run(self, dialect: str, duration: float) -> dict:
+        # Одна этикетка - задание и запрос статуса: каждый фрейм
+        # продвигает очередь печати принтера на одну этикетку
+        self.reset()
+        template = JOBS[dialect][1]
+        printer = StreamClient(self.loop, 9101 + self.port_offset)
+        started = monotonic()
+        stop_at = started + duration
+        interval = 1 / self.rate if self.rate else 0.0
+        next_send = started
+        self.first_sent = perf_counter()
+        while 1:
+            now = monotonic()
+            if now >= stop_at:
+                break
+            while (
+                len(self.sent_at) < self.window and next_send <= now and
+                len(printer.tx) < 1 << 20
+            ):
+                n = self.next_serial
+                self.next_serial += 1
+                sent = perf_counter()
+                self.sent_at[n] = sent
+                self.agr_sent_at[n] = sent
+                printer.tx += template.format(code=sample_code(n)).encode()
+                printer.tx += b'~HS'
+                self.printed += 1
+                if interval:
+                    next_send += interval
+                    if next_send <= now:
+                        continue
+                    break
+            printer.flush()
+            if self.rate and len(self.sent_at) < self.window:
+                self.loop.run_once(min(stop_at, next_send) - now)
+            else:
+                self.loop.run_once(stop_at - now)
+        drain_until = monotonic() + DRAIN_TIMEOUT
+        while self.sent_at and monotonic() < drain_until:
+            self.loop.run_once(drain_until - monotonic())
+        elapsed = (self.last_read or perf_counter()) - self.first_sent
+        printer.close()
+        lost = len(self.sent_at)
+        self.sent_at.clear()
+        return {
+            'dialect': dialect,
+            'labels_printed': self.printed,
+            'codes_read': self.read,
+            'codes_lost': lost,
+            'elapsed_s': round(elapsed, 3),
+            'throughput_codes_s': round(self.read / elapsed, 1)
+            if elapsed > 0 else 0.0,
+            'latency_ms': percentiles(self.latencies),
+            'agr_latency_ms': percentiles(self.agr_latencies),
+            'box_latency_ms': percentiles(self.box_latencies),
+        }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=Path(__file__).parent, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def line_options(args) -> dict:
+    parser = argparse.ArgumentParser()
+    line_emulator.add_ser_arguments(parser)
+    options = vars(parser.parse_args([]))
+    options.update(
+        agr_count=args.agr_count, read_mode=args.read_mode,
+        read_interval=args.read_interval, log_rate=0,
+    )
+    return options
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Нагрузочный тест линии: пропускная способность, '
+                    'задержка печать - камера и процессорное время устройств'
+    )
+    arg_parser.add_argument(
+        '-d', '--dialects', nargs='+', choices=list(JOBS),
+        default=list(JOBS), help='Языки принтера для прогонов'
+    )
+    arg_parser.add_argument(
+        '-t', '--duration', type=float, default=5.0,
+        help='Длительность прогона одного языка (сек)'
+    )
+    arg_parser.add_argument(
+        '-w', '--window', type=int, default=1000,
+        help='Сколько этикеток может быть напечатано и еще не прочитано'
+    )
+    arg_parser.add_argument(
+        '-r', '--rate', type=float, default=0,
+        help='Этикеток в секунду, 0 - так быстро, как позволяет окно'
+    )
+    arg_parser.add_argument(
+        '-a', '--agr_count', type=int, choices=range(0, MAX_AGR_COUNT + 1),
+        default=3,
+        help='Количество камер агрегации'
+    )
+    arg_parser.add_argument(
+        '-rm', '--read_mode', choices=('fixed', 'consumer'),
+        default='consumer', help='Темп передачи кодов камерами'
+    )
+    arg_parser.add_argument(
+        '-ri', '--read_interval', type=float, default=0.0,
+        help='Интервал передачи кодов камерами в режиме fixed (сек)'
+    )
+    arg_parser.add_argument(
+        '-pb', '--port_base', type=int, default=PORT_BASE,
+        help='Сдвиг портов линии'
+    )
+    arg_parser.add_argument(
+        '-o', '--output', type=Path, default=Path('bench_results.json'),
+        help='Файл результатов (JSON)'
+    )
+    args = arg_parser.parse_args()
+    line_emulator.setup_logging(logging.INFO)
+
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=emulator, name='BENCH_LINE', daemon=True,
+        args=(args.port_base, line_options(args), stop, results)
+    )
+    process.start()
+    if results.get(timeout=30) != 'ready':
+        logging.error("[BENCH] line failed to start")
+        return 1
+
+    driver_started = process_time()
+    driver = LineDriver(
+        EventLoop(), args.port_base, args.agr_count, args.window, args.rate
+    )
+    runs = []
+    for dialect in args.dialects:
+        run = driver.run(dialect, args.duration)
+        runs.append(run)
+        latency = run['latency_ms']
+        logging.info(
+            f"[BENCH] {dialect}: {run['throughput_codes_s']:,.0f} codes/s, "
+            f"p50 {latency['p50']} ms, p99 {latency['p99']} ms, "
+            f"lost {run['codes_lost']}"
+        )
+    driver_cpu = process_time() - driver_started
+
+    stop.set()
+    line = results.get(timeout=30)
+    process.join()
+    codes = {d['name']: d['count'] for d in line['devices']}
+    devices = {
+        name: {
+            'count': codes.get(name),
+            'cpu_s': round(cpu, 3),
+            'cpu_us_per_code': round(cpu / codes[name] * 1e6, 2)
+            if codes.get(name) else None,
+        }
+        for name, cpu in sorted(line['cpu'].items())
+    }
+    result = {
+        'benchmark': 'line',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            key: value for key, value in vars(args).items()
+            if key != 'output'
+        },
+        'runs': runs,
+        'devices': devices,
+        'emulator_cpu_s': round(line['process_cpu'], 3),
+        'driver_cpu_s': round(driver_cpu, 3),
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    for name, device in devices.items():
+        logging.info(f"[BENCH] {name}: cpu {device['cpu_s']} s "
+                     f"({device['cpu_us_per_code']} us/code)")
+    logging.info(f"[BENCH] results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
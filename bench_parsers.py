@@ -0,0 +1,76 @@
+import argparse
+from time import perf_counter
+
+from framing import Dialect
+from label_parsers import PARSERS, apply_gtin_rules
+
+
+GS = chr(29)
+
+
+def sample_code(n: int, gtin: str = '04603934000793') -> str:
+    return f"01{gtin}21{n:013}{GS}93dGVz"
+
+
+# Задание на одну этикетку в каждом языке: (диалект фрейма, шаблон)
+JOBS = {
+    'tspl': (
+        Dialect.LINE,
+        'SIZE 30 mm,20 mm\r\nCLS\r\n'
+        'DMATRIX 10,10,200,200,"{code}"\r\nPRINT 1\r\n'
+    ),
+    'ezpl': (
+        Dialect.LINE,
+        '^Q20,3\r\n^W30\r\n^L\r\nXRB0,0,4,0,31\r\n{code}\r\nE\r\n'
+    ),
+    'barcode_assign': (
+        Dialect.LINE,
+        'LABEL\r\nBARCODE={code}\r\nEND\r\n'
+    ),
+    'br': (
+        Dialect.LINE,
+        'ERASE\r\nBR,24,24,2,5,250,0,1,{code}\r\nPRINT\r\n'
+    ),
+    'zpl': (
+        Dialect.ZPL,
+        '^XA\n^FO10,10^BXN,5,200,,,,_\n^FH^FD_7e1{code}^FS\n^XZ'
+    ),
+}
+
+
+def bench(name: str, labels: int, gtin: str) -> tuple[int, int, float]:
+    dialect, template = JOBS[name]
+    job = ''.join(
+        template.format(code=sample_code(n, gtin)) for n in range(labels)
+    )
+    rows = job.count('\n') + 1
+    parser = PARSERS[dialect]
+    started = perf_counter()
+    codes, _ = parser.parse(job)
+    for code in codes:
+        apply_gtin_rules(code)
+    elapsed = perf_counter() - started
+    return rows, len(codes), elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Скорость разбора заданий печати по языкам принтеров'
+    )
+    arg_parser.add_argument(
+        '-n', '--labels', type=int, default=100_000,
+        help='Количество этикеток в задании'
+    )
+    arg_parser.add_argument(
+        '-g', '--gtin', default='04603934000793',
+        help='GTIN для генерируемых КМ'
+    )
+    args = arg_parser.parse_args()
+    print(f"{'dialect':<16}{'rows':>10}{'codes':>10}{'rows/s':>14}")
+    for name in JOBS:
+        rows, codes, elapsed = bench(name, args.labels, args.gtin)
+        print(f"{name:<16}{rows:>10}{codes:>10}{rows / elapsed:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+
+EMULATOR = Path(__file__).parent / 'line_emulator.py'
+IMPORT_TIME = re.compile(r'import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)')
+
+
+def run_help(command: list[str]) -> float:
+    started = perf_counter()
+    subprocess.run(
+        [sys.executable, str(EMULATOR), *command, '--help'],
+        stdout=subprocess.DEVNULL, check=True
+    )
+    return perf_counter() - started
+
+
+def run_line(command: list[str], timeout: float) -> tuple[float, float]:
+    # Время от запуска процесса до строки READY (все порты слушают) и от
+    # SIGINT до выхода
+    started = perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(EMULATOR), *command],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    try:
+        for line in process.stdout:
+            if line.startswith('READY'):
+                break
+            if perf_counter() - started > timeout:
+                raise RuntimeError(f"no READY in {timeout:g}s")
+        else:
+            raise RuntimeError(
+                f"emulator exited with {process.wait()} before READY"
+            )
+        ready = perf_counter() - started
+        stopping = perf_counter()
+        process.send_signal(signal.SIGINT)
+        process.communicate(timeout=timeout)
+        return ready, perf_counter() - stopping
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def slowest_imports(command: list[str], count: int) -> list[tuple[int, str]]:
+    # Модули верхнего уровня с наибольшим временем импорта (с вложенными)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', str(EMULATOR), *command,
+         '--help'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        check=True
+    )
+    imports = []
+    for match in IMPORT_TIME.finditer(result.stderr):
+        cumulative, indent, name = match.groups()
+        if not indent:
+            imports.append((int(cumulative), name))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Время запуска эмулятора: до готовности портов, '
+                    'до выхода и импорт модулей'
+    )
+    arg_parser.add_argument(
+        '-n', '--runs', type=int, default=10,
+        help='Количество запусков каждого замера'
+    )
+    arg_parser.add_argument(
+        '-t', '--timeout', type=float, default=30.0,
+        help='Сколько ждать готовности или выхода (сек)'
+    )
+    arg_parser.add_argument(
+        '-i', '--imports', type=int, default=15,
+        help='Сколько самых медленных импортов показать'
+    )
+    arg_parser.add_argument(
+        'command', nargs=argparse.REMAINDER,
+        help='Режим и параметры эмулятора, по умолчанию "s -a 3"'
+    )
+    args = arg_parser.parse_args()
+    command = args.command or ['s', '-a', '3']
+    with tempfile.TemporaryDirectory() as tmp:
+        # Готовность по файлу, чтобы проверить и его
+        ready_file = Path(tmp) / 'ready.json'
+        line_command = [*command, '--ready_file', str(ready_file)]
+        help_runs = [run_help([]) for _ in range(args.runs)]
+        command_help_runs = [
+            run_help(command[:1]) for _ in range(args.runs)
+        ]
+        line_runs = []
+        for _ in range(args.runs):
+            line_runs.append(run_line(line_command, args.timeout))
+            if ready_file.exists():
+                raise RuntimeError(f"{ready_file} left after exit")
+    print(f"{'phase':<24}{'median ms':>12}{'max ms':>12}")
+    phases = (
+        ('--help', help_runs),
+        (f'{command[0]} --help', command_help_runs),
+        ('start to READY', [ready for ready, _ in line_runs]),
+        ('SIGINT to exit', [stop for _, stop in line_runs]),
+    )
+    for name, values in phases:
+        print(f"{name:<24}{median(values) * 1000:>12.1f}"
+              f"{max(values) * 1000:>12.1f}")
+    print(f"\n{'import':<24}{'ms':>12}")
+    for cumulative, name in slowest_imports(command[:1], args.imports):
+        print(f"{name:<24}{cumulative / 1000:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import atexit
+import json
+import logging
+import os
+import struct
+from enum import IntEnum
+from pathlib import Path
+from time import monotonic_ns, time_ns
+from typing import Iterator
+
+from event_loop import EventLoop, get_event_loop
+
+
+# Файл записи: MAGIC, затем записи RECORD + данные. Файл только
+# дописывается; каждый запуск начинается записью SESSION, номера
+# соединений уникальны в пределах сессии
+MAGIC = b'PLECAP1\n'
+RECORD = struct.Struct('<qIBI')
+FLUSH_INTERVAL = 1.0
+WRITE_BUFFER = 1 << 20
+
+
+class Record(IntEnum):
+    SESSION = 0
+    # Подключение клиента: данные - JSON с устройством, портом и адресом
+    OPEN = 1
+    # Байты от MES к устройству
+    RX = 2
+    # Байты от устройства к MES
+    TX = 3
+    CLOSE = 4
+
+
+class CaptureWriter:
+    # Запись трафика всех устройств процесса. Вызывается из цикла
+    # событий: записи копятся в буфере файла и сбрасываются на диск раз
+    # в FLUSH_INTERVAL
+    def __init__(self, path: Path, loop: EventLoop | None = None):
+        self.path = path
+        self.loop = loop or get_event_loop()
+        self.file = open(path, 'ab', buffering=WRITE_BUFFER)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.origin = monotonic_ns()
+        self.next_id = 1
+        self._write(Record.SESSION, 0, json.dumps(
+            {'started': time_ns(), 'pid': os.getpid()}
+        ).encode())
+        self.timer = self.loop.call_later(FLUSH_INTERVAL, self._flush_tick)
+
+    def _write(self, kind: Record, conn: int, data: bytes = b''):
+        self.file.write(
+            RECORD.pack(monotonic_ns() - self.origin, conn, kind, len(data))
+        )
+        if data:
+            self.file.write(data)
+
+    def open(self, device: str, port: int, peer) -> int:
+        conn = self.next_id
+        self.next_id += 1
+        self._write(Record.OPEN, conn, json.dumps(
+            {'device': device, 'port': port, 'peer': str(peer)}
+        ).encode())
+        return conn
+
+    def rx(self, conn: int, data: bytes):
+        self._write(Record.RX, conn, data)
+
+    def tx(self, conn: int, data: bytes):
+        self._write(Record.TX, conn, data)
+
+    def close(self, conn: int):
+        self._write(Record.CLOSE, conn)
+
+    def _flush_tick(self):
+        self.file.flush()
+        self.timer = self.loop.call_later(FLUSH_INTERVAL, self._flush_tick)
+
+    def stop(self):
+        self.timer.cancel()
+        self.file.close()
+
+
+class Connection:
+    def __init__(self, conn: int, device: str, port: int, peer: str,
+                 opened: int):
+        self.conn = conn
+        self.device = device
+        self.port = port
+        self.peer = peer
+        self.opened = opened
+        self.closed: int | None = None
+        # (время, Record.RX/TX, данные)
+        self.chunks: list[tuple[int, Record, bytes]] = []
+
+    def size(self, kind: Record) -> int:
+        return sum(len(data) for _, k, data in self.chunks if k is kind)
+
+
+class Session:
+    def __init__(self, started: int, pid: int):
+        self.started = started
+        self.pid = pid
+        self.connections: dict[int, Connection] = {}
+
+
+def read_records(path: Path) -> Iterator[tuple[int, int, Record, bytes]]:
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a capture file")
+        while 1:
+            header = f.read(RECORD.size)
+            if not header:
+                return
+            if len(header) < RECORD.size:
+                logging.warning(f"{path}: truncated record at the end")
+                return
+            ts, conn, kind, length = RECORD.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                logging.warning(f"{path}: truncated record at the end")
+                return
+            yield ts, conn, Record(kind), data
+
+
+def load_sessions(path: Path) -> list[Session]:
+    sessions: list[Session] = []
+    session = None
+    for ts, conn, kind, data in read_records(path):
+        if kind is Record.SESSION:
+            info = json.loads(data)
+            session = Session(info['started'], info['pid'])
+            sessions.append(session)
+            continue
+        if session is None:
+            raise ValueError(f"{path}: record before the first session")
+        if kind is Record.OPEN:
+            info = json.loads(data)
+            session.connections[conn] = Connection(
+                conn, info['device'], info['port'], info['peer'], ts
+            )
+            continue
+        connection = session.connections.get(conn)
+        if connection is None:
+            continue
+        if kind is Record.CLOSE:
+            connection.closed = ts
+        else:
+            connection.chunks.append((ts, kind, data))
+    return sessions
+
+
+_writer: CaptureWriter | None = None
+
+
+def configure(path: Path | None):
+    # Вызывается до создания устройств, как eventlog.configure
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+    if path is not None:
+        _writer = CaptureWriter(path)
+        atexit.register(_writer.stop)
+
+
+def writer() -> CaptureWriter | None:
+    return _writer
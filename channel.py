@@ -0,0 +1,146 @@
+import logging
+from enum import Enum
+from typing import Callable, Iterable, Iterator
+
+
+CHANNEL_SIZE = 10000
+
+
+class Overflow(Enum):
+    # block - производитель не отдает код, пока не освободится место
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+
+
+class Channel:
+    # Кольцевой буфер фиксированного размера для передачи КМ между
+    # устройствами линии. Все устройства работают в одном цикле событий,
+    # поэтому блокировки не нужны. Подписчики on_data вызываются, когда
+    # в пустом канале появляется код, on_space - когда в полном
+    # освобождается место, on_drop - с кодом, потерянным при переполнении
+    def __init__(self, name: str, capacity: int = CHANNEL_SIZE,
+                 overflow: Overflow = Overflow.BLOCK):
+        if capacity < 1:
+            raise ValueError(f"{name}: capacity must be positive")
+        self.name = name
+        self.capacity = capacity
+        self.overflow = overflow
+        self._items: list = [None] * capacity
+        self._head = 0
+        self._size = 0
+        self.high_water = 0
+        self.dropped = 0
+        self.total_in = 0
+        self.total_out = 0
+        self._data_listeners: list[Callable[[], None]] = []
+        self._space_listeners: list[Callable[[], None]] = []
+        self._drop_listeners: list[Callable[[object], None]] = []
+        self._full_reported = False
+        # Этап журнала (wal.Stage), если линия журналируется
+        self.journal = None
+
+    def on_data(self, callback: Callable[[], None]):
+        self._data_listeners.append(callback)
+
+    def on_space(self, callback: Callable[[], None]):
+        self._space_listeners.append(callback)
+
+    def on_drop(self, callback: Callable[[object], None]):
+        self._drop_listeners.append(callback)
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self) -> Iterator:
+        items = self._items
+        for n in range(self._size):
+            yield items[(self._head + n) % self.capacity]
+
+    def full(self) -> bool:
+        return self._size >= self.capacity
+
+    def writable(self) -> bool:
+        return (
+            self._size < self.capacity or
+            self.overflow is not Overflow.BLOCK
+        )
+
+    def append(self, item) -> bool:
+        # False - канал полон и переполнение BLOCK: код остается у
+        # производителя
+        if self._size >= self.capacity:
+            if not self._full_reported:
+                self._full_reported = True
+                logging.warning(
+                    f"<{self.name}> BUFFER FULL: {self.capacity} "
+                    f"({self.overflow.value})"
+                )
+            if self.overflow is Overflow.BLOCK:
+                return False
+            self.dropped += 1
+            if self.overflow is Overflow.DROP_NEWEST:
+                for callback in self._drop_listeners:
+                    callback(item)
+                return True
+            for callback in self._drop_listeners:
+                callback(self._items[self._head])
+            if self.journal is not None:
+                self.journal.drop()
+            self._items[self._head] = None
+            self._head = (self._head + 1) % self.capacity
+            self._size -= 1
+        self._items[(self._head + self._size) % self.capacity] = item
+        self._size += 1
+        if self.journal is not None:
+            self.journal.push(item)
+        self.total_in += 1
+        if self._size > self.high_water:
+            self.high_water = self._size
+        if self._size == 1:
+            for callback in self._data_listeners:
+                callback()
+        return True
+
+    def extend(self, items: Iterable) -> int:
+        accepted = 0
+        for item in items:
+            if not self.append(item):
+                break
+            accepted += 1
+        return accepted
+
+    def popleft(self):
+        if not self._size:
+            raise IndexError(f'pop from an empty channel {self.name}')
+        was_full = self._size >= self.capacity
+        item = self._items[self._head]
+        self._items[self._head] = None
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+        self.total_out += 1
+        if was_full:
+            self._full_reported = False
+            for callback in self._space_listeners:
+                callback()
+        return item
+
+    def snapshot(self) -> list:
+        # Содержимое от головы к хвосту срезами кольца, без обхода
+        end = self._head + self._size
+        if end <= self.capacity:
+            return self._items[self._head:end]
+        return self._items[self._head:] + self._items[:end - self.capacity]
+
+    def stats(self) -> dict:
+        return {
+            'depth': self._size,
+            'capacity': self.capacity,
+            'high_water': self.high_water,
+            'dropped': self.dropped,
+            'total_in': self.total_in,
+            'total_out': self.total_out,
+        }
@@ -0,0 +1,261 @@
+import logging
+import math
+from array import array
+from enum import Enum
+
+from metrics import REGISTRY
+
+
+# Сколько КМ ожидается за смену по умолчанию: под это число выделяется
+# таблица (и растет при заполнении) или рассчитывается фильтр Блума
+INDEX_CAPACITY = 1000000
+# Доля занятых слотов таблицы, после которой она удваивается
+MAX_LOAD = 0.7
+# Фильтр Блума: бит памяти на пару (КМ, этап). Пара отмечает 8 бит
+# своего слова - около 0.2% ложных повторов при заполнении
+BLOOM_BITS = 16
+# Сколько КМ-повторов сохраняется для отчета
+SAMPLES = 10
+
+KEY_MASK = (1 << 64) - 1
+
+# Этапы пути КМ - биты флагов в индексе
+PRINTED = 1
+SENT = 2
+DROPPED = 4
+AGGREGATED = 8
+STAGES = {
+    PRINTED: 'printed', SENT: 'sent', DROPPED: 'dropped',
+    AGGREGATED: 'aggregated',
+}
+# 12 бит ключа -> маска из двух бит 64-битного слова
+PAIR_MASKS = [1 << (n & 63) | 1 << (n >> 6) for n in range(4096)]
+BLOOM_SALTS = {
+    PRINTED: 0x9E3779B97F4A7C15, SENT: 0xC2B2AE3D27D4EB4F,
+    DROPPED: 0x165667B19E3779F9, AGGREGATED: 0xD6E8FEB86659FD93,
+}
+
+INDEX_CODES = REGISTRY.gauge(
+    'emulator_index_codes',
+    'КМ в индексе уникальности по этапам, повторам и неотправленным',
+    ('state',)
+)
+INDEX_BYTES = REGISTRY.gauge(
+    'emulator_index_bytes', 'Память индекса уникальности'
+)
+
+
+class IndexMode(Enum):
+    OFF = 'off'
+    # Точный индекс: 8 байт хэша и байт флагов на слот
+    HASH = 'hash'
+    # Фильтр Блума: 16 бит на КМ и этап, повторы с вероятностью ошибки
+    BLOOM = 'bloom'
+
+
+def code_key(code: str) -> int:
+    # 64-битный хэш строки (в пределах процесса, str кеширует его);
+    # 0 означает пустой слот
+    return hash(code) & KEY_MASK or 1
+
+
+class HashTable:
+    # Открытая адресация с линейным пробированием в массиве 64-битных
+    # ключей; флаги этапов - в параллельном bytearray. Вместо строк КМ
+    # хранятся только хэши: 9 байт на слот
+    def __init__(self, capacity: int = INDEX_CAPACITY):
+        size = 1 << max(4, math.ceil(math.log2(capacity / MAX_LOAD)))
+        self._allocate(size)
+
+    def _allocate(self, size: int):
+        self.mask = size - 1
+        self.keys = array('Q', bytes(8 * size))
+        self.flags = bytearray(size)
+        self.count = 0
+        self.limit = int(size * MAX_LOAD)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.keys) * 9
+
+    def _slot(self, key: int) -> int:
+        keys = self.keys
+        mask = self.mask
+        i = key & mask
+        while True:
+            k = keys[i]
+            if k == key or not k:
+                return i
+            i = (i + 1) & mask
+
+    def add(self, key: int, flag: int) -> int:
+        # Отмечает этап, возвращает флаги КМ до отметки. Поиск слота
+        # повторяет _slot: add вызывается на каждом КМ
+        keys = self.keys
+        mask = self.mask
+        i = key & mask
+        while True:
+            k = keys[i]
+            if k == key or not k:
+                break
+            i = (i + 1) & mask
+        before = self.flags[i]
+        if not before:
+            if self.count >= self.limit:
+                self._grow()
+                i = self._slot(key)
+            self.keys[i] = key
+            self.count += 1
+        self.flags[i] = before | flag
+        return before
+
+    def get(self, key: int) -> int:
+        return self.flags[self._slot(key)]
+
+    def _grow(self):
+        keys, flags = self.keys, self.flags
+        self._allocate(len(keys) * 2)
+        logging.info(f"<INDEX> grown to {len(self.keys)} slots")
+        for key, flag in zip(keys, flags):
+            if flag:
+                i = self._slot(key)
+                self.keys[i] = key
+                self.flags[i] = flag
+                self.count += 1
+
+
+class BloomFilter:
+    # Блочный фильтр Блума над парами (КМ, этап): все биты ключа лежат в
+    # одном 64-битном слове, проверка и отметка - одно чтение и запись
+    # массива. Память не зависит от длины КМ, но повторы считаются с
+    # вероятностью ложного срабатывания
+    def __init__(self, capacity: int = INDEX_CAPACITY):
+        # Печать и до двух этапов после нее (отправка или пропуск,
+        # агрегация)
+        items = 3 * capacity
+        self.size = max(1, items * BLOOM_BITS // 64)
+        self.words = array('Q', bytes(8 * self.size))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.words) * 8
+
+    def _word(self, key: int, flag: int) -> tuple[int, int]:
+        # Слово и 8 бит в нем из старших 48 бит ключа, перемешанного
+        # своим для этапа нечетным множителем: по 12 бит на два бита слова
+        key = (key * BLOOM_SALTS[flag]) & KEY_MASK
+        return key % self.size, (
+            PAIR_MASKS[key >> 52] | PAIR_MASKS[(key >> 40) & 0xFFF] |
+            PAIR_MASKS[(key >> 28) & 0xFFF] | PAIR_MASKS[(key >> 16) & 0xFFF]
+        )
+
+    def _test(self, key: int, flag: int) -> bool:
+        i, mask = self._word(key, flag)
+        return self.words[i] & mask == mask
+
+    def add(self, key: int, flag: int) -> int:
+        # Известны только запрошенный этап и печать - этого хватает для
+        # повторов и неотправленных КМ
+        i, mask = self._word(key, flag)
+        word = self.words[i]
+        if word & mask == mask:
+            before = flag
+        else:
+            before = 0
+            self.words[i] = word | mask
+        if flag != PRINTED and self._test(key, PRINTED):
+            before |= PRINTED
+        return before
+
+    def get(self, key: int) -> int:
+        return sum(flag for flag in STAGES if self._test(key, flag))
+
+
+class CodeIndex:
+    # Все КМ линии: напечатанные, отправленные, пропущенные камерой
+    # (drop_dm) и агрегированные. Считает повторы печати и отправки и
+    # напечатанные, но ни разу не отправленные КМ (пропущенные камерой и
+    # еще не дошедшие до нее); счетчики видны в /metrics, отчет - при
+    # остановке
+    def __init__(self, mode: IndexMode = IndexMode.HASH,
+                 capacity: int = INDEX_CAPACITY):
+        self.mode = mode
+        self.table = (
+            BloomFilter(capacity) if mode is IndexMode.BLOOM
+            else HashTable(capacity)
+        )
+        self.counts = {
+            'printed': 0, 'sent': 0, 'dropped': 0, 'aggregated': 0,
+            'duplicate_printed': 0, 'duplicate_sent': 0,
+            'duplicate_aggregated': 0, 'unsent': 0,
+        }
+        self.samples: list[tuple[str, str]] = []
+        for state in self.counts:
+            INDEX_CODES.labels(state).set_function(
+                lambda s=state: self.counts[s]
+            )
+        INDEX_BYTES.labels().set_function(lambda: self.table.nbytes)
+        logging.info(f"<INDEX> {mode.value}: {self.table.nbytes} bytes "
+                     f"for {capacity} codes")
+
+    def _duplicate(self, code: str, state: str):
+        self.counts[f'duplicate_{state}'] += 1
+        if len(self.samples) < SAMPLES:
+            self.samples.append((state, code))
+        logging.debug("<INDEX> DUPLICATE %s: %s", state, code)
+
+    def printed(self, code: str):
+        before = self.table.add(code_key(code), PRINTED)
+        if before & PRINTED:
+            self._duplicate(code, 'printed')
+            return
+        self.counts['printed'] += 1
+        if not before & SENT:
+            self.counts['unsent'] += 1
+
+    def sent(self, code: str):
+        before = self.table.add(code_key(code), SENT)
+        if before & SENT:
+            self._duplicate(code, 'sent')
+            return
+        self.counts['sent'] += 1
+        if before & PRINTED:
+            self.counts['unsent'] -= 1
+
+    def dropped(self, code: str):
+        before = self.table.add(code_key(code), DROPPED)
+        if not before & DROPPED:
+            self.counts['dropped'] += 1
+
+    def aggregated(self, code: str):
+        before = self.table.add(code_key(code), AGGREGATED)
+        if before & AGGREGATED:
+            self._duplicate(code, 'aggregated')
+            return
+        self.counts['aggregated'] += 1
+
+    def state(self, code: str) -> list[str]:
+        # Этапы, которые прошел КМ (для BLOOM - с вероятностью ошибки)
+        flags = self.table.get(code_key(code))
+        return [name for flag, name in STAGES.items() if flags & flag]
+
+    def report(self):
+        counts = ', '.join(f"{state} {n}" for state, n in self.counts.items())
+        logging.info(f"<INDEX> {self.mode.value}, "
+                     f"{self.table.nbytes} bytes: {counts}")
+        for state, code in self.samples:
+            logging.info(f"<INDEX> DUPLICATE {state}: {code!r}")
+
+
+_index: CodeIndex | None = None
+
+
+def configure(mode: IndexMode = IndexMode.OFF,
+              capacity: int = INDEX_CAPACITY):
+    # Вызывается до создания устройств, как tracing.configure
+    global _index
+    _index = None if mode is IndexMode.OFF else CodeIndex(mode, capacity)
+
+
+def index() -> CodeIndex | None:
+    return _index
@@ -0,0 +1,97 @@
+import mmap
+import os
+from collections import deque
+from pathlib import Path
+
+
+READ_AHEAD = 1024
+
+
+class MmapCodeSource:
+    # Ленивый источник КМ из файла: строки читаются из отображенного в
+    # память файла по мере надобности, в памяти держится не более
+    # read_ahead кодов. Поддерживает deque-интерфейс, который использует
+    # TcpExchanger (popleft, len, bool)
+    def __init__(self, path: Path, offset: int = 0,
+                 read_ahead: int = READ_AHEAD, encoding: str = 'utf-8'):
+        self.path = path
+        self.encoding = encoding
+        self.read_ahead = read_ahead
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mm = (
+            mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.size else None
+        )
+        self.start_offset = min(offset, self.size)
+        self.read_pos = self.start_offset
+        # Смещение следующего не выданного кода - с него можно продолжить
+        self.position = self.start_offset
+        self.lines_read = 0
+        self.buffer: deque[tuple[str, int]] = deque()
+
+    def _fill(self):
+        mm = self.mm
+        end = self.size
+        pos = self.read_pos
+        buffer = self.buffer
+        while len(buffer) < self.read_ahead and pos < end:
+            nl = mm.find(b'\n', pos)
+            if nl < 0:
+                nl = end
+            line = mm[pos:nl].strip()
+            pos = nl + 1
+            self.lines_read += 1
+            if line:
+                buffer.append((line.decode(self.encoding), min(pos, end)))
+        self.read_pos = min(pos, end)
+
+    def seek(self, offset: int):
+        # Продолжить с позиции (байт), например сохраненной в журнале
+        self.start_offset = self.read_pos = self.position = min(
+            offset, self.size
+        )
+        self.lines_read = 0
+        self.buffer.clear()
+
+    def popleft(self) -> str:
+        if not self.buffer:
+            self._fill()
+            if not self.buffer:
+                raise IndexError('pop from an empty code source')
+        code, self.position = self.buffer.popleft()
+        return code
+
+    def batch(self, count: int) -> list[str]:
+        # До count кодов подряд; меньше - если файл закончился
+        codes = []
+        buffer = self.buffer
+        while len(codes) < count:
+            if not buffer:
+                self._fill()
+                if not buffer:
+                    break
+            take = min(count - len(codes), len(buffer))
+            for _ in range(take):
+                code, self.position = buffer.popleft()
+                codes.append(code)
+        return codes
+
+    def __bool__(self):
+        if not self.buffer:
+            self._fill()
+        return bool(self.buffer)
+
+    def __len__(self):
+        # Оставшееся число кодов оценивается по средней длине строки
+        if not self.buffer:
+            self._fill()
+        if not self.lines_read:
+            return 0
+        avg = (self.read_pos - self.start_offset) / self.lines_read
+        return len(self.buffer) + int((self.size - self.read_pos) / avg)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.file.close()
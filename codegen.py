@@ -0,0 +1,137 @@
+import random
+from base64 import b64encode
+from pathlib import Path
+from typing import Iterator
+
+from label_parsers import GS, GTIN_AI_RULES
+
+
+# GTIN по умолчанию: два из них с весовыми AI из GTIN_AI_RULES
+GTINS = ('04603934000793', '05060367340398', '07808631857726')
+SERIAL_LENGTH = 13
+BATCH = 10000
+
+
+# Криптохвост КМ после GS -> число случайных символов в нем:
+# full - 91 ключ проверки (4) и 92 код проверки (44), большинство товарных
+# групп; short - 93 код проверки (4), табак. Символы берутся из base64 -
+# они входят в набор символов GS1
+TAILS = {'full': 48, 'short': 4}
+
+
+def gtin_check_digit(body: str) -> str:
+    # Контрольная цифра GS1 (mod 10): веса 3 и 1 справа налево
+    total = sum(
+        int(digit) * (3 if n % 2 == 0 else 1)
+        for n, digit in enumerate(reversed(body))
+    )
+    return str(-total % 10)
+
+
+def normalize_gtin(gtin: str) -> str:
+    # GTIN-14 с проверкой контрольной цифры; GTIN-8/12/13 без нее
+    # дополняются нулями и контрольной цифрой
+    if not gtin.isdigit() or not 7 <= len(gtin) <= 14:
+        raise ValueError(f"GTIN must be 7 to 14 digits, got {gtin!r}")
+    if len(gtin) == 14:
+        if gtin_check_digit(gtin[:13]) != gtin[13]:
+            raise ValueError(f"GTIN {gtin}: wrong check digit, expected "
+                             f"{gtin_check_digit(gtin[:13])}")
+        return gtin
+    body = gtin.zfill(13)
+    return body + gtin_check_digit(body)
+
+
+class CodeGenerator:
+    # Синтетические КМ GS1 DataMatrix:
+    # 01 GTIN 21 серийный номер GS криптохвост [GS AI значение].
+    # Серийные номера идут подряд с start, поэтому КМ не повторяются;
+    # GTIN из пула, криптохвост и веса случайны и повторяются при том же
+    # зерне. Коды выдаются пачками: случайные байты всей пачки берутся
+    # одним вызовом и кодируются одним b64encode
+    def __init__(self, gtins: list[str] | tuple[str, ...] = GTINS,
+                 seed: int | str | None = None, start: int = 0,
+                 serial_length: int = SERIAL_LENGTH, tail: str = 'full',
+                 weights: bool = True):
+        if not gtins:
+            raise ValueError("GTIN pool is empty")
+        if tail not in TAILS:
+            raise ValueError(f"tail must be one of {list(TAILS)}, "
+                             f"got {tail!r}")
+        if start < 0:
+            raise ValueError(f"start must not be negative, got {start}")
+        self.gtins = [normalize_gtin(gtin) for gtin in gtins]
+        self.rng = random.Random(seed)
+        self.serial = start
+        self.serial_length = serial_length
+        self.serial_limit = 10 ** serial_length
+        self.tail = tail
+        self.prefixes = [f"01{gtin}21" for gtin in self.gtins]
+        # Индекс GTIN в пуле -> (AI, минимум, максимум)
+        self.rules = {
+            n: GTIN_AI_RULES[gtin] for n, gtin in enumerate(self.gtins)
+            if weights and gtin in GTIN_AI_RULES
+        }
+
+    def batch(self, count: int) -> list[str]:
+        rng = self.rng
+        start = self.serial
+        if start + count > self.serial_limit:
+            raise ValueError(f"serial numbers of {self.serial_length} "
+                             f"digits are exhausted at {start}")
+        self.serial = start + count
+        if len(self.prefixes) == 1:
+            chosen = [0] * count
+        else:
+            chosen = rng.choices(range(len(self.prefixes)), k=count)
+        step = TAILS[self.tail]
+        # 3 случайных байта - 4 символа base64
+        blob = b64encode(rng.randbytes((count * step * 3 + 3) // 4))
+        chars = blob.decode('ascii')
+        prefixes = self.prefixes
+        width = self.serial_length
+        if self.tail == 'full':
+            codes = [
+                f"{prefixes[g]}{serial:0{width}}{GS}91{chars[at:at + 4]}"
+                f"{GS}92{chars[at + 4:at + 48]}"
+                for g, serial, at in zip(
+                    chosen, range(start, start + count),
+                    range(0, count * step, step)
+                )
+            ]
+        else:
+            codes = [
+                f"{prefixes[g]}{serial:0{width}}{GS}93{chars[at:at + 4]}"
+                for g, serial, at in zip(
+                    chosen, range(start, start + count),
+                    range(0, count * step, step)
+                )
+            ]
+        if self.rules:
+            rules = self.rules
+            randint = rng.randint
+            for n, g in enumerate(chosen):
+                rule = rules.get(g)
+                if rule is not None:
+                    ai, low, high = rule
+                    codes[n] += f"{GS}{ai}{randint(low, high):06}"
+        return codes
+
+    def batches(self, count: int, size: int = BATCH) -> Iterator[list[str]]:
+        while count > 0:
+            codes = self.batch(min(size, count))
+            count -= len(codes)
+            yield codes
+
+
+def write_corpus(path: Path, generator: CodeGenerator, count: int,
+                 batch: int = BATCH) -> int:
+    # Файл в формате dm.csv: по КМ в строке. Подходит для -f 1,
+    # отбраковки и принтеров/камер с file в описании линии
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for codes in generator.batches(count, batch):
+            f.write('\n'.join(codes))
+            f.write('\n')
+            written += len(codes)
+    return written
@@ -0,0 +1,1259 @@
+import sys
+import socket
+from enum import Enum
+from time import monotonic, perf_counter
+from collections import deque
+from functools import partial
+from pathlib import Path
+import logging
+
+from event_loop import EventLoop, Timer, get_event_loop, listen_socket
+from framing import Dialect, FrameReader
+from label_parsers import PARSERS, apply_gtin_rules
+from pacing import PaceMode, Pacer
+from code_source import READ_AHEAD, MmapCodeSource
+from channel import CHANNEL_SIZE, Channel, Overflow
+from aggregation import (
+    SEPARATOR_BYTES, STACK_SEPARATOR, BoxRouter, StackBuffer
+)
+from codegen import CodeGenerator
+from metrics import (
+    BUFFER_DEPTH, CLIENTS, CODES_DROPPED, CODES_SENT, ERRORS_INJECTED,
+    LABELS_PARSED, PARSE_SECONDS, SEND_SECONDS, MetricsServer
+)
+from eventlog import DeviceLog
+import faults
+import capture
+import code_index
+import schedules
+import tracing
+import wal
+from code_index import IndexMode
+from faults import (
+    CodeQuality, Fault, FaultInjector, FaultProfile, device_rng
+)
+from schedules import LoadProfile
+
+
+PAUSE = 0.05
+FLUSH_TIMEOUT = 0.2
+READS_PER_EVENT = 64
+SEND_QUEUE = 1000
+FILE_PRINT_INTERVAL = 0.02
+# Сколько буферов (iovec) передается одним sendmsg: не больше IOV_MAX
+IOV_BATCH = 1024
+# КМ в коробе камеры агрегации по умолчанию
+AGR_STACK = 6
+# Камеры агрегации слушают порты 27..31, порт 32 занят VERIF
+MAX_AGR_COUNT = 5
+# Готовые хвосты КМ в сообщении камеры: КМ и хвост уходят отдельными
+# буферами sendmsg, сообщение не склеивается
+QUALITY_SUFFIXES = {
+    grade.value: f"@{grade.value}{STACK_SEPARATOR}".encode()
+    for grade in CodeQuality
+}
+
+# Все устройства, созданные в процессе: для статистики парка линий
+DEVICES: list = []
+
+
+class PrinterClient:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.reader = FrameReader()
+        self.tx = bytearray()
+        self.print_buffer: deque[str] = deque([])
+        # Данные КМ EZPL (XRB) идут следующей строкой и могут
+        # оказаться в следующем фрейме
+        self.code_on_next_row = False
+        self.flush_timer: Timer | None = None
+        self.last_rx = 0.0
+        self.capture_id = 0
+        # Очередь печати в журнале (wal.Stage)
+        self.stage = None
+
+
+class PrinterEmul:
+    def __init__(self, name: str, dm_list: Channel, port: int,
+                 loop: EventLoop | None = None, traced: bool = True):
+        self.SIZE = 4096
+        self.name = name
+        self.FORMAT = "utf-8"
+        self.loop = loop or get_event_loop()
+        self.port = port
+        self.server = listen_socket("", port)
+        self.dm_list = dm_list
+        self.connections: dict[socket.socket, PrinterClient] = {}
+        self.i = 1
+        self.log = DeviceLog(name)
+        # Вес/объем для GTIN_AI_RULES повторяются при том же зерне
+        self.rng = device_rng(name, 'gtin')
+        self.capture = capture.writer()
+        # Этикетки паллетных принтеров никто не читает: их не трассируем
+        # и не учитываем в индексе уникальности
+        self.tracer = tracing.tracer() if traced else None
+        self.index = code_index.index() if traced else None
+        self.journal = wal.journal() if traced else None
+        if self.journal:
+            # Очереди клиентов, отключившихся при сбое, допечатываются в
+            # буфер, как при обычном отключении
+            self.journal.fallback(
+                name, partial(self.journal.restore_channel, dm_list)
+            )
+        self.clients_seen = 0
+        self.printed_point = f"{name}:printed"
+        self.buffered_point = f"{name}:buffered"
+        self.labels_parsed = LABELS_PARSED.labels(name)
+        self.parse_seconds = PARSE_SECONDS.labels(name)
+        BUFFER_DEPTH.labels(name).set_function(self.buffered)
+        CLIENTS.labels(name).set_function(lambda: len(self.connections))
+        DEVICES.append(self)
+
+    def buffered(self) -> int:
+        return sum(len(c.print_buffer) for c in self.connections.values())
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'port': self.port,
+            'count': self.i - 1,
+            'clients': len(self.connections),
+            'buffered': self.buffered(),
+        }
+
+    def start(self):
+        self.loop.add_reader(self.server, self.run_login)
+
+    def run_login(self):
+        while 1:
+            try:
+                connected_client, address = self.server.accept()
+            except BlockingIOError:
+                return
+            connected_client.setblocking(False)
+            connected_client.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+            )
+            client = PrinterClient(connected_client)
+            self.clients_seen += 1
+            if self.journal:
+                client.stage = self.journal.stage(
+                    f"{self.name}#{self.clients_seen}",
+                    partial(list, client.print_buffer)
+                )
+            if self.capture:
+                client.capture_id = self.capture.open(
+                    self.name, self.port, address
+                )
+            self.connections[connected_client] = client
+            self.loop.add_reader(
+                connected_client, partial(self.receive, client)
+            )
+
+    def disconnect(self, client: PrinterClient):
+        if client.flush_timer is not None:
+            client.flush_timer.cancel()
+        if self.capture and client.sock in self.connections:
+            self.capture.close(client.capture_id)
+        if client.stage is not None:
+            self.journal.remove(client.stage)
+            client.stage = None
+        self.loop.forget(client.sock)
+        self.connections.pop(client.sock, None)
+        client.sock.close()
+
+    def receive(self, client: PrinterClient):
+        eof = False
+        try:
+            for _ in range(READS_PER_EVENT):
+                n = client.reader.recv_into(client.sock)
+                if not n:
+                    eof = True
+                    break
+                if self.capture:
+                    end = client.reader.end
+                    self.capture.rx(
+                        client.capture_id, client.reader.buf[end - n:end]
+                    )
+                if n < self.SIZE:
+                    break
+        except BlockingIOError:
+            pass
+        except Exception as e:
+            logging.error(f"<{self.name}> ERROR: {client.sock} {e}")
+            self.disconnect(client)
+            return
+        client.last_rx = monotonic()
+        self.process(client, eof)
+        if client.sock not in self.connections:
+            return
+        if eof:
+            # Клиент отключился: допечатываем оставшиеся в очереди этикетки
+            printed = self.dm_list.extend(client.print_buffer)
+            if printed < len(client.print_buffer):
+                logging.warning(
+                    f"<{self.name}> LOST: "
+                    f"{len(client.print_buffer) - printed} labels"
+                )
+            if self.tracer:
+                for n, code in enumerate(client.print_buffer):
+                    if n < printed:
+                        self.tracer.stamp(code, self.buffered_point)
+                    else:
+                        self.tracer.lost(code, f"{self.name}:disconnect")
+            self.disconnect(client)
+        elif client.reader and client.flush_timer is None:
+            # Хвост без завершающего символа отдаем, если клиент замолчал
+            client.flush_timer = self.loop.call_later(
+                FLUSH_TIMEOUT, self.flush_pending, client
+            )
+
+    def flush_pending(self, client: PrinterClient):
+        client.flush_timer = None
+        if client.sock not in self.connections:
+            return
+        idle = monotonic() - client.last_rx
+        if idle < FLUSH_TIMEOUT:
+            client.flush_timer = self.loop.call_later(
+                FLUSH_TIMEOUT - idle, self.flush_pending, client
+            )
+            return
+        self.process(client, final=True)
+
+    def send(self, client: PrinterClient, data: bytes):
+        if self.capture:
+            self.capture.tx(client.capture_id, data)
+        if not client.tx:
+            try:
+                sent = client.sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError as e:
+                logging.error(f"<{self.name}> ERROR: {client.sock} {e}")
+                self.disconnect(client)
+                return
+            if sent == len(data):
+                return
+            data = data[sent:]
+            self.loop.add_writer(client.sock, partial(self.flush, client))
+        client.tx += data
+
+    def flush(self, client: PrinterClient):
+        try:
+            sent = client.sock.send(client.tx)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logging.error(f"<{self.name}> ERROR: {client.sock} {e}")
+            self.disconnect(client)
+            return
+        del client.tx[:sent]
+        if not client.tx:
+            self.loop.remove_writer(client.sock)
+
+    def process(self, client: PrinterClient, final: bool = False):
+        for _, dialect, msg_received in client.reader.frames(final):
+            self.run(client, msg_received, dialect)
+            if client.sock not in self.connections:
+                # Ответ не ушел и клиент отключен: остаток не разбираем
+                return
+
+    def run(self, client: PrinterClient, msg_received: str,
+            dialect: Dialect = Dialect.LINE):
+        print_buffer = client.print_buffer
+        i = self.i
+        if print_buffer and self.dm_list.writable():
+            try:
+                new_code = print_buffer.popleft()
+                self.dm_list.append(new_code)
+                if client.stage is not None:
+                    client.stage.pop()
+                if self.tracer:
+                    self.tracer.stamp(new_code, self.buffered_point)
+                self.log.debug(
+                    "[#%d] <%s> BUFFER_SIZE: %d SENT TO CAM: %s",
+                    i, self.name, len(print_buffer), new_code
+                )
+            except IndexError:
+                pass
+        if not msg_received:
+            return
+        self.log.debug("[#%d] <%s> %s", i, self.name, msg_received)
+        if msg_received == f"{chr(27)}!?":
+            # logging.debug(f"<{self.name}> СТАТУС: Нормально")
+            self.send(client, b'\x00')
+        elif msg_received == "~S,CHECK":
+            self.send(client, b'00')
+        elif msg_received == "OUT @LABEL":
+            self.send(client, f"{i}".encode())
+        elif msg_received == "~HS":
+            # logging.debug(f"<{self.name}> БУФФЕР: {len(print_buffer)}")
+            self.send(client, f"0,0,0,0,{len(print_buffer)}".encode())
+        elif msg_received == "~S,LABEL":
+            self.send(client, f"{len(print_buffer)}".encode())
+        else:
+            # logging.debug(f"<{self.name}> MSG: {msg_received}")
+            started = perf_counter()
+            codes, client.code_on_next_row = PARSERS[dialect].parse(
+                msg_received, client.code_on_next_row
+            )
+            self.parse_seconds.observe(perf_counter() - started)
+            self.labels_parsed.inc(len(codes))
+            for dm_extracted in codes:
+                dm_extracted = apply_gtin_rules(dm_extracted, self.rng)
+                if self.tracer:
+                    self.tracer.stamp(dm_extracted, self.printed_point)
+                if self.index:
+                    self.index.printed(dm_extracted)
+                self.log.event('PRINTED', dm_extracted,
+                               "[#%d] <%s> PRINTED: %s",
+                               i, self.name, dm_extracted)
+                print_buffer.append(dm_extracted)
+                if client.stage is not None:
+                    client.stage.push(dm_extracted)
+                i += 1
+        self.i = i
+
+
+class FilePrinterEmul:
+    def __init__(self, name, dm_list: Channel, dm_file_path: Path,
+                 interval: float = FILE_PRINT_INTERVAL, offset: int = 0,
+                 read_ahead: int = READ_AHEAD,
+                 load_profile: LoadProfile | None = None,
+                 loop: EventLoop | None = None):
+        self.name = name
+        # Порта нет: КМ берутся из файла
+        self.port = None
+        self.dm_list = dm_list
+        self.dm_file_path = dm_file_path
+        self.loop = loop or get_event_loop()
+        self.source = MmapCodeSource(dm_file_path, offset, read_ahead)
+        self.read_ahead = read_ahead
+        self.printed = 0
+        self.pacer = Pacer(self.loop, self.name, interval, self.run)
+        self.load = schedules.driver(
+            self.loop, name, self.pacer, load_profile
+        )
+        # Камера освободила место в полном буфере: не ждем опроса
+        dm_list.on_space(self.pacer.wake)
+        self.tracer = tracing.tracer()
+        self.index = code_index.index()
+        if wal.journal():
+            # Позиция из журнала новее offset
+            wal.journal().cursor(
+                name, lambda: self.source.position,
+                lambda value: self.source.seek(int(value))
+            )
+        self.buffered_point = f"{name}:buffered"
+        DEVICES.append(self)
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'port': self.port,
+            'count': self.printed,
+            'clients': 0,
+            'position': self.source.position,
+        }
+
+    def start(self):
+        if self.load:
+            self.load.start()
+        else:
+            self.pacer.start()
+
+    def run(self) -> bool:
+        # Не забегаем вперед камеры больше чем на read_ahead кодов, но
+        # до этой глубины буфер пополняется за один такт, как у
+        # GeneratorPrinterEmul
+        dm_list = self.dm_list
+        free = self.read_ahead - len(dm_list)
+        if dm_list.overflow is Overflow.BLOCK:
+            free = min(free, dm_list.capacity - len(dm_list))
+        if free <= 0:
+            return False
+        if not self.source:
+            logging.info(f"<{self.name}> {self.dm_file_path} "
+                         f"закончился на позиции {self.source.position}")
+            self.pacer.stop()
+            return False
+        codes = self.source.batch(free)
+        dm_list.extend(codes)
+        self.printed += len(codes)
+        if self.tracer:
+            for code in codes:
+                self.tracer.stamp(code, self.buffered_point)
+        if self.index:
+            for code in codes:
+                self.index.printed(code)
+        return True
+
+
+class GeneratorPrinterEmul:
+    # Принтер без MES и файла: КМ синтезирует CodeGenerator, пачкой
+    # сразу до read_ahead кодов в буфере. count - сколько КМ выдать,
+    # 0 - без ограничения
+    def __init__(self, name, dm_list: Channel, generator: CodeGenerator,
+                 count: int = 0, interval: float = FILE_PRINT_INTERVAL,
+                 read_ahead: int = READ_AHEAD,
+                 load_profile: LoadProfile | None = None,
+                 loop: EventLoop | None = None):
+        self.name = name
+        self.port = None
+        self.dm_list = dm_list
+        self.generator = generator
+        self.count = count
+        self.generated = 0
+        self.loop = loop or get_event_loop()
+        self.read_ahead = read_ahead
+        self.pacer = Pacer(self.loop, self.name, interval, self.run)
+        self.load = schedules.driver(
+            self.loop, name, self.pacer, load_profile
+        )
+        # Камера освободила место в полном буфере: не ждем опроса
+        dm_list.on_space(self.pacer.wake)
+        self.tracer = tracing.tracer()
+        self.index = code_index.index()
+        if wal.journal():
+            # После перезапуска серийные номера продолжаются
+            wal.journal().cursor(
+                name, lambda: self.generator.serial,
+                lambda value: setattr(self.generator, 'serial', int(value))
+            )
+        self.buffered_point = f"{name}:buffered"
+        DEVICES.append(self)
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'port': self.port,
+            'count': self.generated,
+            'clients': 0,
+        }
+
+    def start(self):
+        if self.load:
+            self.load.start()
+        else:
+            self.pacer.start()
+
+    def run(self) -> bool:
+        dm_list = self.dm_list
+        free = self.read_ahead - len(dm_list)
+        if dm_list.overflow is Overflow.BLOCK:
+            free = min(free, dm_list.capacity - len(dm_list))
+        if self.count:
+            left = self.count - self.generated
+            if not left:
+                logging.info(f"<{self.name}> сгенерировано "
+                             f"{self.generated} КМ")
+                self.pacer.stop()
+                return False
+            free = min(free, left)
+        if free <= 0:
+            return False
+        codes = self.generator.batch(free)
+        dm_list.extend(codes)
+        self.generated += len(codes)
+        if self.tracer:
+            for code in codes:
+                self.tracer.stamp(code, self.buffered_point)
+        if self.index:
+            for code in codes:
+                self.index.printed(code)
+        return True
+
+
+class Backpressure(Enum):
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    DISCONNECT = 'disconnect'
+
+
+class CameraClient:
+    def __init__(self, sock: socket.socket, max_queue: int):
+        self.sock = sock
+        # Сообщения - кортежи частей bytes, общие для всех клиентов
+        # камеры; части передаются sendmsg отдельными буферами
+        self.queue: deque[tuple[bytes, ...]] = deque()
+        self.max_queue = max_queue
+        # Сколько байт первого сообщения в очереди уже отправлено
+        self.offset = 0
+        self.waiting = False
+        self.dropped = 0
+        self.capture_id = 0
+
+    def full(self) -> bool:
+        return len(self.queue) >= self.max_queue
+
+
+def send_batch(sock: socket.socket, batch: list) -> int:
+    if hasattr(sock, 'sendmsg'):
+        return sock.sendmsg(batch)
+    return sock.send(b''.join(batch))
+
+
+class TcpExchanger:
+    def __init__(
+        self, name: str,
+        codes_to_send: Channel | MmapCodeSource,
+        transfer_buffer: list[Channel],
+        listen_port: int = 23,
+        timeout: float = PAUSE,
+        can_stop: bool = False,
+        gen_errors: bool = False,
+        error_percent: int = 2,
+        stack: int = 1,
+        box_size: int | dict[str, int] = 1,
+        drop_dm_percent: int = 0,
+        add_code_quality: bool = False,
+        bad_codes_percent: int = 0,
+        pace_mode: PaceMode = PaceMode.FIXED,
+        backpressure: Backpressure = Backpressure.BLOCK,
+        send_queue: int = SEND_QUEUE,
+        fault_profile: FaultProfile | None = None,
+        load_profile: LoadProfile | None = None,
+        loop: EventLoop | None = None
+    ):
+        self.loop = loop or get_event_loop()
+        self.port = listen_port
+        self.server = listen_socket("", listen_port)
+        self.connections: dict[socket.socket, CameraClient] = {}
+        self.backpressure = backpressure
+        self.send_queue = send_queue
+        self.flush_scheduled = False
+        self.can_stop = can_stop
+        self.codes = codes_to_send
+        self.transfer_buffer = transfer_buffer
+        self.timeout = timeout
+        self.name = name
+        self.gen_errors = gen_errors
+        self.add_code_quality = add_code_quality
+        self.bad_codes_percent = bad_codes_percent
+        self.error_percent = error_percent
+        self.stack = stack
+        self.drop_dm_percent = drop_dm_percent
+        self.delay = False
+        self.faults = FaultInjector(
+            name, error_percent if gen_errors else 0, drop_dm_percent,
+            bad_codes_percent if add_code_quality else 0, fault_profile
+        )
+        self.stack_buffer = StackBuffer(stack)
+        self.router = BoxRouter(transfer_buffer, box_size)
+        self.pacer = Pacer(
+            self.loop, self.name, self.timeout, self.run, pace_mode
+        )
+        # График нагрузки вместо постоянного read_interval
+        self.load = schedules.driver(
+            self.loop, name, self.pacer, load_profile
+        )
+        if isinstance(codes_to_send, Channel):
+            codes_to_send.on_data(self.pacer.wake)
+        self.log = DeviceLog(name)
+        self.capture = capture.writer()
+        self.tracer = tracing.tracer()
+        self.sent_point = f"{name}:sent"
+        self.dropped_point = f"{name}:drop_dm"
+        self.index = code_index.index()
+        if self.index:
+            # Камера с пачками - агрегация, остальные - сериализация
+            self.index_sent = (
+                self.index.aggregated if stack > 1 else self.index.sent
+            )
+        # КМ собираемой пачки без флага качества: для трассировки,
+        # индекса и передачи следующим камерам
+        self.stack_originals: list[str] = []
+        # КМ уходят из буфера в журнале, когда пачка отправлена или
+        # пропущена: недособранная пачка после сбоя вернется в буфер
+        self.source_stage = (
+            wal.journal().channel(codes_to_send, self.stack_originals)
+            if wal.journal() and isinstance(codes_to_send, Channel)
+            else None
+        )
+        # КМ пачки, отправленные дважды (Fault.DUPLICATE)
+        self.stack_repeats: list[str] = []
+        if self.tracer and isinstance(codes_to_send, Channel):
+            codes_to_send.on_drop(partial(
+                self.tracer.lost, point=f"{codes_to_send.name}:overflow"
+            ))
+        self.codes_sent = CODES_SENT.labels(name)
+        self.dropped_dm = CODES_DROPPED.labels(name, 'drop_dm')
+        self.dropped_slow = CODES_DROPPED.labels(name, 'backpressure')
+        self.errors_injected = ERRORS_INJECTED.labels(name)
+        self.send_seconds = SEND_SECONDS.labels(name)
+        BUFFER_DEPTH.labels(name).set_function(lambda: len(self.codes))
+        CLIENTS.labels(name).set_function(lambda: len(self.connections))
+        DEVICES.append(self)
+
+    def stats(self) -> dict:
+        clients = self.connections.values()
+        return {
+            'name': self.name,
+            'port': self.port,
+            'count': self.pacer.total,
+            'clients': len(self.connections),
+            'pending': len(self.codes),
+            'queued': sum(len(c.queue) for c in clients),
+            'dropped': sum(c.dropped for c in clients),
+        }
+
+    def start(self, delay=False):
+        self.delay = delay
+        self.loop.add_reader(self.server, self.run_login)
+        if self.load:
+            self.load.start()
+        else:
+            self.pacer.start()
+
+    def run_login(self):
+        while 1:
+            try:
+                connected_client, address = self.server.accept()
+            except BlockingIOError:
+                return
+            connected_client.setblocking(False)
+            connected_client.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+            )
+            client = CameraClient(connected_client, self.send_queue)
+            if self.capture:
+                client.capture_id = self.capture.open(
+                    self.name, self.port, address
+                )
+            self.connections[connected_client] = client
+            self.loop.add_reader(
+                connected_client, partial(self.receive, client)
+            )
+            self.pacer.wake()
+
+    def disconnect(self, client: CameraClient):
+        if self.capture and client.sock in self.connections:
+            self.capture.close(client.capture_id)
+        self.loop.forget(client.sock)
+        self.connections.pop(client.sock, None)
+        client.sock.close()
+        self.pacer.wake()
+
+    def receive(self, client: CameraClient):
+        # Камера не принимает команд: читаем только чтобы заметить отключение
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logging.warning(f"[{self.name}]<{len(self.codes)}>"
+                            f" ERROR: {client.sock} {e}")
+            data = b''
+        if not data:
+            self.disconnect(client)
+        elif self.capture:
+            self.capture.rx(client.capture_id, data)
+
+    def blocked(self) -> bool:
+        return self.backpressure is Backpressure.BLOCK and any(
+            client.full() for client in self.connections.values()
+        )
+
+    def enqueue(self, *parts: bytes):
+        for client in list(self.connections.values()):
+            if client.full():
+                if self.backpressure is Backpressure.DISCONNECT:
+                    logging.warning(
+                        f"[{self.name}]<{len(self.codes)}> "
+                        f"SLOW CLIENT DISCONNECTED: {client.sock}"
+                    )
+                    self.disconnect(client)
+                    continue
+                if self.backpressure is Backpressure.DROP_OLDEST:
+                    client.dropped += 1
+                    self.dropped_slow.inc()
+                    # Частично отправленное сообщение выбрасывать нельзя;
+                    # если кроме него в очереди ничего нет, выбрасывается
+                    # новое
+                    if not client.offset:
+                        client.queue.popleft()
+                    elif len(client.queue) > 1:
+                        del client.queue[1]
+                    else:
+                        continue
+            client.queue.append(parts)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.flush_all)
+
+    def flush_all(self):
+        self.flush_scheduled = False
+        for client in list(self.connections.values()):
+            if not client.waiting:
+                self.flush(client)
+
+    def flush(self, client: CameraClient):
+        queue = client.queue
+        while queue:
+            # Части сообщений подряд, без отправленного начала первого
+            batch = []
+            messages = iter(queue)
+            if client.offset:
+                skip = client.offset
+                for part in next(messages):
+                    if skip >= len(part):
+                        skip -= len(part)
+                        continue
+                    batch.append(memoryview(part)[skip:] if skip else part)
+                    skip = 0
+            extend = batch.extend
+            for message in messages:
+                if len(batch) >= IOV_BATCH:
+                    break
+                extend(message)
+            del batch[IOV_BATCH:]
+            started = perf_counter()
+            try:
+                sent = send_batch(client.sock, batch)
+            except BlockingIOError:
+                sent = 0
+            except OSError as e:
+                logging.warning(f"[{self.name}]<{len(self.codes)}>"
+                                f" ERROR: {client.sock} {e}")
+                self.disconnect(client)
+                return
+            self.send_seconds.observe(perf_counter() - started)
+            if sent and self.capture:
+                self.capture.tx(client.capture_id, b''.join(batch)[:sent])
+            complete = sent == sum(map(len, batch))
+            while sent:
+                rest = sum(map(len, queue[0])) - client.offset
+                if sent < rest:
+                    client.offset += sent
+                    break
+                sent -= rest
+                queue.popleft()
+                client.offset = 0
+            if not complete:
+                if not client.waiting:
+                    client.waiting = True
+                    self.loop.add_writer(
+                        client.sock, partial(self.flush, client)
+                    )
+                return
+        if client.waiting:
+            client.waiting = False
+            self.loop.remove_writer(client.sock)
+        if self.backpressure is Backpressure.BLOCK:
+            self.pacer.wake()
+
+    def trace_stack(self, point: str):
+        # Камера без буфера передачи - последняя точка пути КМ
+        tracer = self.tracer
+        mark = tracer.missed if point is self.dropped_point else tracer.stamp
+        for code in self.stack_originals:
+            mark(code, point)
+            if not self.transfer_buffer:
+                tracer.done(code)
+
+    def index_stack(self, point: str):
+        mark = (
+            self.index.dropped if point is self.dropped_point
+            else self.index_sent
+        )
+        for code in self.stack_originals:
+            mark(code)
+        for code in self.stack_repeats:
+            mark(code)
+        self.stack_repeats.clear()
+
+    def transfer_stack(self):
+        # Пачка уходит дальше целиком, после отправки (или пропуска).
+        # Место под нее проверено в run(), пока буфер пишет одна камера
+        codes = self.stack_originals
+        route = self.router.route
+        if not self.tracer:
+            if len(codes) == 1:
+                routed = int(route(codes[0]) is not None)
+            else:
+                routed = self.router.route_all(codes)
+        else:
+            stamp = self.tracer.stamp
+            routed = 0
+            for code in codes:
+                buffer = route(code)
+                if buffer is None:
+                    break
+                stamp(code, f"{buffer.name}:queued")
+                routed += 1
+        if routed < len(codes):
+            self.transfer_lost(codes[routed:])
+
+    def transfer_lost(self, codes: list[str]):
+        logging.error(f"[{self.name}]<{len(self.codes)}> TRANSFER BUFFER "
+                      f"FULL: {len(codes)} codes lost")
+        if self.tracer:
+            for code in codes:
+                self.tracer.lost(code, f"{self.name}:transfer")
+
+    def run(self) -> bool:
+        if self.connections:
+            if not self.codes or self.blocked():
+                return False
+            # Место в буферах передачи нужно сразу под всю пачку: она
+            # передается целиком
+            if (
+                self.transfer_buffer and not self.stack_buffer.count and
+                not self.router.writable(self.stack)
+            ):
+                return False
+            orig_code = None
+            fault = self.faults.fault() if self.gen_errors else Fault.NONE
+            if fault is Fault.ERROR:
+                self.errors_injected.inc()
+                message, suffix = b'error', SEPARATOR_BYTES
+            elif fault is Fault.DUPLICATE:
+                self.errors_injected.inc()
+                orig_code = self.codes.popleft()
+                message = orig_code.encode()
+                # Сбой: здесь копия КМ допустима
+                suffix = SEPARATOR_BYTES + message + SEPARATOR_BYTES
+                if self.index:
+                    self.stack_repeats.append(orig_code)
+            else:
+                orig_code = self.codes.popleft()
+                message = orig_code.encode()
+                suffix = (
+                    QUALITY_SUFFIXES[self.faults.quality()]
+                    if self.add_code_quality else SEPARATOR_BYTES
+                )
+            is_code = orig_code is not None
+            if is_code and (
+                self.tracer or self.transfer_buffer or self.index or
+                self.source_stage
+            ):
+                self.stack_originals.append(orig_code)
+            if self.stack > 1:
+                # Камера агрегации: КМ копятся до полного короба
+                if not self.stack_buffer.add(message, suffix, is_code):
+                    return True
+                parts, stack_codes = self.stack_buffer.take()
+            else:
+                parts = (message, suffix)
+                stack_codes = int(is_code)
+            if self.drop_dm_percent and self.faults.drop():
+                self.dropped_dm.inc(stack_codes)
+                point = self.dropped_point
+                self.log.message('DROPPED', parts,
+                                 "[%s]<%d> DROPPED: %s",
+                                 self.name, len(self.codes))
+            else:
+                self.enqueue(*parts)
+                self.codes_sent.inc(stack_codes)
+                point = self.sent_point
+                self.log.message('SENT', parts, "[%s]<%d> SENT: %s",
+                                 self.name, len(self.codes))
+            if self.tracer:
+                self.trace_stack(point)
+            if self.index:
+                self.index_stack(point)
+            if self.source_stage is not None and stack_codes:
+                self.source_stage.pop(stack_codes)
+            if self.transfer_buffer:
+                self.transfer_stack()
+            self.stack_originals.clear()
+            return True
+        return False
+
+
+class SerialisationSetup:
+    def __init__(self, printer_port: int, camera_port: int,
+                 gen_errors: bool = False, error_percent: int = 2,
+                 drop_dm_percent: int = 0,
+                 read_interval: float = 0.15,
+                 add_code_quality: bool = False,
+                 bad_codes_percent: int = 0,
+                 pace_mode: PaceMode = PaceMode.FIXED,
+                 backpressure: Backpressure = Backpressure.BLOCK,
+                 buffer_size: int = CHANNEL_SIZE,
+                 overflow: Overflow = Overflow.BLOCK,
+                 box_size: int | dict[str, int] = 1):
+        self.agr_buffer = list()
+        self.dm_list = Channel('PRNSER', buffer_size, overflow)
+        self.dm_printer = PrinterEmul(
+            'PRNSER', self.dm_list, printer_port
+        )
+        self.dm_camera = TcpExchanger(
+            name="DMSER",
+            timeout=read_interval,
+            codes_to_send=self.dm_list,
+            transfer_buffer=self.agr_buffer,
+            listen_port=camera_port,
+            gen_errors=gen_errors,
+            error_percent=error_percent,
+            drop_dm_percent=drop_dm_percent,
+            add_code_quality=add_code_quality,
+            bad_codes_percent=bad_codes_percent,
+            pace_mode=pace_mode,
+            backpressure=backpressure,
+            box_size=box_size
+        )
+
+    def run(self):
+        logging.info(f"Started DM printer at port {self.dm_printer.port}...")
+        self.dm_printer.start()
+        logging.info(f"Started DM camera at port {self.dm_camera.port}...")
+        self.dm_camera.start(delay=True)
+
+
+class SerialisationFromFileSetup:
+    def __init__(self, camera_port: int, gen_errors: bool = False,
+                 error_percent: int = 2, drop_dm_percent: int = 0,
+                 read_interval: float = 0.15,
+                 add_code_quality: bool = False,
+                 bad_codes_percent: int = 0,
+                 pace_mode: PaceMode = PaceMode.FIXED,
+                 backpressure: Backpressure = Backpressure.BLOCK,
+                 file_offset: int = 0,
+                 buffer_size: int = CHANNEL_SIZE,
+                 overflow: Overflow = Overflow.BLOCK,
+                 box_size: int | dict[str, int] = 1):
+        self.agr_buffer = list()
+        self.dm_list = Channel('PRNSER', buffer_size, overflow)
+        self.dm_file_path = dm_file_path()
+        self.dm_printer = FilePrinterEmul(
+            'PRNSER', self.dm_list, self.dm_file_path, offset=file_offset
+        )
+        self.dm_camera = TcpExchanger(
+            name="DMSER",
+            codes_to_send=self.dm_list,
+            transfer_buffer=self.agr_buffer,
+            timeout=read_interval,
+            listen_port=camera_port,
+            gen_errors=gen_errors,
+            error_percent=error_percent,
+            drop_dm_percent=drop_dm_percent,
+            add_code_quality=add_code_quality,
+            bad_codes_percent=bad_codes_percent,
+            pace_mode=pace_mode,
+            backpressure=backpressure,
+            box_size=box_size
+        )
+
+    def run(self):
+        logging.info(f"DM source file path {self.dm_file_path}...")
+        self.dm_printer.start()
+        logging.info(f"Started DM camera at port {self.dm_camera.port}...")
+        self.dm_camera.start()
+
+
+class SerialisationFromGeneratorSetup:
+    def __init__(self, camera_port: int, generator: CodeGenerator,
+                 count: int = 0, gen_errors: bool = False,
+                 error_percent: int = 2, drop_dm_percent: int = 0,
+                 read_interval: float = 0.15,
+                 add_code_quality: bool = False,
+                 bad_codes_percent: int = 0,
+                 pace_mode: PaceMode = PaceMode.FIXED,
+                 backpressure: Backpressure = Backpressure.BLOCK,
+                 buffer_size: int = CHANNEL_SIZE,
+                 overflow: Overflow = Overflow.BLOCK,
+                 box_size: int | dict[str, int] = 1):
+        self.agr_buffer = list()
+        self.dm_list = Channel('PRNSER', buffer_size, overflow)
+        self.dm_printer = GeneratorPrinterEmul(
+            'PRNSER', self.dm_list, generator, count
+        )
+        self.dm_camera = TcpExchanger(
+            name="DMSER",
+            codes_to_send=self.dm_list,
+            transfer_buffer=self.agr_buffer,
+            timeout=read_interval,
+            listen_port=camera_port,
+            gen_errors=gen_errors,
+            error_percent=error_percent,
+            drop_dm_percent=drop_dm_percent,
+            add_code_quality=add_code_quality,
+            bad_codes_percent=bad_codes_percent,
+            pace_mode=pace_mode,
+            backpressure=backpressure,
+            box_size=box_size
+        )
+
+    def run(self):
+        logging.info(f"DM codes generated for GTIN "
+                     f"{', '.join(self.dm_printer.generator.gtins)}...")
+        self.dm_printer.start()
+        logging.info(f"Started DM camera at port {self.dm_camera.port}...")
+        self.dm_camera.start()
+
+
+class AggregationVerificationSetup:
+    def __init__(
+        self,
+        printer_port: int,
+        camera_port: int,
+        read_interval: float = 0.05,
+        pace_mode: PaceMode = PaceMode.FIXED,
+        backpressure: Backpressure = Backpressure.BLOCK,
+        buffer_size: int = CHANNEL_SIZE,
+        overflow: Overflow = Overflow.BLOCK
+    ):
+        self.dm_list = Channel('PRNAGR', buffer_size, overflow)
+        self.dm_printer = PrinterEmul('PRNAGR', self.dm_list, printer_port)
+        self.dm_camera = TcpExchanger(
+            name="VERIF",
+            codes_to_send=self.dm_list,
+            can_stop=True,
+            listen_port=camera_port,
+            timeout=read_interval,
+            gen_errors=False,
+            transfer_buffer=[],
+            pace_mode=pace_mode,
+            backpressure=backpressure
+        )
+
+    def run(self):
+        logging.info("Started Aggregation printer at "
+                     f"port {self.dm_printer.port}...")
+        self.dm_printer.start()
+        logging.info("Started Aggregation verification camera "
+                     f"at port {self.dm_camera.port}...")
+        self.dm_camera.start()
+
+
+def check_agr_count(count: int):
+    if not 0 <= count <= MAX_AGR_COUNT:
+        raise ValueError(
+            f"agr_count {count} is out of range 0..{MAX_AGR_COUNT}: "
+            f"aggregation cameras listen from port 27, port 32 is VERIF"
+        )
+
+
+def agr_stacks(stacks: list[int], count: int) -> list[int]:
+    # Размеры коробов камер агрегации: последний повторяется для
+    # остальных камер
+    if any(stack < 1 for stack in stacks):
+        raise ValueError(f"stack sizes must be positive, got {stacks}")
+    return [stacks[min(i, len(stacks) - 1)] for i in range(count)]
+
+
+class AggregationSetup:
+    def __init__(self, start_port: int, agr_buffer: list[Channel],
+                 count: int = 1, read_interval: float = 0.05,
+                 pace_mode: PaceMode = PaceMode.FIXED,
+                 backpressure: Backpressure = Backpressure.BLOCK,
+                 buffer_size: int = CHANNEL_SIZE,
+                 overflow: Overflow = Overflow.BLOCK,
+                 stacks: list[int] | None = None):
+        self.agr_cam_list = dict[str, TcpExchanger]()
+        self.start_port = start_port
+        self.agr_buffer = agr_buffer
+        self.count = count
+        self.stacks = agr_stacks(stacks or [AGR_STACK], count)
+        self.default_timeout = read_interval
+        self.pace_mode = pace_mode
+        self.backpressure = backpressure
+        self.buffer_size = buffer_size
+        self.overflow = overflow
+
+    def gen_cameras(self):
+        for i in range(self.count):
+            cam_name = f"AGR_{i}"
+            self.agr_buffer.append(
+                Channel(cam_name, self.buffer_size, self.overflow)
+            )
+            self.agr_cam_list[cam_name] = TcpExchanger(
+                name=cam_name, codes_to_send=self.agr_buffer[i],
+                listen_port=self.start_port + i, timeout=self.default_timeout,
+                transfer_buffer=[], stack=self.stacks[i],
+                pace_mode=self.pace_mode,
+                backpressure=self.backpressure
+            )
+
+    def run(self):
+        self.gen_cameras()
+        for camera, camera_obj in self.agr_cam_list.items():
+            logging.info(f"Starting aggregation multicamera {camera} at "
+                         f"port {camera_obj.port}...")
+            camera_obj.start(delay=True)
+
+
+class PalletPrinter:
+    def __init__(self, port: int, name: str):
+        # Этикетки паллетных принтеров никто не читает: храним последние
+        self.data = Channel(name, overflow=Overflow.DROP_OLDEST)
+        self.printer = PrinterEmul(name, self.data, port, traced=False)
+        self.name = name
+
+    def run(self):
+        logging.info(f"Starting {self.name} printer at port"
+                     f" {self.printer.port}..")
+        self.printer.start()
+
+
+class RefubrishingSetup:
+    def __init__(self, camera_port: int, dm_file: Path, offset: int = 0):
+        self.dm_file = dm_file
+        self.dm_list = MmapCodeSource(dm_file, offset)
+        self.dm_camera = TcpExchanger(
+            name="DMREF",
+            codes_to_send=self.dm_list,
+            listen_port=camera_port,
+            transfer_buffer=[]
+        )
+
+    def load_dm_from_file(self):
+        # Файл не загружается в память: КМ читаются по мере отправки,
+        # возвращается оценка их количества
+        return len(self.dm_list)
+
+    def run(self):
+        logging.info(f"Started DM camera at port {self.dm_camera.port}...")
+        self.dm_camera.start()
+
+
+def dm_file_path() -> Path:
+    if getattr(sys, 'frozen', False):
+        cur_path = Path(sys.executable).parents[0]
+    else:
+        cur_path = Path(__file__).parents[0]
+    return cur_path / 'dm.csv'
+
+
+def start_metrics(port: int):
+    if port:
+        server = MetricsServer(port)
+        server.start()
+        logging.info(f"Metrics at http://127.0.0.1:{server.port}/metrics")
+
+
+def line_ports(args, port_offset: int = 0) -> list[int]:
+    # Порты, которые слушают устройства процесса, и порт /metrics
+    ports = [device.port for device in DEVICES if device.port]
+    if args.metrics_port:
+        ports.append(args.metrics_port + port_offset)
+    return sorted(ports)
+
+
+def start_ser_line(args, port_offset: int = 0):
+    agr_count = args.agr_count
+    stacks = agr_stacks(args.agr_stack, agr_count)
+    gen_err = bool(args.gen_err)
+    perc_err = args.perc_err
+    dm_file = args.dm_file
+    drop_dm = args.drop_dm
+    read_interval = args.read_interval
+    add_code_quality = bool(args.add_code_quality)
+    bad_code_quality_percent = args.bad_code_quality_percent
+    pace_mode = PaceMode(args.read_mode)
+    backpressure = Backpressure(args.backpressure)
+    buffer_size = args.buffer_size
+    overflow = Overflow(args.buffer_overflow)
+    faults.configure(args.seed, args.fault_profile)
+    tracing.configure(bool(args.trace), args.stuck_after)
+    code_index.configure(IndexMode(args.index), args.index_capacity)
+    wal.configure(args.wal, args.wal_commit)
+    schedules.configure(args.load_profile)
+
+    if args.topology:
+        return start_topology(args, port_offset)
+    check_agr_count(agr_count)
+    if args.generate:
+        generator = CodeGenerator(
+            args.gtins, device_rng('PRNSER', 'codes').getrandbits(64),
+            start=args.serial_start
+        )
+        sr = SerialisationFromGeneratorSetup(
+            23 + port_offset, generator,
+            count=max(args.generate, 0),
+            gen_errors=gen_err,
+            error_percent=perc_err,
+            drop_dm_percent=drop_dm,
+            read_interval=read_interval,
+            add_code_quality=add_code_quality,
+            bad_codes_percent=bad_code_quality_percent,
+            pace_mode=pace_mode,
+            backpressure=backpressure,
+            buffer_size=buffer_size,
+            overflow=overflow,
+            box_size={
+                f"AGR_{i}": stack for i, stack in enumerate(stacks)
+            }
+        )
+    elif dm_file:
+        if not dm_file_path().exists():
+            logging.error(f'{dm_file_path()} does not exist')
+            return None
+        sr = SerialisationFromFileSetup(
+            23 + port_offset,
+            gen_errors=gen_err,
+            error_percent=perc_err,
+            drop_dm_percent=drop_dm,
+            read_interval=read_interval,
+            add_code_quality=add_code_quality,
+            bad_codes_percent=bad_code_quality_percent,
+            pace_mode=pace_mode,
+            backpressure=backpressure,
+            file_offset=args.file_offset,
+            buffer_size=buffer_size,
+            overflow=overflow,
+            box_size={
+                f"AGR_{i}": stack for i, stack in enumerate(stacks)
+            }
+        )
+    else:
+        sr = SerialisationSetup(
+            9101 + port_offset, 23 + port_offset,
+            gen_errors=gen_err,
+            error_percent=perc_err,
+            drop_dm_percent=drop_dm,
+            read_interval=read_interval,
+            add_code_quality=add_code_quality,
+            bad_codes_percent=bad_code_quality_percent,
+            pace_mode=pace_mode,
+            backpressure=backpressure,
+            buffer_size=buffer_size,
+            overflow=overflow,
+            box_size={
+                f"AGR_{i}": stack for i, stack in enumerate(stacks)
+            }
+        )
+    sr.run()
+
+    if agr_count:
+        agr_setup = AggregationSetup(
+            27 + port_offset, sr.agr_buffer, agr_count,
+            read_interval=read_interval,
+            pace_mode=pace_mode,
+            backpressure=backpressure,
+            buffer_size=buffer_size,
+            overflow=overflow,
+            stacks=stacks
+        )
+        agr_setup.run()
+        agr_ver = AggregationVerificationSetup(
+            9102 + port_offset, 32 + port_offset,
+            read_interval=read_interval,
+            pace_mode=pace_mode,
+            backpressure=backpressure,
+            buffer_size=buffer_size,
+            overflow=overflow
+        )
+        agr_ver.run()
+    else:
+        PalletPrinter(9102 + port_offset, "LEVEL_0").run()
+    PalletPrinter(9103 + port_offset, "LEVEL_1").run()
+    PalletPrinter(9104 + port_offset, "LEVEL_2").run()
+    PalletPrinter(9105 + port_offset, "LEVEL_3").run()
+    if wal.journal():
+        wal.journal().start()
+    if args.metrics_port:
+        start_metrics(args.metrics_port + port_offset)
+    return sr
+
+
+def start_topology(args, port_offset: int = 0):
+    from topology import Line, load_topology
+    line = Line(load_topology(Path(args.topology)), port_offset)
+    line.run()
+    if wal.journal():
+        wal.journal().start()
+    if args.metrics_port:
+        start_metrics(args.metrics_port + port_offset)
+    return line
@@ -0,0 +1,212 @@
+import heapq
+import logging
+import selectors
+import socket
+from collections import deque
+from itertools import count
+from time import monotonic, thread_time
+from typing import Callable
+
+
+def listen_socket(host: str, port: int, backlog: int = 5) -> socket.socket:
+    # Эмулятор часто перезапускается: без SO_REUSEADDR порт остается
+    # занятым соединениями прошлого запуска в TIME_WAIT. В Windows этот
+    # флаг позволяет занять порт чужого процесса, там нужен
+    # SO_EXCLUSIVEADDRUSE
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):
+            server.setsockopt(
+                socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1
+            )
+        else:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.setblocking(False)
+        server.bind((host, port))
+        server.listen(backlog)
+    except OSError:
+        server.close()
+        raise
+    return server
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline: float, callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop:
+    # Один цикл на процесс: все слушающие сокеты, клиентские соединения
+    # и таймеры устройств обслуживаются одним select() без активного ожидания
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self._timers: list[tuple[float, int, Timer]] = []
+        self._seq = count()
+        self._ready: deque[tuple[Callable, tuple]] = deque()
+        self._running = False
+        # Процессорное время по устройствам, если включен учет
+        self.cpu_time: dict[str, float] | None = None
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(
+            self._wake_r, selectors.EVENT_READ, (self._drain_wakeup, None)
+        )
+
+    def _drain_wakeup(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _update(self, sock: socket.socket, reader, writer):
+        events = 0
+        if reader is not None:
+            events |= selectors.EVENT_READ
+        if writer is not None:
+            events |= selectors.EVENT_WRITE
+        try:
+            self.selector.get_key(sock)
+        except KeyError:
+            if events:
+                self.selector.register(sock, events, (reader, writer))
+            return
+        if events:
+            self.selector.modify(sock, events, (reader, writer))
+        else:
+            self.selector.unregister(sock)
+
+    def _callbacks(self, sock: socket.socket):
+        try:
+            return self.selector.get_key(sock).data
+        except (KeyError, ValueError):
+            return None, None
+
+    def add_reader(self, sock: socket.socket, callback: Callable):
+        _, writer = self._callbacks(sock)
+        self._update(sock, callback, writer)
+
+    def remove_reader(self, sock: socket.socket):
+        _, writer = self._callbacks(sock)
+        self._update(sock, None, writer)
+
+    def add_writer(self, sock: socket.socket, callback: Callable):
+        reader, _ = self._callbacks(sock)
+        self._update(sock, reader, callback)
+
+    def remove_writer(self, sock: socket.socket):
+        reader, _ = self._callbacks(sock)
+        self._update(sock, reader, None)
+
+    def forget(self, sock: socket.socket):
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def call_soon(self, callback: Callable, *args):
+        self._ready.append((callback, args))
+
+    def call_soon_threadsafe(self, callback: Callable, *args):
+        self._ready.append((callback, args))
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def call_at(self, deadline: float, callback: Callable, *args) -> Timer:
+        timer = Timer(deadline, callback, args)
+        heapq.heappush(self._timers, (deadline, next(self._seq), timer))
+        return timer
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        return self.call_at(monotonic() + delay, callback, *args)
+
+    def enable_cpu_accounting(self):
+        # Время обработчика относится к устройству, которому он
+        # принадлежит: метод устройства или partial от него
+        self.cpu_time = {}
+
+    @staticmethod
+    def _owner(callback: Callable) -> str:
+        callback = getattr(callback, 'func', callback)
+        owner = getattr(callback, '__self__', None)
+        if owner is None:
+            return '<other>'
+        return getattr(owner, 'name', None) or type(owner).__name__
+
+    def _invoke(self, callback: Callable, args: tuple):
+        if self.cpu_time is not None:
+            started = thread_time()
+        try:
+            callback(*args)
+        except Exception as e:
+            logging.exception(f"<LOOP> ERROR in {callback}: {e}")
+        if self.cpu_time is not None:
+            owner = self._owner(callback)
+            self.cpu_time[owner] = (
+                self.cpu_time.get(owner, 0.0) + thread_time() - started
+            )
+
+    def _next_timeout(self) -> float | None:
+        if self._ready:
+            return 0
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+        if not self._timers:
+            return None
+        return max(0.0, self._timers[0][0] - monotonic())
+
+    def run_once(self, timeout: float | None = None):
+        # timeout - не ждать событий дольше (для внешних циклов)
+        wait = self._next_timeout()
+        if timeout is not None:
+            timeout = max(0.0, timeout)
+            wait = timeout if wait is None else min(wait, timeout)
+        for key, mask in self.selector.select(wait):
+            reader, writer = key.data
+            if mask & selectors.EVENT_READ and reader is not None:
+                self._invoke(reader, ())
+            if mask & selectors.EVENT_WRITE and writer is not None:
+                # Читатель мог закрыть сокет
+                if key.fileobj.fileno() != -1:
+                    self._invoke(writer, ())
+        now = monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                self._ready.append((timer.callback, timer.args))
+        for _ in range(len(self._ready)):
+            callback, args = self._ready.popleft()
+            self._invoke(callback, args)
+
+    def run_forever(self):
+        self._running = True
+        try:
+            while self._running:
+                self.run_once()
+        finally:
+            self._running = False
+
+    def stop(self):
+        self._running = False
+        self.call_soon_threadsafe(lambda: None)
+
+
+_default_loop: EventLoop | None = None
+
+
+def get_event_loop() -> EventLoop:
+    global _default_loop
+    if _default_loop is None:
+        _default_loop = EventLoop()
+    return _default_loop
@@ -0,0 +1,184 @@
+import atexit
+import json
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from queue import Full, Queue, SimpleQueue
+from time import monotonic, time
+
+
+# Сколько событий SENT/PRINTED в секунду одно устройство пишет в журнал,
+# 0 - без ограничения
+EVENT_LOG_RATE = 100.0
+# Сколько записей текстового журнала ждут потока записи; при
+# переполнении записи выбрасываются, а не копятся в памяти
+LOG_QUEUE_SIZE = 10000
+
+_listener: QueueListener | None = None
+_writer: 'EventWriter | None' = None
+_rate = EVENT_LOG_RATE
+
+
+class DeferredQueueHandler(QueueHandler):
+    # Стандартный QueueHandler форматирует сообщение в потоке устройства.
+    # Здесь запись уходит в очередь как есть: строка собирается из
+    # аргументов уже в потоке записи. Если поток записи не успевает,
+    # лишние записи выбрасываются, о них пишется сводка
+    def __init__(self, queue: Queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.LogRecord(
+                    'root', logging.WARNING, __file__, 0,
+                    "%d log records dropped: log queue full",
+                    (self.dropped,), None
+                ))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class BoundedQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Очередь может быть полна: ждем, пока поток записи ее разберет
+        self.queue.put(self._sentinel)
+
+
+def start_queue_logging(*handlers: logging.Handler) -> QueueHandler:
+    # Обработчики работают в отдельном потоке, корневому логгеру
+    # достается только очередь
+    global _listener
+    stop_queue_logging()
+    queue = Queue(LOG_QUEUE_SIZE)
+    _listener = BoundedQueueListener(
+        queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    return DeferredQueueHandler(queue)
+
+
+def stop_queue_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class EventWriter:
+    # Журнал событий КМ в формате JSONL: одна строка на событие.
+    # Запись в файл идет в отдельном потоке, устройство только кладет
+    # кортеж в очередь
+    def __init__(self, path: Path):
+        self.path = path
+        self.queue: SimpleQueue = SimpleQueue()
+        self.file = open(path, 'a', encoding='utf-8')
+        self.thread = threading.Thread(
+            target=self._run, name='EventWriter', daemon=True
+        )
+        self.thread.start()
+
+    def write(self, device: str, kind: str, code: str):
+        self.queue.put((time(), device, kind, code))
+
+    def _run(self):
+        queue = self.queue
+        file = self.file
+        while 1:
+            event = queue.get()
+            if event is None:
+                break
+            ts, device, kind, code = event
+            file.write(json.dumps(
+                {'ts': round(ts, 6), 'device': device,
+                 'event': kind, 'code': code},
+                ensure_ascii=False
+            ))
+            file.write('\n')
+            if queue.empty():
+                file.flush()
+        file.close()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def configure(rate: float = EVENT_LOG_RATE, path: Path | None = None):
+    # Вызывается до создания устройств: DeviceLog берет настройки отсюда
+    global _rate, _writer
+    _rate = rate
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+    if path is not None:
+        _writer = EventWriter(path)
+        atexit.register(_writer.close)
+
+
+class DeviceLog:
+    # Журнал событий КМ одного устройства. В текстовый журнал попадает
+    # не больше rate событий в секунду, о пропущенных пишется сводка;
+    # в журнал событий (если включен) пишутся все
+    def __init__(self, name: str):
+        self.name = name
+        self.rate = _rate
+        self.writer = _writer
+        self.tokens = self.rate
+        self.updated = monotonic()
+        self.suppressed = 0
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = monotonic()
+        self.tokens = min(
+            self.rate, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.suppressed += 1
+        return False
+
+    def _log(self, level: int, msg: str, args: tuple):
+        if not logging.root.isEnabledFor(level) or not self.allow():
+            return
+        if self.suppressed:
+            logging.info("<%s> %d events not logged (limit %g/s)",
+                         self.name, self.suppressed, self.rate)
+            self.suppressed = 0
+        logging.log(level, msg, *args)
+
+    def event(self, kind: str, code: str, msg: str, *args):
+        if self.writer is not None:
+            self.writer.write(self.name, kind, code)
+        self._log(logging.INFO, msg, args)
+
+    def debug(self, msg: str, *args):
+        # Покадровые подробности (текст заданий, обмен с буфером): в
+        # пределах того же лимита, что и события КМ
+        self._log(logging.DEBUG, msg, args)
+
+    def message(self, kind: str, message: str | tuple[bytes, ...],
+                msg: str, *args):
+        # Событие по сообщению камеры: текст без завершающего разделителя
+        # выделяется, только если событие будет записано. Сообщение из
+        # очереди клиента камеры (части bytes) склеивается здесь же
+        if (
+            self.writer is None and
+            not logging.root.isEnabledFor(logging.INFO)
+        ):
+            return
+        if not isinstance(message, str):
+            message = b''.join(message).decode()
+        text = message.strip()
+        self.event(kind, text, msg, *args, text)
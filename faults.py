@@ -0,0 +1,251 @@
+import json
+import logging
+import math
+import random
+from enum import Enum, IntEnum
+from pathlib import Path
+
+
+# Сколько решений генерируется за раз для каждого потока
+FAULT_BATCH = 4096
+
+
+class CodeQuality(Enum):
+    A = 'A'
+    B = 'B'
+    C = 'C'
+    D = 'D'
+    E = 'E'
+    F = 'F'
+
+
+GOOD_CODES = (CodeQuality.A.value, CodeQuality.B.value)
+
+
+BAD_CODES = (
+    CodeQuality.C.value,
+    CodeQuality.D.value,
+    CodeQuality.E.value,
+    CodeQuality.F.value
+)
+
+
+class Fault(IntEnum):
+    NONE = 0
+    # Вместо КМ камера передает 'error'
+    ERROR = 1
+    # КМ прочитан дважды
+    DUPLICATE = 2
+
+
+class FaultProfile:
+    # Сценарий сбоев поверх процентов из командной строки. Ошибки и
+    # пропуски идут пачками по модели Гилберта-Эллиотта: из нормального
+    # состояния камера переходит в плохое с вероятностью burst_enter на
+    # каждый код и возвращается с вероятностью burst_exit. В плохом
+    # состоянии действуют burst_error_percent и burst_drop_percent
+    def __init__(self, name: str, burst_enter: float = 0.0,
+                 burst_exit: float = 1.0,
+                 burst_error_percent: float = 0.0,
+                 burst_drop_percent: float = 0.0,
+                 duplicate_share: float = 0.5):
+        for field, value in (('burst_enter', burst_enter),
+                             ('burst_exit', burst_exit),
+                             ('duplicate_share', duplicate_share)):
+            if not 0 <= value <= 1:
+                raise ValueError(f"{name}: {field} must be within 0..1")
+        for field, value in (('burst_error_percent', burst_error_percent),
+                             ('burst_drop_percent', burst_drop_percent)):
+            if not 0 <= value <= 100:
+                raise ValueError(f"{name}: {field} must be within 0..100")
+        if burst_enter and not burst_exit:
+            raise ValueError(f"{name}: burst_exit must be positive")
+        self.name = name
+        self.burst_enter = burst_enter
+        self.burst_exit = burst_exit
+        self.burst_error_percent = burst_error_percent
+        self.burst_drop_percent = burst_drop_percent
+        self.duplicate_share = duplicate_share
+
+
+PROFILES = {
+    # Равномерные сбои с процентами из командной строки
+    'flat': FaultProfile('flat'),
+    # Короткие пачки ошибок: в среднем раз в 500 кодов по 10 кодов
+    'bursty': FaultProfile(
+        'bursty', burst_enter=0.002, burst_exit=0.1,
+        burst_error_percent=50, burst_drop_percent=20
+    ),
+    # Загрязненная оптика: длинные периоды почти сплошного брака
+    'storm': FaultProfile(
+        'storm', burst_enter=0.0005, burst_exit=0.01,
+        burst_error_percent=90, burst_drop_percent=50, duplicate_share=0.2
+    ),
+}
+
+
+def load_profile(value: str) -> FaultProfile:
+    # Имя из PROFILES или JSON-файл с параметрами FaultProfile
+    if value in PROFILES:
+        return PROFILES[value]
+    path = Path(value)
+    if not path.exists():
+        raise ValueError(
+            f"unknown fault profile {value!r}: "
+            f"expected one of {sorted(PROFILES)} or a JSON file"
+        )
+    with open(path, 'r', encoding='utf-8') as f:
+        fields = json.load(f)
+    if not isinstance(fields, dict):
+        raise ValueError(f"{path}: expected an object of profile fields")
+    try:
+        return FaultProfile(fields.pop('name', path.stem), **fields)
+    except TypeError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+def _geometric(rng: random.Random, p: float) -> float:
+    # Номер первого успеха в серии испытаний с вероятностью p
+    if p <= 0:
+        return math.inf
+    if p >= 1:
+        return 1
+    return int(math.log1p(-rng.random()) / math.log1p(-p)) + 1
+
+
+class BurstChain:
+    # Флаги сбоев для последовательности кодов. Вместо розыгрыша на
+    # каждый код разыгрываются длины состояний и промежутки между
+    # сбоями, так что цена пачки пропорциональна числу сбоев
+    def __init__(self, rng: random.Random, percent: float,
+                 burst_percent: float, enter: float, exit: float):
+        self.rng = rng
+        self.good_rate = percent / 100
+        self.bad_rate = burst_percent / 100
+        self.enter = enter
+        self.exit = exit
+        self.bad = False
+        self.run_left = _geometric(rng, enter)
+
+    def fill(self, flags: bytearray):
+        rng = self.rng
+        size = len(flags)
+        pos = 0
+        while pos < size:
+            if not self.run_left:
+                self.bad = not self.bad
+                self.run_left = _geometric(
+                    rng, self.exit if self.bad else self.enter
+                )
+            run = min(self.run_left, size - pos)
+            rate = self.bad_rate if self.bad else self.good_rate
+            offset = _geometric(rng, rate) - 1
+            while offset < run:
+                flags[pos + offset] = 1
+                offset += _geometric(rng, rate)
+            pos += run
+            self.run_left -= run
+
+
+class FaultInjector:
+    # Заранее сгенерированные решения о сбоях одной камеры. У каждого
+    # потока решений свой генератор, зависящий только от зерна и имени
+    # устройства: при том же зерне последовательность сбоев повторяется
+    # от запуска к запуску и не зависит от остальных настроек
+    def __init__(self, name: str, error_percent: float = 0,
+                 drop_percent: float = 0, bad_quality_percent: float = 0,
+                 profile: FaultProfile | None = None,
+                 seed: int | None = None, batch: int = FAULT_BATCH):
+        profile = profile or _profile
+        self.name = name
+        self.batch = batch
+        self.duplicate_share = profile.duplicate_share
+        self._errors = BurstChain(
+            device_rng(name, 'errors', seed), error_percent,
+            profile.burst_error_percent if error_percent else 0,
+            profile.burst_enter, profile.burst_exit
+        )
+        self._drops = BurstChain(
+            device_rng(name, 'drops', seed), drop_percent,
+            profile.burst_drop_percent if drop_percent else 0,
+            profile.burst_enter, profile.burst_exit
+        )
+        self._bad_quality = BurstChain(
+            device_rng(name, 'quality', seed), bad_quality_percent,
+            bad_quality_percent, 0, 1
+        )
+        self._kind_rng = device_rng(name, 'kind', seed)
+        self._grade_rng = device_rng(name, 'grade', seed)
+        self._faults: list[Fault] = []
+        self._drop_flags = bytearray()
+        self._grades: list[str] = []
+
+    def _fill_faults(self):
+        flags = bytearray(self.batch)
+        self._errors.fill(flags)
+        kind = self._kind_rng.random
+        share = self.duplicate_share
+        faults = [Fault.NONE] * self.batch
+        pos = flags.find(1)
+        while pos >= 0:
+            faults[pos] = Fault.DUPLICATE if kind() < share else Fault.ERROR
+            pos = flags.find(1, pos + 1)
+        # Решения выдаются с конца списка
+        faults.reverse()
+        self._faults = faults
+
+    def _fill_drops(self):
+        flags = bytearray(self.batch)
+        self._drops.fill(flags)
+        flags.reverse()
+        self._drop_flags = flags
+
+    def _fill_grades(self):
+        flags = bytearray(self.batch)
+        self._bad_quality.fill(flags)
+        rng = self._grade_rng
+        grades = rng.choices(GOOD_CODES, k=self.batch)
+        pos = flags.find(1)
+        while pos >= 0:
+            grades[pos] = rng.choice(BAD_CODES)
+            pos = flags.find(1, pos + 1)
+        grades.reverse()
+        self._grades = grades
+
+    def fault(self) -> Fault:
+        if not self._faults:
+            self._fill_faults()
+        return self._faults.pop()
+
+    def drop(self) -> bool:
+        if not self._drop_flags:
+            self._fill_drops()
+        return bool(self._drop_flags.pop())
+
+    def quality(self) -> str:
+        if not self._grades:
+            self._fill_grades()
+        return self._grades.pop()
+
+
+_seed = 0
+_profile = PROFILES['flat']
+
+
+def configure(seed: int | None = None, profile: str = 'flat') -> int:
+    # Вызывается до создания устройств. Без зерна выбирается случайное и
+    # пишется в журнал, чтобы запуск можно было повторить
+    global _seed, _profile
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    _seed = seed
+    _profile = load_profile(profile)
+    logging.info(f"Fault seed {seed}, profile {_profile.name}")
+    return seed
+
+
+def device_rng(name: str, stream: str,
+               seed: int | None = None) -> random.Random:
+    # Строковое зерно хешируется детерминированно, в отличие от hash()
+    seed = _seed if seed is None else seed
+    return random.Random(f"{seed}:{name}:{stream}")
@@ -0,0 +1,193 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import signal
+import sys
+from pathlib import Path
+from queue import Empty
+from time import monotonic
+
+import capture
+import code_index
+import devices
+import eventlog
+import faults
+import line_emulator
+import tracing
+import wal
+from event_loop import get_event_loop
+from topology import load_topology
+
+
+MAX_PORT = 65535
+# Старший порт встроенной линии сериализации (принтер LEVEL_3)
+LINE_MAX_PORT = 9105
+
+
+def line_worker(index: int, port_offset: int, options: dict,
+                stats_queue, log_level: int, stats_interval: float):
+    line_emulator.setup_logging(log_level, f"LINE_{index}")
+    args = argparse.Namespace(**options)
+    line_emulator.setup_recorders(args, f"_{index}")
+    args.wal = line_emulator.with_suffix(args.wal, f"_{index}")
+    if args.seed is not None:
+        # Свое зерно у каждой линии, иначе одноименные камеры линий
+        # сбоят одинаково
+        args.seed += index
+    try:
+        sr = devices.start_ser_line(args, port_offset)
+    except (OSError, ValueError) as e:
+        logging.error(f"[LINE_{index}] ERROR: {e}")
+        sr = None
+    if sr is None:
+        stats_queue.put((index, None))
+        return
+    # Порты линии слушают: родитель сообщит о готовности, когда все линии
+    # дойдут до этой точки
+    ports = devices.line_ports(args, port_offset)
+    stats_queue.put((index, {'ready': ports}))
+    loop = get_event_loop()
+
+    def report():
+        loop.call_later(stats_interval, report)
+        stats_queue.put(
+            (index, [device.stats() for device in devices.DEVICES])
+        )
+
+    loop.call_later(stats_interval, report)
+    # terminate() из родителя: выходим через finally, а не сразу
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        loop.run_forever()
+    finally:
+        if tracing.tracer():
+            tracing.tracer().report()
+        if code_index.index():
+            code_index.index().report()
+        # Процесс завершается без atexit: дописываем журнал сами
+        wal.configure(None)
+        eventlog.configure()
+        capture.configure(None)
+        eventlog.stop_queue_logging()
+
+
+def load_lines_config(path: Path | None, options: dict) -> list[dict]:
+    # JSON-список с настройками отдельных линий поверх общих параметров:
+    # [{"read_interval": 0.05}, {"agr_count": 0}, ...]
+    if path is None:
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        overrides = json.load(f)
+    if not isinstance(overrides, list):
+        raise ValueError(f"{path}: expected a list of line settings")
+    for n, line in enumerate(overrides):
+        unknown = set(line) - set(options)
+        if unknown:
+            raise ValueError(f"{path}: line {n}: unknown {sorted(unknown)}")
+    return overrides
+
+
+def summarize(latest: dict[int, list[dict]]) -> dict[str, dict]:
+    totals: dict[str, dict] = {}
+    for stats in latest.values():
+        for device in stats:
+            total = totals.setdefault(
+                device['name'], {'lines': 0, 'count': 0, 'clients': 0}
+            )
+            total['lines'] += 1
+            total['count'] += device['count']
+            total['clients'] += device['clients']
+    return totals
+
+
+def report(totals: dict[str, dict], previous: dict[str, dict],
+           elapsed: float, alive: int, lines: int):
+    logging.info(f"[FLEET] lines alive {alive}/{lines}")
+    for name, total in sorted(totals.items()):
+        before = previous.get(name, {}).get('count', 0)
+        rate = (total['count'] - before) / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"[FLEET] {name}: lines {total['lines']} "
+            f"count {total['count']} ({rate:.1f}/s) "
+            f"clients {total['clients']}"
+        )
+
+
+def run_fleet(args):
+    options = {
+        key: value for key, value in vars(args).items() if key != 'func'
+    }
+    overrides = load_lines_config(args.lines_config, options)
+    max_port = LINE_MAX_PORT
+    for line in [options, *overrides]:
+        if 'fault_profile' in line:
+            faults.load_profile(line['fault_profile'])
+        # Ошибки описания линии видны сразу, а не в каждом процессе
+        if line.get('topology'):
+            topology = load_topology(Path(line['topology']))
+            max_port = max([max_port, *topology.ports])
+        elif 'agr_count' in line:
+            devices.check_agr_count(line['agr_count'])
+    last_port = args.port_base + (args.lines - 1) * args.port_step
+    if last_port + max_port > MAX_PORT:
+        raise ValueError(f"port offset {last_port} is out of range")
+    stats_queue = multiprocessing.Queue()
+    processes = []
+    for index in range(args.lines):
+        line_options = dict(options)
+        if index < len(overrides):
+            line_options.update(overrides[index])
+        port_offset = args.port_base + index * args.port_step
+        process = multiprocessing.Process(
+            target=line_worker, name=f"LINE_{index}", daemon=True,
+            args=(index, port_offset, line_options, stats_queue,
+                  logging.getLevelName(args.log_level), args.stats_interval)
+        )
+        process.start()
+        processes.append(process)
+        logging.info(f"[FLEET] LINE_{index} started with port offset "
+                     f"{port_offset} (pid {process.pid})")
+
+    latest: dict[int, list[dict]] = {}
+    previous: dict[str, dict] = {}
+    ready: dict[int, list[int]] = {}
+    started = last_report = monotonic()
+    try:
+        while any(process.is_alive() for process in processes):
+            try:
+                index, stats = stats_queue.get(timeout=args.stats_interval)
+            except Empty:
+                continue
+            if stats is None:
+                logging.error(f"[FLEET] LINE_{index} failed to start")
+                continue
+            if isinstance(stats, dict):
+                ready[index] = stats['ready']
+                if len(ready) == args.lines:
+                    line_emulator.signal_ready(
+                        args.ready_file,
+                        sorted(port for ports in ready.values()
+                               for port in ports)
+                    )
+                continue
+            latest[index] = stats
+            now = monotonic()
+            if now - last_report >= args.stats_interval:
+                alive = sum(process.is_alive() for process in processes)
+                totals = summarize(latest)
+                report(totals, previous, now - last_report,
+                       alive, args.lines)
+                previous = totals
+                last_report = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        alive = sum(process.is_alive() for process in processes)
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        totals = summarize(latest)
+        logging.info("[FLEET] total:")
+        report(totals, {}, monotonic() - started, alive, args.lines)
@@ -0,0 +1,139 @@
+import re
+import socket
+from enum import Enum
+from typing import Iterator
+
+
+# Команды статуса приходят без завершающего символа и могут идти
+# подряд в одном TCP-сегменте вместе с заданиями печати
+STATUS_COMMANDS = (
+    f"{chr(27)}!?".encode(), b"~S,CHECK", b"~S,LABEL", b"~HS", b"OUT @LABEL"
+)
+_STATUS = b"|".join(map(re.escape, STATUS_COMMANDS))
+STATUS_RE = re.compile(rb"(?:" + _STATUS + rb")")
+# Начало следующей команды или задания на новой строке внутри
+# построчного задания (TSPL/EZPL)
+NEXT_FRAME_RE = re.compile(
+    rb"\n[ \t\r]*(?:" + _STATUS + rb"|\^XA|\x1bA)"
+)
+WHITESPACE = b" \t\r\n"
+STATUS_MAX_LEN = max(map(len, STATUS_COMMANDS))
+
+
+class Dialect(Enum):
+    ZPL = 'ZPL'
+    ESC = 'ESC'
+    LINE = 'LINE'
+
+
+# Задания ZPL ограничены ^XA...^XZ, SBPL - <ESC>A...<ESC>Z,
+# остальные языки (TSPL, EZPL и т.п.) разбираются построчно
+TERMINATORS = {
+    Dialect.ZPL: (b"^XA", b"^XZ"),
+    Dialect.ESC: (b"\x1bA", b"\x1bZ"),
+}
+
+
+class FrameKind(Enum):
+    STATUS = 'STATUS'
+    JOB = 'JOB'
+
+
+class FrameReader:
+    def __init__(self, size: int = 4096, encoding: str = 'utf-8'):
+        self.size = size
+        self.encoding = encoding
+        self.buf = bytearray(size * 4)
+        self.view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+        # Позиция, с которой продолжать поиск конца незавершенного задания
+        self.scan_from = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _reserve(self, need: int):
+        if len(self.buf) - self.end >= need:
+            return
+        used = self.end - self.start
+        if self.start and used + need <= len(self.buf) // 2:
+            self.buf[:used] = bytes(self.view[self.start:self.end])
+        else:
+            self.view.release()
+            new_buf = bytearray(max(len(self.buf) * 2, used + need))
+            new_buf[:used] = self.buf[self.start:self.end]
+            self.buf = new_buf
+            self.view = memoryview(self.buf)
+        self.scan_from = max(0, self.scan_from - self.start)
+        self.start = 0
+        self.end = used
+
+    def recv_into(self, sock: socket.socket) -> int:
+        self._reserve(self.size)
+        n = sock.recv_into(self.view[self.end:], self.size)
+        self.end += n
+        return n
+
+    def feed(self, data: bytes):
+        self._reserve(len(data))
+        self.buf[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def _text(self, start: int, stop: int) -> str:
+        return str(self.view[start:stop], self.encoding, 'replace')
+
+    def _status_prefix(self, pos: int) -> bool:
+        if self.end - pos >= STATUS_MAX_LEN:
+            return False
+        tail = bytes(self.view[pos:self.end])
+        return any(c.startswith(tail) for c in STATUS_COMMANDS)
+
+    def frames(
+        self, final: bool = False
+    ) -> Iterator[tuple[FrameKind, Dialect | None, str]]:
+        buf = self.buf
+        while 1:
+            pos = self.start
+            end = self.end
+            while pos < end and buf[pos] in WHITESPACE:
+                pos += 1
+            self.start = pos
+            if pos == end:
+                self.start = self.end = self.scan_from = 0
+                return
+            status = STATUS_RE.match(buf, pos, end)
+            if status:
+                self.start = status.end()
+                yield FrameKind.STATUS, None, self._text(pos, self.start)
+                continue
+            if not final and self._status_prefix(pos):
+                return
+            for dialect, (opening, closing) in TERMINATORS.items():
+                if buf.startswith(opening, pos, end):
+                    stop = buf.find(
+                        closing, max(pos + len(opening), self.scan_from), end
+                    )
+                    if stop < 0:
+                        if not final:
+                            self.scan_from = max(pos, end - len(closing) + 1)
+                            return
+                        stop = end
+                    else:
+                        stop += len(closing)
+                    break
+            else:
+                dialect = Dialect.LINE
+                last_nl = buf.rfind(b"\n", pos, end)
+                if last_nl < 0:
+                    if not final:
+                        return
+                    stop = end
+                else:
+                    stop = last_nl + 1
+                following = NEXT_FRAME_RE.search(buf, pos, stop)
+                if following:
+                    stop = following.start() + 1
+            self.start = stop
+            self.scan_from = 0
+            yield FrameKind.JOB, dialect, self._text(pos, stop).strip()
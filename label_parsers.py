@@ -0,0 +1,125 @@
+import re
+from random import Random, randint
+from typing import Callable, Iterable
+
+from framing import Dialect
+
+
+GS = chr(29)
+QUOTE_ESCAPE = '~d034'
+
+
+class RowRule:
+    # Правило извлечения КМ из строки задания одного языка принтера.
+    # pattern - регулярное выражение ключевого слова, extract получает
+    # строку и совпадение и возвращает КМ. next_row - данные КМ
+    # находятся в следующей строке (EZPL XRB)
+    def __init__(self, name: str, pattern: str,
+                 extract: Callable[[str, re.Match], str] | None = None,
+                 next_row: bool = False):
+        self.name = name
+        self.pattern = pattern
+        self.extract = extract
+        self.next_row = next_row
+
+
+def _unquote(value: str) -> str:
+    if QUOTE_ESCAPE in value:
+        value = value.replace(QUOTE_ESCAPE, '"')
+    return value
+
+
+def _after_keyword(row: str, match: re.Match) -> str:
+    return _unquote(row[match.end():]).strip()
+
+
+def _tspl_field(row: str, match: re.Match) -> str:
+    # DMATRIX x,y,w,h,"data" / BARCODE x,y,"type",...,"data"
+    return _unquote(row.split(",", 5)[-1])[1:-1].strip()
+
+
+def _zpl_field(row: str, match: re.Match) -> str:
+    return match.group('zpl_data').strip()
+
+
+BARCODE_ASSIGN = RowRule('barcode_assign', r'BARCODE=', _after_keyword)
+TSPL = RowRule('tspl', r'DMATRIX|BARCODE ', _tspl_field)
+EZPL = RowRule('ezpl', r'XRB0,0,', next_row=True)
+BR = RowRule('br', r'BR,24,24(?:,2,5,250,0,1,)?', _after_keyword)
+ZPL = RowRule('zpl', r'\^FH\^FD_7e(?P<zpl_data>[^^\r\n]*)', _zpl_field)
+
+
+class LabelParser:
+    def __init__(self, rules: Iterable[RowRule]):
+        self.rules = {rule.name: rule for rule in rules}
+        # Одно скомпилированное выражение на язык: строка проверяется
+        # за один проход, правило определяется по имени группы
+        self.matcher = re.compile('|'.join(
+            f'(?P<{rule.name}>{rule.pattern})'
+            for rule in self.rules.values()
+        ))
+
+    def parse(self, text: str,
+              code_on_next_row: bool = False) -> tuple[list[str], bool]:
+        codes = []
+        search = self.matcher.search
+        rules = self.rules
+        for row in text.split('\n'):
+            if code_on_next_row:
+                code_on_next_row = False
+                code = row.strip()
+            else:
+                match = search(row)
+                if match is None:
+                    continue
+                rule = rules[match.lastgroup]
+                if rule.next_row:
+                    code_on_next_row = True
+                    continue
+                code = rule.extract(row.rstrip('\r'), match)
+            if code:
+                if code.startswith('~1'):
+                    code = code[2:]
+                codes.append(code)
+        return codes, code_on_next_row
+
+
+# Для отдельных GTIN к КМ дописывается весовой/объемный AI:
+# GTIN -> (AI, минимум, максимум)
+GTIN_AI_RULES = {
+    '05060367340398': ('3353', 100, 1000),
+    '07808631857726': ('3103', 100, 1000),
+}
+
+
+def gtin_of(code: str) -> str | None:
+    # AI 01 в начале КМ; перед ним может остаться символ FNC1 (ZPL _7e1)
+    if code.startswith('01'):
+        return code[2:16]
+    if code[1:3] == '01':
+        return code[3:17]
+    return None
+
+
+def apply_gtin_rules(code: str, rng: Random | None = None) -> str:
+    rule = GTIN_AI_RULES.get(gtin_of(code))
+    if rule is not None:
+        ai, low, high = rule
+        value = rng.randint(low, high) if rng else randint(low, high)
+        return f"{code}{GS}{ai}{value:06}"
+    return code
+
+
+LINE_RULES = [BARCODE_ASSIGN, TSPL, EZPL, BR, ZPL]
+
+PARSERS: dict[Dialect, LabelParser] = {
+    Dialect.ZPL: LabelParser([ZPL]),
+    Dialect.ESC: LabelParser(LINE_RULES),
+    Dialect.LINE: LabelParser(LINE_RULES),
+}
+
+
+def register_rule(rule: RowRule, dialects: Iterable[Dialect] = tuple(Dialect)):
+    for dialect in dialects:
+        parser = PARSERS[dialect]
+        PARSERS[dialect] = LabelParser([*parser.rules.values(), rule])
@@ -1,583 +1,481 @@
+import os
 import sys
-import socket
+import json
+import atexit
 import argparse
-from enum import Enum
-from threading import Thread
-from time import sleep
-from collections import deque
-from random import randint, choice
 from pathlib import Path
 import logging
 
+import eventlog
 
-PAUSE = 0.05
-
-class CodeQuality(Enum):
-    A = 'A'
-    B = 'B'
-    C = 'C'
-    D = 'D'
-    E = 'E'
-    F = 'F'
-
-
-GOOD_CODES = (CodeQuality.A.value, CodeQuality.B.value)
-
-
-BAD_CODES = (
-    CodeQuality.C.value,
-    CodeQuality.D.value,
-    CodeQuality.E.value,
-    CodeQuality.F.value
-)
-
-
-class PrinterEmul:
-    def __init__(self, name: str, dm_list: deque, port: int):
-        self.SIZE = 4096
-        self.name = name
-        self.FORMAT = "utf-8"
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server.setblocking(False)
-        self.port = port
-        self.server.bind(("", port))
-        self.server.listen(5)
-        self.dm_list = dm_list
-        self.thread = Thread(target=self.run)
-        self._t_server = Thread(target=self.run_login)
-        self.connections: dict[socket.socket, deque[str] | None] = {}
-
-    def receive_all(self, s: socket.socket):
-        data_all = b''
-        while True:
-            data = s.recv(self.SIZE)
-            if len(data) > 0:
-                data_all += data
-                if len(data) < self.SIZE:
-                    break
-            else:
-                break
-        return data_all.decode(self.FORMAT)
-
-    def start(self):
-        self.thread.start()
-        self._t_server.start()
-
-    def run_login(self):
-        while 1:
-            try:
-                connected_client, address = self.server.accept()
-                connected_client.setblocking(True)
-                self.connections[connected_client] = deque([])
-            except BlockingIOError:
-                continue
-
-    def run(self):
-        i = 1
-        while 1:
-            sleep(PAUSE)
-            for client, print_buffer in self.connections.copy().items():
-                try:
-                    msg_received = self.receive_all(client).strip()
-                except ConnectionAbortedError as e:
-                    logging.error(f"<{self.name}> ERROR: {client} {e}")
-                    del self.connections[client]
-                    continue
-                except Exception as e:
-                    logging.error(f"<{self.name}> ERROR: {client} {e}")
-                    del self.connections[client]
-                    continue
-                if print_buffer:
-                    try:
-                        new_code = print_buffer.popleft()
-                        self.dm_list.append(new_code)
-                        logging.debug(
-                            f"[#{i}] <{self.name}> "
-                            f"BUFFER_SIZE: {len(print_buffer)} "
-                            f"SENT TO CAM: {new_code}"
-                        )
-                    except IndexError:
-                        pass
-                if not msg_received:
-                    continue
-                logging.debug(f"[#{i}] <{self.name}> {msg_received}")
-                if msg_received == f"{chr(27)}!?":
-                    # logging.debug(f"<{self.name}> СТАТУС: Нормально")
-                    client.send('\x00'.encode())
-                elif msg_received == "~S,CHECK":
-                    client.send('00'.encode())
-                elif msg_received == "OUT @LABEL":
-                    client.send(f"{i}".encode())
-                elif msg_received == "~HS":
-                    # logging.debug(f"<{self.name}> БУФФЕР: {len(print_buffer)}")
-                    client.send(f"0,0,0,0,{len(print_buffer)}".encode())
-                elif msg_received == "~S,LABEL":
-                    client.send(f"{len(print_buffer)}".encode())
-                else:
-                    # logging.debug(f"<{self.name}> MSG: {msg_received}")
-                    msg_rows = msg_received.split("\n")
-                    for r, row in enumerate(msg_rows):
-                        dm_extracted = ''
-                        if 'BARCODE=' in row:
-                            row = row.replace('BARCODE=', '')
-                            row = row.replace('~d034', '"')
-                            dm_extracted = row.strip()
-                        elif 'DMATRIX' in row or "BARCODE " in row:
-                            params = row.split(",", 5)
-                            splitted = params[-1]
-                            splitted = splitted.replace('~d034', '"')
-                            dm_extracted = splitted[1:-1].strip()
-                        elif 'XRB0,0,' in row:
-                            row = msg_rows[r + 1]
-                            dm_extracted = row.strip()
-                        elif 'BR,24,24' in row:
-                            row = row.replace('BR,24,24,2,5,250,0,1,', '')
-                            row = row.replace('~d034', '"')
-                            dm_extracted = row.strip()
-                        elif '^FH^FD_7e' in row:
-                            row = row.replace('^FH^FD_7e', '')
-                            row = row.replace('^FS', '')
-                            dm_extracted = row.strip()
-                        if dm_extracted:
-                            if dm_extracted.startswith("~1"):
-                                dm_extracted = dm_extracted[2:]
-                            if '05060367340398' in dm_extracted:
-                                volume = randint(100, 1000)
-                                dm_extracted = (
-                                    f"{dm_extracted}{chr(29)}3353{volume:06}"
-                                )
-                            elif '07808631857726' in dm_extracted:
-                                weight = randint(100, 1000)
-                                dm_extracted = (
-                                    f"{dm_extracted}{chr(29)}3103{weight:06}"
-                                )
-                            logging.info(f"[#{i}] <{self.name}> "
-                                         f"PRINTED: {dm_extracted}")
-                            print_buffer.append(dm_extracted)
-                            i += 1
-
-
-class FilePrinterEmul:
-    def __init__(self, name, dm_list: deque, dm_file_path: Path):
-        self.name = name
-        self.dm_list = dm_list
-        self.thread = Thread(target=self.run)
-        self.dm_file_path = dm_file_path
-
-    def start(self):
-        self.thread.start()
-
-    def run(self):
-        with open(self.dm_file_path, 'r') as f:
-            sleep(5)
-            for line in f:
-                self.dm_list.append(line.strip())
-                sleep(0.02)
-
-
-class TcpExchanger:
-    def __init__(
-        self, name: str,
-        codes_to_send: deque,
-        transfer_buffer: list[deque],
-        listen_port: int = 23,
-        timeout: float = 0.001,
-        can_stop: bool = False,
-        gen_errors: bool = False,
-        error_percent: int = 2,
-        stack=1,
-        drop_dm_percent: int = 0,
-        add_code_quality: bool = False,
-        bad_codes_percent: int = 0
-    ):
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.port = listen_port
-        self.server.bind(("", listen_port))
-        self.server.listen(5)
-        self.connections = []
-        self.can_stop = can_stop
-        self.codes = codes_to_send
-        self.transfer_buffer = transfer_buffer
-        self.timeout = timeout
-        self.name = name
-        self.gen_errors = gen_errors
-        self.add_code_quality = add_code_quality
-        self.bad_codes_percent = bad_codes_percent
-        self.error_percent = error_percent
-        self.thread = Thread(target=self.run)
-        self._t_server = Thread(target=self.run_login)
-        self.stack = stack
-        self.drop_dm_percent = drop_dm_percent
-        self.delay = False
-        self.stack_pool = []
-
-    def start(self, delay=False):
-        self.delay = delay
-        self.thread.start()
-        self._t_server.start()
-
-    def run_login(self):
-        while 1:
-            try:
-                connected_client, address = self.server.accept()
-                connected_client.setblocking(True)
-                self.connections.append(connected_client)
-            except BlockingIOError:
-                pass
-
-    def run(self):
-        i = 0
-        while 1:
-            sleep(PAUSE)
-            if self.connections:
-                if not self.codes:
-                    continue
-                orig_code = None
-                if self.gen_errors and randint(0, 100) <= self.error_percent:
-                    if randint(0, 1):
-                        message = 'error'
-                    else:
-                        message = self.codes.popleft()
-                        orig_code = message
-                        message = "\n\r".join([message, message])
-                else:
-                    message = self.codes.popleft()
-                    orig_code = message
-                    if self.add_code_quality:
-                        if randint(0, 100) <= self.bad_codes_percent:
-                            message += f'@{choice(BAD_CODES)}'
-                        else:
-                            message += f'@{choice(GOOD_CODES)}'
-                self.stack_pool.append(message)
-                if len(self.stack_pool) == self.stack:
-                    message = "\n\r".join(self.stack_pool)
-                    self.stack_pool.clear()
-                else:
-                    continue
-                if (
-                    self.drop_dm_percent and randint(0, 100) <=
-                    self.drop_dm_percent
-                ):
-                    logging.info(
-                        f"[{self.name}]<{len(self.codes)}> "
-                        f"DROPPED: {message.strip()}"
-                    )
-                else:
-                    for client in self.connections.copy():
-                        try:
-                            client.send(bytes(f"{message}\n\r", 'utf-8'))
-                            logging.info(
-                                f"[{self.name}]<{len(self.codes)}> "
-                                f"SENT: {message.strip()}"
-                            )
-                        except ConnectionAbortedError:
-                            continue
-                        except Exception as e:
-                            logging.warning(
-                                f"[{self.name}]<{len(self.codes)}>"
-                                f" ERROR: {client} {e}"
-                            )
-                            self.connections.remove(client)
-
-                if self.transfer_buffer:
-                    if orig_code is not None:
-                        if self.add_code_quality:
-                            orig_code = orig_code[:-2]
-                        self.transfer_buffer[i].append(orig_code)
-                        i += 1
-                        if i >= len(self.transfer_buffer):
-                            i = 0
-
-
-class SerialisationSetup:
-    def __init__(self, printer_port: int, camera_port: int,
-                 gen_errors: bool = False, error_percent: int = 2,
-                 drop_dm_percent: int = 0,
-                 read_interval: float = 0.15,
-                 add_code_quality: bool = False,
-                 bad_codes_percent: int = 0):
-        self.agr_buffer = list()
-        self.dm_list = deque([])
-        self.dm_printer = PrinterEmul(
-            'PRNSER', self.dm_list, printer_port
-        )
-        self.dm_camera = TcpExchanger(
-            name="DMSER",
-            timeout=read_interval,
-            codes_to_send=self.dm_list,
-            transfer_buffer=self.agr_buffer,
-            listen_port=camera_port,
-            gen_errors=gen_errors,
-            error_percent=error_percent,
-            drop_dm_percent=drop_dm_percent,
-            add_code_quality=add_code_quality,
-            bad_codes_percent=bad_codes_percent
-        )
-
-    def run(self):
-        logging.info(f"Started DM printer at port {self.dm_printer.port}...")
-        self.dm_printer.start()
-        logging.info(f"Started DM camera at port {self.dm_camera.port}...")
-        self.dm_camera.start(delay=True)
-
-
-class SerialisationFromFileSetup:
-    def __init__(self, camera_port: int, gen_errors: bool = False,
-                 error_percent: int = 2, drop_dm_percent: int = 0,
-                 read_interval: float = 0.15,
-                 add_code_quality: bool = False,
-                 bad_codes_percent: int = 0):
-        self.agr_buffer = list()
-        self.dm_list = deque([])
-        if getattr(sys, 'frozen', False):
-            cur_path = Path(sys.executable).parents[0]
-        else:
-            cur_path = Path(__file__).parents[0]
-
-        path_out = cur_path / 'dm.csv'
-        self.dm_file_path = path_out
-        self.dm_printer = FilePrinterEmul(
-            'PRNSER', self.dm_list, self.dm_file_path
-        )
-        self.dm_camera = TcpExchanger(
-            name="DMSER",
-            codes_to_send=self.dm_list,
-            transfer_buffer=self.agr_buffer,
-            timeout=read_interval,
-            listen_port=camera_port,
-            gen_errors=gen_errors,
-            error_percent=error_percent,
-            drop_dm_percent=drop_dm_percent,
-            add_code_quality=add_code_quality,
-            bad_codes_percent=bad_codes_percent
-        )
-
-    def run(self):
-        logging.info(f"DM source file path {self.dm_file_path}...")
-        self.dm_printer.start()
-        logging.info(f"Started DM camera at port {self.dm_camera.port}...")
-        self.dm_camera.start()
-
-
-class AggregationVerificationSetup:
-    def __init__(
-        self,
-        printer_port: int,
-        camera_port: int,
-        read_interval: float = 0.05
-    ):
-        self.dm_list = deque([])
-        self.dm_printer = PrinterEmul('PRNAGR', self.dm_list, printer_port)
-        self.dm_camera = TcpExchanger(
-            name="VERIF",
-            codes_to_send=self.dm_list,
-            can_stop=True,
-            listen_port=camera_port,
-            timeout=read_interval,
-            gen_errors=False,
-            transfer_buffer=[]
-        )
-
-    def run(self):
-        logging.info("Started Aggregation printer at "
-                     f"port {self.dm_printer.port}...")
-        self.dm_printer.start()
-        logging.info("Started Aggregation verification camera "
-                     f"at port {self.dm_camera.port}...")
-        self.dm_camera.start()
-
-
-class AggregationSetup:
-    def __init__(self, start_port: int, agr_buffer: list[deque],
-                 count: int = 1, read_interval: float = 0.05):
-        self.agr_cam_list = dict[str, TcpExchanger]()
-        self.start_port = start_port
-        self.agr_buffer = agr_buffer
-        self.count = count
-        self.default_timeout = read_interval
-    
-    def gen_cameras(self):
-        for i in range(self.count):
-            self.agr_buffer.append(deque([]))
-            cam_name = f"AGR_{i}"
-            self.agr_cam_list[cam_name] = TcpExchanger(
-                name=cam_name, codes_to_send=self.agr_buffer[i],
-                listen_port=self.start_port + i, timeout=self.default_timeout,
-                transfer_buffer=[], stack=6
-            )
-
-    def run(self):
-        self.gen_cameras()
-        for camera, camera_obj in self.agr_cam_list.items():
-            logging.info(f"Starting aggregation multicamera {camera} at "
-                         f"port {camera_obj.port}...")
-            camera_obj.start(delay=True)
-
-
-class PalletPrinter:
-    def __init__(self, port: int, name: str):
-        self.data = deque([])
-        self.printer = PrinterEmul(name, self.data, port)
-        self.name = name
-
-    def run(self):
-        logging.info(f"Starting {self.name} printer at port"
-                     f" {self.printer.port}..")
-        self.printer.start()
-
-
-class RefubrishingSetup:
-    def __init__(self, camera_port: int, dm_file: Path):
-        self.dm_file = dm_file
-        self.dm_list = deque([])
-        self.dm_camera = TcpExchanger(
-            name="DMREF",
-            codes_to_send=self.dm_list,
-            listen_port=camera_port,
-            transfer_buffer=[]
-        )
-
-    def load_dm_from_file(self):
-        with open(self.dm_file, 'r') as f:
-            for line in f:
-                self.dm_list.append(line.strip())
-        return len(self.dm_list)
-
-    def run(self):
-        logging.info(f"Started DM camera at port {self.dm_camera.port}...")
-        self.dm_camera.start()
 
+STATS_INTERVAL = 5.0
 
-def main_ser(args):
-    agr_count = args.agr_count
-    gen_err = bool(args.gen_err)
-    perc_err = args.perc_err
-    dm_file = args.dm_file
-    drop_dm = args.drop_dm
-    read_interval = args.read_interval
-    add_code_quality = bool(args.add_code_quality)
-    bad_code_quality_percent = args.bad_code_quality_percent
-
-    if dm_file:
-        sr = SerialisationFromFileSetup(
-            23,
-            gen_errors=gen_err,
-            error_percent=perc_err,
-            drop_dm_percent=drop_dm,
-            read_interval=read_interval,
-            add_code_quality=add_code_quality,
-            bad_codes_percent=bad_code_quality_percent
-        )
-    else:
-        sr = SerialisationSetup(
-            9101, 23,
-            gen_errors=gen_err,
-            error_percent=perc_err,
-            drop_dm_percent=drop_dm,
-            read_interval=read_interval,
-            add_code_quality=add_code_quality,
-            bad_codes_percent=bad_code_quality_percent,
-
-        )
-    sr.run()
-
-    if agr_count:
-        agr_setup = AggregationSetup(
-            27, sr.agr_buffer, agr_count, read_interval=read_interval
-        )
-        agr_setup.run()
-        agr_ver = AggregationVerificationSetup(
-            9102, 32, read_interval=read_interval
-        )
-        agr_ver.run()
-    else:
-        PalletPrinter(9102, "LEVEL_0").run()
-    PalletPrinter(9103, "LEVEL_1").run()
-    PalletPrinter(9104, "LEVEL_2").run()
-    PalletPrinter(9105, "LEVEL_3").run()
-
-
-def main_refub(_):
-    if getattr(sys, 'frozen', False):
-        cur_path = Path(sys.executable).parents[0]
-    else:
-        cur_path = Path(__file__).parents[0]
 
-    path_out = cur_path / 'dm.csv'
+def main_ser(args):
+    import code_index
+    import tracing
+    from devices import line_ports, start_ser_line
+    from event_loop import get_event_loop
+    setup_recorders(args)
+    sr = start_ser_line(args)
+    if sr is None:
+        return
+    try:
+        signal_ready(args.ready_file, line_ports(args))
+        get_event_loop().run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tracing.tracer():
+            tracing.tracer().report()
+        if code_index.index():
+            code_index.index().report()
+        if args.topology:
+            sr.report_positions()
+        elif args.dm_file:
+            logging.info(f'Позиция в {sr.dm_file_path}: '
+                         f'{sr.dm_printer.source.position}')
+
+
+def main_refub(args):
+    from devices import (
+        RefubrishingSetup, dm_file_path, line_ports, start_metrics,
+        start_topology
+    )
+    from event_loop import get_event_loop
+    if args.topology:
+        setup_recorders(args)
+        line = start_topology(args)
+        try:
+            signal_ready(args.ready_file, line_ports(args))
+            get_event_loop().run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            line.report_positions()
+        return
+    path_out = dm_file_path()
     if not path_out.exists():
         logging.error(f'{path_out} does not exist')
         return
-    
-    rf = RefubrishingSetup(23, path_out)
+
+    setup_recorders(args)
+    rf = RefubrishingSetup(23, path_out, args.offset)
     dms = rf.load_dm_from_file()
-    logging.info(f'Загружено {dms} км для отбраковки.')
+    logging.info(f'Найдено около {dms} км для отбраковки '
+                 f'(с позиции {args.offset}).')
     rf.run()
+    start_metrics(args.metrics_port)
+    try:
+        signal_ready(args.ready_file, line_ports(args))
+        get_event_loop().run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info(f'Позиция в {path_out}: {rf.dm_list.position}')
 
 
-if __name__ == '__main__':
+def main_fleet(args):
+    from fleet import run_fleet
+    run_fleet(args)
+
+
+def main_replay(args):
+    from replay import run_replay
+    run_replay(args)
+
+
+def main_generate(args):
+    from time import perf_counter
+    from codegen import CodeGenerator, write_corpus
+    generator = CodeGenerator(
+        args.gtins, args.seed, start=args.serial_start, tail=args.tail,
+        weights=bool(args.weights)
+    )
+    started = perf_counter()
+    written = write_corpus(args.file, generator, args.count)
+    elapsed = perf_counter() - started
+    logging.info(f"{written} КМ записано в {args.file} за {elapsed:.2f} с "
+                 f"({written / elapsed:.0f} КМ/с)")
+
+
+def signal_ready(path: Path | None, ports: list[int]):
+    # Все порты слушают: стенд может подключаться, не выжидая наугад.
+    # Файл (если задан) создается целиком через os.replace до строки
+    # READY в stdout и удаляется при выходе
+    info = json.dumps({'pid': os.getpid(), 'ports': ports})
+    if path is not None:
+        tmp = path.with_name(f"{path.name}.tmp")
+        tmp.write_text(info, encoding='utf-8')
+        os.replace(tmp, path)
+        atexit.register(path.unlink, missing_ok=True)
+    sys.stdout.write(f"READY {info}\n")
+    sys.stdout.flush()
+
+
+def setup_logging(level: int = logging.INFO, prefix: str = ''):
     root = logging.getLogger()
-    root.setLevel(logging.DEBUG)
+    root.setLevel(level)
+    # Процесс линии парка наследует обработчики родителя
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    prefix = f" [{prefix}]" if prefix else ''
     formatter = logging.Formatter(fmt='%(asctime)s [%(name)s][%(levelname)s]:'
-                                  ' %(message)s', datefmt='%d.%m.%Y %H:%M:%S')
+                                  f'{prefix} %(message)s',
+                                  datefmt='%d.%m.%Y %H:%M:%S')
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setFormatter(formatter)
-    root.addHandler(stream_handler)
-
-    parser = argparse.ArgumentParser(
-        prog='Эмулятор промышленной линии',
-        description='Эмулирует работу промышленной линии на '
-        'производстве маркированной продукции',
-        epilog='help - информация по использованию'
-    )
-    subparsers = parser.add_subparsers(help="Параметры запуска")
-    # Парсер настроек режима сериализации
-    parser_s = subparsers.add_parser('s', help='Запуск в режиме сериализации')
-    parser_s.add_argument(
+    # Запись в stdout идет в отдельном потоке и не задерживает устройства
+    root.addHandler(eventlog.start_queue_logging(stream_handler))
+
+
+def with_suffix(path: Path | None, suffix: str) -> Path | None:
+    if path is None or not suffix:
+        return path
+    return path.with_name(f"{path.stem}{suffix}{path.suffix}")
+
+
+def setup_recorders(args, suffix: str = ''):
+    import capture
+    eventlog.configure(args.log_rate, with_suffix(args.event_log, suffix))
+    capture.configure(with_suffix(args.capture, suffix))
+
+
+def add_ser_arguments(parser: argparse.ArgumentParser):
+    # Модули устройств загружаются только для режимов с линией
+    import faults
+    import schedules
+    import tracing
+    from channel import CHANNEL_SIZE, Overflow
+    from code_index import INDEX_CAPACITY, IndexMode
+    from codegen import GTINS
+    from devices import AGR_STACK, MAX_AGR_COUNT, Backpressure
+    from pacing import PaceMode
+    from wal import COMMIT_INTERVAL
+    parser.add_argument(
         '-f', '--dm_file', choices=(0, 1), required=False, type=int,
         default=0,
         help='Передавать марки из файла dm.csv. '
              'Используется для эмуляции линии без печати КМ.'
     )
-    parser_s.add_argument(
-        '-a', '--agr_count', choices=range(0, 10), required=False, type=int,
-        default=3, help='Количество камер агрегации от 0 до 9'
+    parser.add_argument(
+        '-fo', '--file_offset', required=False, type=int, default=0,
+        help='Позиция (байт) в dm.csv, с которой продолжить передачу'
     )
-    parser_s.add_argument(
+    parser.add_argument(
+        '-gn', '--generate', required=False, type=int, default=0,
+        help='Синтезировать КМ вместо печати MES и dm.csv: количество '
+             'кодов, -1 - без ограничения'
+    )
+    parser.add_argument(
+        '-gt', '--gtins', nargs='+', required=False, default=list(GTINS),
+        help='GTIN синтезируемых КМ; для GTIN-8/12/13 контрольная цифра '
+             'вычисляется'
+    )
+    parser.add_argument(
+        '-gs', '--serial_start', required=False, type=int, default=0,
+        help='Первый серийный номер синтезируемых КМ (для линий парка '
+             'задайте разные в --lines_config)'
+    )
+    parser.add_argument(
+        '-a', '--agr_count', choices=range(0, MAX_AGR_COUNT + 1),
+        required=False, type=int, default=3,
+        help=f'Количество камер агрегации от 0 до {MAX_AGR_COUNT}'
+    )
+    parser.add_argument(
+        '-ak', '--agr_stack', nargs='+', required=False, type=int,
+        default=[AGR_STACK],
+        help='КМ в коробе камеры агрегации; можно указать для каждой '
+             'камеры, последний размер повторяется для остальных'
+    )
+    parser.add_argument(
         '-g', '--gen_err', choices=(0, 1), required=False, type=int,
         default=0, help='Генерировать ошибки сериализации: 0 - нет, 1 - да'
     )
-    parser_s.add_argument(
+    parser.add_argument(
         '-e', '--perc_err', choices=range(1, 100), required=False, type=int,
         default=2, help='Процентр брака сериализации'
     )
-    parser_s.add_argument(
+    parser.add_argument(
         '-d', '--drop_dm', choices=range(0, 6), required=False, type=int,
         default=0, help='Процентр пропуска кодов на сериализации'
     )
-    parser_s.add_argument(
+    parser.add_argument(
         '-r', '--read_interval', required=False, type=float,
         default=0.15,
         help='Интервал передачи кодов маркировки (сек), например 0.15 = 150мс'
     )
-    parser_s.add_argument(
+    parser.add_argument(
+        '-rm', '--read_mode', choices=[m.value for m in PaceMode],
+        required=False, default=PaceMode.FIXED.value,
+        help='Темп передачи кодов: fixed - с интервалом --read_interval, '
+             'consumer - так быстро, как читает клиент'
+    )
+    parser.add_argument(
+        '-bp', '--backpressure', choices=[b.value for b in Backpressure],
+        required=False, default=Backpressure.BLOCK.value,
+        help='Поведение камеры при переполнении очереди клиента: '
+             'block - ждать, drop_oldest - выбрасывать старые сообщения, '
+             'disconnect - отключать медленного клиента'
+    )
+    parser.add_argument(
+        '-bs', '--buffer_size', required=False, type=int,
+        default=CHANNEL_SIZE,
+        help='Емкость буферов КМ между принтером и камерами'
+    )
+    parser.add_argument(
+        '-bo', '--buffer_overflow', choices=[o.value for o in Overflow],
+        required=False, default=Overflow.BLOCK.value,
+        help='Поведение при переполнении буфера КМ: block - останавливать '
+             'передачу, drop_oldest/drop_newest - терять старые/новые КМ'
+    )
+    parser.add_argument(
         '-q', '--add_code_quality', choices=(0, 1), required=False, type=int,
         default=0,
         help='Добавлять флаг качества кода в конец КМ: 0 - нет, 1 - да'
     )
-    parser_s.add_argument(
+    parser.add_argument(
         '-qe', '--bad_code_quality_percent',
         choices=range(1, 100), required=False, type=float,
         default=0.15, help='Процент кодов плохого качества (ниже B)'
     )
-    parser_s.set_defaults(func=main_ser)
+    parser.add_argument(
+        '-tr', '--trace', choices=(0, 1), required=False, type=int,
+        default=0,
+        help='Трассировать путь каждого КМ по линии: задержки этапов '
+             'в /metrics, зависшие и потерянные КМ в журнале'
+    )
+    parser.add_argument(
+        '-st', '--stuck_after', required=False, type=float,
+        default=tracing.STUCK_AFTER,
+        help='Через сколько секунд без продвижения КМ считается зависшим'
+    )
+    parser.add_argument(
+        '-ix', '--index', choices=[m.value for m in IndexMode],
+        required=False, default=IndexMode.OFF.value,
+        help='Индекс уникальности всех КМ линии: повторы печати и '
+             'отправки, неотправленные КМ в /metrics и журнале при '
+             'остановке. hash - точный, bloom - компактнее, с ложными '
+             'повторами'
+    )
+    parser.add_argument(
+        '-ic', '--index_capacity', required=False, type=int,
+        default=INDEX_CAPACITY,
+        help='Сколько КМ ожидается за запуск: под это число выделяется '
+             'индекс'
+    )
+    parser.add_argument(
+        '-lp', '--load_profile', required=False, default=None,
+        help='График нагрузки камер и источников КМ (файл, генератор) '
+             'вместо постоянного read_interval: '
+             f'{", ".join(schedules.PROFILES)} или JSON-файл с участками. '
+             'По окончании участка в журнал пишется достигнутая скорость'
+    )
+    parser.add_argument(
+        '-wl', '--wal', required=False, type=Path, default=None,
+        help='Каталог журнала буферов линии: после сбоя или остановки '
+             'КМ в буферах, очереди печати и позиции источников '
+             'восстанавливаются из него. По умолчанию не ведется'
+    )
+    parser.add_argument(
+        '-wc', '--wal_commit', required=False, type=float,
+        default=COMMIT_INTERVAL,
+        help='Раз во сколько секунд журнал дописывается на диск (fsync): '
+             'больше - дешевле, но при сбое теряется больше перемещений'
+    )
+    parser.add_argument(
+        '-sd', '--seed', required=False, type=int, default=None,
+        help='Зерно генератора сбоев и синтезируемых КМ: при том же '
+             'зерне сбои и коды повторяются. '
+             'По умолчанию случайное, выводится в журнал'
+    )
+    parser.add_argument(
+        '-fp', '--fault_profile', required=False, default='flat',
+        help=f'Сценарий сбоев: {", ".join(faults.PROFILES)} '
+             'или JSON-файл с параметрами FaultProfile'
+    )
+    add_common_arguments(parser)
 
-    # Парсер для активации режима отбраковки
-    parser_r = subparsers.add_parser('r', help='Запуск в режиме отбраковки')
-    parser_r.set_defaults(func=main_refub)
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '-m', '--metrics_port', required=False, type=int, default=0,
+        help='Порт HTTP-эндпоинта /metrics (формат Prometheus), 0 - выключен'
+    )
+    parser.add_argument(
+        '-lr', '--log_rate', required=False, type=float,
+        default=eventlog.EVENT_LOG_RATE,
+        help='Сколько событий SENT/PRINTED в секунду устройство пишет '
+             'в журнал, 0 - без ограничения'
+    )
+    parser.add_argument(
+        '-el', '--event_log', required=False, type=Path, default=None,
+        help='Файл журнала событий КМ (JSONL), в него пишутся все события'
+    )
+    parser.add_argument(
+        '-cf', '--capture', required=False, type=Path, default=None,
+        help='Записывать трафик MES с устройствами в файл '
+             '(для воспроизведения командой p)'
+    )
+    parser.add_argument(
+        '-tp', '--topology', required=False, type=Path, default=None,
+        help='Описание линии (TOML/JSON/YAML): устройства, порты, буферы, '
+             'размеры пачек и сбои. Заменяет встроенную линию и ее '
+             'параметры командной строки'
+    )
+    parser.add_argument(
+        '-rf', '--ready_file', required=False, type=Path, default=None,
+        help='Файл, который создается, когда все порты слушают '
+             '(JSON с pid и портами). В stdout при этом выводится READY'
+    )
+
+
+def add_fleet_arguments(parser: argparse.ArgumentParser):
+    add_ser_arguments(parser)
+    parser.add_argument(
+        '-n', '--lines', required=False, type=int, default=2,
+        help='Количество линий'
+    )
+    parser.add_argument(
+        '-ps', '--port_step', required=False, type=int, default=100,
+        help='Сдвиг портов каждой следующей линии'
+    )
+    parser.add_argument(
+        '-pb', '--port_base', required=False, type=int, default=0,
+        help='Сдвиг портов первой линии'
+    )
+    parser.add_argument(
+        '-lc', '--lines_config', required=False, type=Path, default=None,
+        help='JSON-список с настройками отдельных линий, '
+             'например [{"read_interval": 0.05}, {"agr_count": 0}]'
+    )
+    parser.add_argument(
+        '-si', '--stats_interval', required=False, type=float,
+        default=STATS_INTERVAL,
+        help='Период сбора статистики с линий (сек)'
+    )
+    parser.add_argument(
+        '-ll', '--log_level', required=False, default='WARNING',
+        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+        help='Уровень журнала процессов линий'
+    )
+
+
+def add_refub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '-o', '--offset', required=False, type=int, default=0,
+        help='Позиция (байт) в dm.csv, с которой продолжить отбраковку'
+    )
+    add_common_arguments(parser)
+
+
+def add_generate_arguments(parser: argparse.ArgumentParser):
+    from codegen import GTINS, TAILS
+    parser.add_argument(
+        'file', type=Path,
+        help='Файл корпуса КМ в формате dm.csv (перезаписывается)'
+    )
+    parser.add_argument(
+        '-c', '--count', required=False, type=int, default=1000000,
+        help='Количество КМ'
+    )
+    parser.add_argument(
+        '-gt', '--gtins', nargs='+', required=False, default=list(GTINS),
+        help='GTIN КМ; для GTIN-8/12/13 контрольная цифра вычисляется'
+    )
+    parser.add_argument(
+        '-gs', '--serial_start', required=False, type=int, default=0,
+        help='Первый серийный номер'
+    )
+    parser.add_argument(
+        '-tl', '--tail', choices=list(TAILS), required=False,
+        default='full',
+        help='Криптохвост: full - 91 и 92, short - 93'
+    )
+    parser.add_argument(
+        '-w', '--weights', choices=(0, 1), required=False, type=int,
+        default=1,
+        help='Добавлять весовые AI (3103, 3353) для GTIN из GTIN_AI_RULES'
+    )
+    parser.add_argument(
+        '-sd', '--seed', required=False, type=int, default=None,
+        help='Зерно: при том же зерне корпус повторяется'
+    )
+
+
+def add_replay_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('file', type=Path, help='Файл записи')
+    parser.add_argument(
+        '-ss', '--session', required=False, type=int, default=-1,
+        help='Номер сессии в файле, по умолчанию последняя'
+    )
+    parser.add_argument(
+        '-as', '--role', choices=('mes', 'device'), required=False,
+        default='mes',
+        help='mes - передавать устройствам записанные запросы MES, '
+             'device - отдавать MES записанные ответы устройств'
+    )
+    parser.add_argument(
+        '-H', '--host', required=False, default='127.0.0.1',
+        help='Адрес устройств (mes) или адрес прослушивания (device)'
+    )
+    parser.add_argument(
+        '-po', '--port_offset', required=False, type=int, default=0,
+        help='Сдвиг записанных портов'
+    )
+    parser.add_argument(
+        '-dv', '--device', required=False, action='append', default=None,
+        help='Воспроизводить только это устройство (можно несколько раз)'
+    )
+    parser.add_argument(
+        '-sp', '--speed', required=False, type=float, default=1.0,
+        help='Скорость: 1 - исходные интервалы, 2 - вдвое быстрее, '
+             '0 - так быстро, как возможно'
+    )
+
+
+if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        # Процессы парка в замороженной сборке под Windows
+        import multiprocessing
+        multiprocessing.freeze_support()
+    setup_logging()
+    atexit.register(eventlog.stop_queue_logging)
+
+    parser = argparse.ArgumentParser(
+        prog='Эмулятор промышленной линии',
+        description='Эмулирует работу промышленной линии на '
+        'производстве маркированной продукции',
+        epilog='help - информация по использованию'
+    )
+    subparsers = parser.add_subparsers(help="Параметры запуска")
+    commands = (
+        ('s', 'Запуск в режиме сериализации', add_ser_arguments, main_ser),
+        # Несколько линий в отдельных процессах
+        ('f', 'Запуск нескольких линий сериализации в отдельных процессах',
+         add_fleet_arguments, main_fleet),
+        ('r', 'Запуск в режиме отбраковки', add_refub_arguments, main_refub),
+        ('p', 'Воспроизведение трафика, записанного с --capture',
+         add_replay_arguments, main_replay),
+        ('g', 'Генерация корпуса синтетических КМ для -f 1 и описаний '
+              'линий', add_generate_arguments, main_generate),
+    )
+    # Параметры (и модули устройств, нужные для их значений по умолчанию)
+    # добавляются только выбранному режиму: --help и p не загружают линию
+    chosen = sys.argv[1] if len(sys.argv) > 1 else None
+    for name, help_text, add_arguments, func in commands:
+        command_parser = subparsers.add_parser(name, help=help_text)
+        if name == chosen:
+            add_arguments(command_parser)
+        command_parser.set_defaults(func=func)
 
     cmd_arguments = parser.parse_args()
-    try:
-        cmd_arguments.func(cmd_arguments)
-    except AttributeError:
+    ready_file = getattr(cmd_arguments, 'ready_file', None)
+    if ready_file is not None:
+        # Файл прошлого запуска не должен сойти за готовность этого
+        ready_file.unlink(missing_ok=True)
+    if not hasattr(cmd_arguments, 'func'):
         parser.print_help()
         parser.exit()
+    cmd_arguments.func(cmd_arguments)
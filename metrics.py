@@ -0,0 +1,296 @@
+import logging
+import socket
+from bisect import bisect_left
+from functools import partial
+from typing import Callable, Iterator
+
+from event_loop import EventLoop, get_event_loop, listen_socket
+
+
+# Границы корзин гистограмм задержек (сек)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+)
+MAX_REQUEST = 8192
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return f'{{{pairs}}}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        yield f'{name}{labels} {_format_value(self.value)}'
+
+
+class Gauge:
+    # Значение задается set() или вычисляется при чтении метрик, чтобы
+    # не обновлять глубину очередей на каждом коде
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function: Callable[[], float] | None = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        yield f'{name}{labels} {_format_value(self.get())}'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Последняя ячейка - значения больше старшей границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        # Корзины в формате Prometheus накопительные
+        prefix = labels[:-1] + ',' if labels else '{'
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            cumulative += count
+            yield (f'{name}_bucket{prefix}le="{_format_value(bound)}"}} '
+                   f'{cumulative}')
+        yield f'{name}_sum{labels} {_format_value(self.sum)}'
+        yield f'{name}_count{labels} {self.count}'
+
+
+class MetricFamily:
+    def __init__(self, name: str, help_text: str, kind: str,
+                 factory: Callable, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.factory = factory
+        self.labelnames = labelnames
+        self.children: dict[tuple, Counter | Gauge | Histogram] = {}
+
+    def labels(self, *values):
+        # Устройства сохраняют полученный объект и обновляют его напрямую,
+        # без поиска по меткам на каждом коде
+        if len(values) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name}: expected labels {self.labelnames}"
+            )
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.factory()
+        return child
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for values, child in self.children.items():
+            yield from child.samples(
+                self.name, _format_labels(self.labelnames, values)
+            )
+
+
+class Registry:
+    def __init__(self):
+        self.families: dict[str, MetricFamily] = {}
+
+    def _family(self, name: str, help_text: str, kind: str,
+                factory: Callable, labelnames: tuple) -> MetricFamily:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = MetricFamily(
+                name, help_text, kind, factory, labelnames
+            )
+        elif family.kind != kind or family.labelnames != labelnames:
+            raise ValueError(f"{name}: already registered as {family.kind}")
+        return family
+
+    def counter(self, name: str, help_text: str,
+                labelnames: tuple = ()) -> MetricFamily:
+        return self._family(name, help_text, 'counter', Counter, labelnames)
+
+    def gauge(self, name: str, help_text: str,
+              labelnames: tuple = ()) -> MetricFamily:
+        return self._family(name, help_text, 'gauge', Gauge, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> MetricFamily:
+        return self._family(
+            name, help_text, 'histogram', lambda: Histogram(buckets),
+            labelnames
+        )
+
+    def render(self) -> str:
+        lines = []
+        for family in self.families.values():
+            lines.extend(family.render())
+        lines.append('')
+        return '\n'.join(lines)
+
+
+REGISTRY = Registry()
+
+DEVICE = ('device',)
+LABELS_PARSED = REGISTRY.counter(
+    'emulator_labels_parsed_total', 'КМ, извлеченные из заданий печати',
+    DEVICE
+)
+CODES_SENT = REGISTRY.counter(
+    'emulator_codes_sent_total', 'КМ, переданные камерой клиентам', DEVICE
+)
+CODES_DROPPED = REGISTRY.counter(
+    'emulator_codes_dropped_total',
+    'Потерянные КМ: drop_dm - пропуск камерой, '
+    'backpressure - вытеснены из очереди медленного клиента',
+    ('device', 'reason')
+)
+ERRORS_INJECTED = REGISTRY.counter(
+    'emulator_errors_injected_total', 'Сгенерированные ошибки чтения',
+    DEVICE
+)
+BUFFER_DEPTH = REGISTRY.gauge(
+    'emulator_buffer_depth', 'КМ, ожидающие передачи устройством', DEVICE
+)
+CLIENTS = REGISTRY.gauge(
+    'emulator_clients', 'Подключенные клиенты', DEVICE
+)
+PARSE_SECONDS = REGISTRY.histogram(
+    'emulator_parse_seconds', 'Время разбора задания печати', DEVICE
+)
+SEND_SECONDS = REGISTRY.histogram(
+    'emulator_send_seconds', 'Время одного вызова отправки клиенту камеры',
+    DEVICE
+)
+
+
+class MetricsClient:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.rx = bytearray()
+        self.tx = b''
+
+
+class MetricsServer:
+    # HTTP-эндпоинт /metrics в формате Prometheus. Работает в том же цикле
+    # событий, что и устройства: метрики читаются без блокировок
+    def __init__(self, port: int, registry: Registry = REGISTRY,
+                 host: str = '127.0.0.1', loop: EventLoop | None = None):
+        # Имя для учета времени цикла событий по владельцам
+        self.name = 'METRICS'
+        self.registry = registry
+        self.loop = loop or get_event_loop()
+        self.server = listen_socket(host, port)
+        self.port = self.server.getsockname()[1]
+
+    def start(self):
+        self.loop.add_reader(self.server, self.run_login)
+
+    def run_login(self):
+        while 1:
+            try:
+                connected_client, address = self.server.accept()
+            except BlockingIOError:
+                return
+            connected_client.setblocking(False)
+            client = MetricsClient(connected_client)
+            self.loop.add_reader(
+                connected_client, partial(self.receive, client)
+            )
+
+    def disconnect(self, client: MetricsClient):
+        self.loop.forget(client.sock)
+        client.sock.close()
+
+    def receive(self, client: MetricsClient):
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logging.warning(f"[METRICS] ERROR: {e}")
+            data = b''
+        if not data:
+            self.disconnect(client)
+            return
+        client.rx += data
+        if b'\r\n\r\n' not in client.rx and b'\n\n' not in client.rx:
+            if len(client.rx) > MAX_REQUEST:
+                self.loop.remove_reader(client.sock)
+                self.respond(client, 431, 'Request Header Fields Too Large')
+            return
+        self.loop.remove_reader(client.sock)
+        request = client.rx.split(b'\n', 1)[0].decode('latin-1').split()
+        if len(request) < 2 or request[0] not in ('GET', 'HEAD'):
+            self.respond(client, 405, 'Method Not Allowed')
+        elif request[1].split('?', 1)[0] not in ('/', '/metrics'):
+            self.respond(client, 404, 'Not Found')
+        else:
+            body = self.registry.render().encode()
+            self.respond(client, 200, 'OK', body, request[0] == 'HEAD')
+
+    def respond(self, client: MetricsClient, status: int, reason: str,
+                body: bytes = b'', head_only: bool = False):
+        header = (
+            f'HTTP/1.1 {status} {reason}\r\n'
+            f'Content-Type: {CONTENT_TYPE}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Connection: close\r\n\r\n'
+        ).encode()
+        client.tx = header if head_only else header + body
+        self.loop.add_writer(client.sock, partial(self.flush, client))
+
+    def flush(self, client: MetricsClient):
+        try:
+            sent = client.sock.send(client.tx)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.disconnect(client)
+            return
+        client.tx = client.tx[sent:]
+        if not client.tx:
+            self.disconnect(client)
@@ -0,0 +1,158 @@
+import logging
+from enum import Enum
+from time import monotonic
+from typing import Callable
+
+from event_loop import EventLoop
+
+
+IDLE_POLL = 0.05
+REPORT_INTERVAL = 10.0
+# Сколько пропущенных интервалов догоняем за один вызов, если цикл
+# опоздал; остальное отбрасывается, чтобы не выдавать пачку кодов
+MAX_BURST = 100
+
+
+class PaceMode(Enum):
+    FIXED = 'fixed'
+    CONSUMER = 'consumer'
+
+
+class Pacer:
+    # Вызывает emit() по монотонным дедлайнам (FIXED) или сразу после
+    # предыдущей передачи, пока потребитель успевает читать (CONSUMER).
+    # emit() возвращает True, если код был передан
+    def __init__(self, loop: EventLoop, name: str, interval: float,
+                 emit: Callable[[], bool],
+                 mode: PaceMode = PaceMode.FIXED,
+                 report_interval: float = REPORT_INTERVAL):
+        self.loop = loop
+        self.name = name
+        self.emit = emit
+        self.mode = mode
+        self.report_interval = report_interval
+        self.interval = interval
+        self.deadline = 0.0
+        self.timer = None
+        self.total = 0
+        self.window_start = 0.0
+        self.window_count = 0
+        self.started = 0.0
+        # emit() может остановить Pacer (источник кончился): после этого
+        # таймер не перезапускается
+        self.running = False
+        # FIXED: emit() нечего было передать, ждем wake() или опроса
+        self.idle = False
+
+    @property
+    def target_rate(self) -> float | None:
+        if self.mode is PaceMode.CONSUMER:
+            return None
+        return 1 / self.interval
+
+    def set_interval(self, interval: float):
+        # Следующий вызов - через новый интервал после предыдущего, а не
+        # после смены: частая смена темпа (график нагрузки) не сдвигает
+        # выдачу. Если при сокращении интервала этот момент уже прошел -
+        # сейчас, без пачки догоняющих кодов. Опрос простоя не трогаем
+        if (
+            self.mode is PaceMode.FIXED and self.timer is not None and
+            not self.idle
+        ):
+            self.timer.cancel()
+            self.deadline = max(
+                self.deadline - self.interval + interval, monotonic()
+            )
+            self.timer = self.loop.call_at(self.deadline, self.tick)
+        self.interval = interval
+
+    def start(self):
+        self.running = True
+        self.idle = False
+        self.started = self.window_start = monotonic()
+        if self.interval <= 0:
+            self.mode = PaceMode.CONSUMER
+        if self.mode is PaceMode.CONSUMER:
+            self.timer = self.loop.call_later(0, self.drain)
+        else:
+            self.deadline = self.started + self.interval
+            self.timer = self.loop.call_at(self.deadline, self.tick)
+
+    def stop(self):
+        self.running = False
+        self.idle = False
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def _count(self, now: float):
+        self.total += 1
+        self.window_count += 1
+        if now - self.window_start >= self.report_interval:
+            self.report(now)
+
+    def report(self, now: float | None = None):
+        now = now or monotonic()
+        elapsed = now - self.window_start
+        achieved = self.window_count / elapsed if elapsed > 0 else 0.0
+        target = self.target_rate
+        target_text = f"{target:.1f}" if target else "max"
+        logging.info(
+            f"[{self.name}] RATE: {achieved:.1f} codes/s "
+            f"(target {target_text}, total {self.total})"
+        )
+        self.window_start = now
+        self.window_count = 0
+        return achieved
+
+    def tick(self):
+        now = monotonic()
+        self.idle = False
+        burst = 0
+        while self.deadline <= now and burst < MAX_BURST:
+            if not self.emit():
+                if self.running:
+                    self._wait(now)
+                return
+            self._count(now)
+            if not self.running:
+                return
+            self.deadline += self.interval
+            burst += 1
+        if self.deadline <= now:
+            self.deadline = now + self.interval
+        self.timer = self.loop.call_at(self.deadline, self.tick)
+
+    def _wait(self, now: float):
+        # Работы нет: не просыпаемся каждый интервал, а ждем wake() с
+        # редким опросом на случай источников без событий. Темп
+        # отсчитывается заново, когда работа появится
+        self.idle = True
+        self.deadline = now + max(self.interval, IDLE_POLL)
+        self.timer = self.loop.call_at(self.deadline, self.tick)
+
+    def drain(self):
+        now = monotonic()
+        for _ in range(MAX_BURST):
+            if not self.emit():
+                if self.running:
+                    self.timer = self.loop.call_later(IDLE_POLL, self.drain)
+                return
+            self._count(now)
+        if self.running:
+            self.timer = self.loop.call_later(0, self.drain)
+
+    def wake(self):
+        # Потребитель освободился или появились данные: не ждем
+        # окончания паузы опроса
+        if self.timer is None:
+            return
+        if self.mode is PaceMode.CONSUMER:
+            if self.timer.deadline > monotonic():
+                self.timer.cancel()
+                self.timer = self.loop.call_later(0, self.drain)
+        elif self.idle:
+            self.idle = False
+            self.timer.cancel()
+            self.deadline = monotonic()
+            self.timer = self.loop.call_at(self.deadline, self.tick)
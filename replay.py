@@ -0,0 +1,279 @@
+import logging
+import socket
+from enum import Enum
+from time import monotonic
+
+from capture import Connection, Record, Session, load_sessions
+from event_loop import EventLoop, get_event_loop, listen_socket
+
+
+# Сколько ждать ответа устройства после отправки всех данных (сек)
+LINGER = 1.0
+
+
+class Role(Enum):
+    # mes - подключаемся к устройствам и передаем записанные запросы MES
+    MES = 'mes'
+    # device - слушаем порты устройств и отдаем MES записанные ответы
+    DEVICE = 'device'
+
+
+class ReplayStream:
+    # Одно записанное соединение, воспроизводимое через один сокет
+    def __init__(self, replayer: 'Replayer', connection: Connection,
+                 sock: socket.socket, base: float):
+        self.replayer = replayer
+        self.loop = replayer.loop
+        self.connection = connection
+        self.sock = sock
+        # Время начала соединения по часам воспроизведения
+        self.base = base
+        self.chunks = [
+            (ts, data) for ts, kind, data in connection.chunks
+            if kind is replayer.send_kind
+        ]
+        self.index = 0
+        self.tx = bytearray()
+        self.waiting = False
+        self.sent = 0
+        self.received = 0
+        self.timer = None
+        self.draining = False
+        self.finished = False
+
+    def deadline(self, ts: int) -> float:
+        speed = self.replayer.speed
+        if not speed:
+            return 0.0
+        return self.base + (ts - self.connection.opened) / 1e9 / speed
+
+    def start(self):
+        self.loop.add_reader(self.sock, self.receive)
+        self.send_due()
+
+    def send_due(self):
+        self.timer = None
+        now = monotonic()
+        chunks = self.chunks
+        while (
+            self.index < len(chunks) and
+            self.deadline(chunks[self.index][0]) <= now
+        ):
+            self.tx += chunks[self.index][1]
+            self.index += 1
+        self.flush()
+        if self.index < len(chunks):
+            self.timer = self.loop.call_at(
+                self.deadline(chunks[self.index][0]), self.send_due
+            )
+        elif not self.tx:
+            self.finish()
+
+    def flush(self):
+        if self.tx:
+            try:
+                sent = self.sock.send(self.tx)
+            except BlockingIOError:
+                sent = 0
+            except OSError as e:
+                logging.warning(f"[REPLAY] {self.connection.device} "
+                                f"#{self.connection.conn} ERROR: {e}")
+                self.close()
+                return
+            del self.tx[:sent]
+            self.sent += sent
+        if self.tx and not self.waiting:
+            self.waiting = True
+            self.loop.add_writer(self.sock, self.flush)
+        elif not self.tx and self.waiting:
+            self.waiting = False
+            self.loop.remove_writer(self.sock)
+            if self.index >= len(self.chunks):
+                self.finish()
+
+    def finish(self):
+        # Все данные отправлены: закрываем передачу, когда соединение было
+        # закрыто при записи, и ждем остаток ответа
+        if self.draining:
+            return
+        self.draining = True
+        closed = self.connection.closed
+        deadline = (
+            self.deadline(closed) if closed is not None else 0.0
+        )
+        self.timer = self.loop.call_at(deadline, self.shutdown)
+
+    def shutdown(self):
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        self.timer = self.loop.call_later(LINGER, self.close)
+
+    def receive(self):
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if data:
+            self.received += len(data)
+        elif self.index >= len(self.chunks) and not self.tx:
+            self.close()
+        else:
+            # Собеседник отключился раньше, чем при записи
+            self.loop.remove_reader(self.sock)
+
+    def close(self):
+        if self.finished:
+            return
+        self.finished = True
+        if self.timer is not None:
+            self.timer.cancel()
+        self.loop.forget(self.sock)
+        self.sock.close()
+        self.replayer.stream_done(self)
+
+
+class Replayer:
+    def __init__(self, session: Session, role: Role = Role.MES,
+                 host: str = '127.0.0.1', port_offset: int = 0,
+                 speed: float = 1.0, devices: list[str] | None = None,
+                 loop: EventLoop | None = None):
+        self.loop = loop or get_event_loop()
+        self.role = role
+        self.host = host
+        self.port_offset = port_offset
+        self.speed = speed
+        self.connections = sorted(
+            (c for c in session.connections.values()
+             if not devices or c.device in devices),
+            key=lambda c: c.opened
+        )
+        self.send_kind = Record.RX if role is Role.MES else Record.TX
+        self.pending = len(self.connections)
+        self.streams: list[ReplayStream] = []
+        self.servers: dict[socket.socket, list[Connection]] = {}
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def start(self):
+        self.started = monotonic()
+        if not self.connections:
+            self.loop.call_soon(self.loop.stop)
+            return
+        if self.role is Role.MES:
+            origin = self.connections[0].opened
+            for connection in self.connections:
+                delay = (
+                    (connection.opened - origin) / 1e9 / self.speed
+                    if self.speed else 0.0
+                )
+                self.loop.call_at(
+                    self.started + delay, self.connect, connection
+                )
+        else:
+            by_port: dict[int, list[Connection]] = {}
+            for connection in self.connections:
+                by_port.setdefault(connection.port, []).append(connection)
+            for port, connections in by_port.items():
+                server = listen_socket(self.host, port + self.port_offset)
+                self.servers[server] = connections
+                self.loop.add_reader(
+                    server, lambda s=server: self.accept(s)
+                )
+                logging.info(f"[REPLAY] {connections[0].device} listening "
+                             f"at port {port + self.port_offset}")
+
+    def connect(self, connection: Connection):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.connect_ex((self.host, connection.port + self.port_offset))
+        stream = ReplayStream(self, connection, sock, monotonic())
+        self.streams.append(stream)
+        self.loop.add_writer(sock, lambda: self.connected(stream))
+
+    def connected(self, stream: ReplayStream):
+        self.loop.remove_writer(stream.sock)
+        error = stream.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            logging.error(f"[REPLAY] {stream.connection.device} "
+                          f"#{stream.connection.conn} connect failed: "
+                          f"{error}")
+            stream.close()
+            return
+        stream.start()
+
+    def accept(self, server: socket.socket):
+        connections = self.servers[server]
+        while connections:
+            try:
+                sock, address = server.accept()
+            except BlockingIOError:
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            stream = ReplayStream(
+                self, connections.pop(0), sock, monotonic()
+            )
+            self.streams.append(stream)
+            stream.start()
+        # Записанные соединения этого порта закончились
+        self.loop.forget(server)
+        server.close()
+
+    def stream_done(self, stream: ReplayStream):
+        self.pending -= 1
+        if not self.pending:
+            self.elapsed = monotonic() - self.started
+            self.loop.stop()
+
+    def report(self):
+        elapsed = self.elapsed or monotonic() - self.started
+        expect_kind = Record.TX if self.role is Role.MES else Record.RX
+        totals: dict[str, dict] = {}
+        for stream in self.streams:
+            total = totals.setdefault(stream.connection.device, {
+                'connections': 0, 'sent': 0, 'received': 0, 'recorded': 0
+            })
+            total['connections'] += 1
+            total['sent'] += stream.sent
+            total['received'] += stream.received
+            total['recorded'] += stream.connection.size(expect_kind)
+        logging.info(f"[REPLAY] {len(self.streams)}/{len(self.connections)} "
+                     f"connections in {elapsed:.3f}s")
+        for device, total in sorted(totals.items()):
+            rate = total['sent'] / elapsed if elapsed > 0 else 0.0
+            logging.info(
+                f"[REPLAY] {device}: connections {total['connections']} "
+                f"sent {total['sent']} B ({rate / 1e6:.2f} MB/s) "
+                f"received {total['received']} B "
+                f"(recorded {total['recorded']} B)"
+            )
+        return totals
+
+
+def run_replay(args):
+    sessions = load_sessions(args.file)
+    if not sessions:
+        logging.error(f"{args.file}: no sessions recorded")
+        return
+    try:
+        session = sessions[args.session]
+    except IndexError:
+        logging.error(f"{args.file}: {len(sessions)} sessions recorded, "
+                      f"no session {args.session}")
+        return
+    replayer = Replayer(
+        session, Role(args.role), args.host, args.port_offset, args.speed,
+        args.device
+    )
+    logging.info(f"[REPLAY] {len(replayer.connections)} connections, "
+                 f"speed {args.speed or 'max'}")
+    replayer.start()
+    try:
+        get_event_loop().run_forever()
+    finally:
+        replayer.report()
@@ -0,0 +1,235 @@
+import json
+import logging
+from pathlib import Path
+from time import monotonic
+
+from event_loop import EventLoop
+from pacing import PaceMode, Pacer
+
+
+# Как часто пересчитывается скорость на плавном подъеме
+RAMP_STEP = 0.25
+
+
+class Phase:
+    # Участок графика нагрузки: duration секунд со скоростью rate КМ в
+    # минуту. С to скорость меняется от rate до to: плавно или, если
+    # задано steps, ступенями равной длины. rate 0 - остановка линии
+    def __init__(self, name: str, duration: float, rate: float,
+                 to: float | None = None, steps: int = 0):
+        if duration <= 0:
+            raise ValueError(f"{name}: duration must be positive")
+        if rate < 0 or (to is not None and to < 0):
+            raise ValueError(f"{name}: rate must not be negative")
+        if steps and (to is None or steps < 2):
+            raise ValueError(f"{name}: steps need to and at least 2 steps")
+        self.name = name
+        self.duration = duration
+        self.rate = rate
+        self.to = rate if to is None else to
+        self.steps = steps
+
+    @property
+    def target(self) -> float:
+        # Средняя скорость участка: у подъема и ступеней - середина
+        return (self.rate + self.to) / 2
+
+    def rate_at(self, elapsed: float) -> float:
+        if self.to == self.rate:
+            return self.rate
+        share = min(elapsed / self.duration, 1.0)
+        if self.steps:
+            step = min(int(share * self.steps), self.steps - 1)
+            share = step / (self.steps - 1)
+        return self.rate + (self.to - self.rate) * share
+
+    def next_change(self, elapsed: float) -> float:
+        # Когда (от начала участка) скорость поменяется в следующий раз
+        if self.to == self.rate:
+            return self.duration
+        if self.steps:
+            length = self.duration / self.steps
+            return min((int(elapsed / length) + 1) * length, self.duration)
+        return min(elapsed + RAMP_STEP, self.duration)
+
+
+class LoadProfile:
+    # График нагрузки устройства: участки подряд, с repeat - по кругу.
+    # После последнего участка держится его конечная скорость
+    def __init__(self, name: str, phases: list[Phase],
+                 repeat: bool = False):
+        if not phases:
+            raise ValueError(f"{name}: no phases")
+        self.name = name
+        self.phases = phases
+        self.repeat = repeat
+
+    @property
+    def duration(self) -> float:
+        return sum(phase.duration for phase in self.phases)
+
+
+PROFILES = {
+    # Подъем со 100 до 2000 КМ/мин за 10 минут и 5 минут на максимуме
+    'ramp': LoadProfile('ramp', [
+        Phase('ramp', 600, 100, 2000), Phase('hold', 300, 2000),
+    ]),
+    # То же ступенями по 2 минуты: на каждой видно установившийся темп
+    'step': LoadProfile('step', [
+        Phase('step', 600, 100, 2000, steps=5), Phase('hold', 300, 2000),
+    ]),
+    # Раз в минуту 10 секунд пятикратного всплеска
+    'burst': LoadProfile('burst', [
+        Phase('base', 60, 600), Phase('burst', 10, 3000),
+    ], repeat=True),
+    # Смена на постоянной скорости: утечки и дрейф при долгой работе
+    'soak': LoadProfile('soak', [Phase('soak', 8 * 3600, 1000)]),
+    # Остановка линии на минуту каждые 2 минуты работы
+    'stop': LoadProfile('stop', [
+        Phase('run', 120, 1000), Phase('stop', 60, 0),
+    ], repeat=True),
+}
+
+
+def load_profile(value: str) -> LoadProfile:
+    # Имя из PROFILES или JSON-файл:
+    # {"name": ..., "repeat": false, "phases": [{"name": ...,
+    #  "duration": секунды, "rate": КМ/мин, "to": КМ/мин, "steps": N}]}
+    if value in PROFILES:
+        return PROFILES[value]
+    path = Path(value)
+    if not path.exists():
+        raise ValueError(
+            f"unknown load profile {value!r}: "
+            f"expected one of {sorted(PROFILES)} or a JSON file"
+        )
+    with open(path, 'r', encoding='utf-8') as f:
+        fields = json.load(f)
+    if not isinstance(fields, dict) or not isinstance(
+        fields.get('phases'), list
+    ):
+        raise ValueError(f"{path}: expected an object with a phases list")
+    try:
+        phases = [
+            Phase(**{'name': f"phase {n}", **phase})
+            for n, phase in enumerate(fields['phases'])
+        ]
+        return LoadProfile(fields.get('name', path.stem), phases,
+                           bool(fields.get('repeat', False)))
+    except TypeError as e:
+        raise ValueError(f"{path}: {e}") from None
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+class ProfileDriver:
+    # Ведет темп Pacer устройства по графику. Границы участков и шаги
+    # подъема считаются от начала графика по монотонным часам, поэтому
+    # задержки цикла событий не копятся. По окончании участка в журнал
+    # пишется достигнутая скорость против заданной
+    def __init__(self, loop: EventLoop, name: str, pacer: Pacer,
+                 profile: LoadProfile):
+        self.loop = loop
+        self.name = name
+        self.pacer = pacer
+        self.profile = profile
+        self.index = 0
+        self.phase_start = 0.0
+        self.phase_total = 0
+        self.paused = False
+        self.timer = None
+
+    @property
+    def phase(self) -> Phase:
+        return self.profile.phases[self.index]
+
+    def start(self):
+        # Запускает Pacer вместо устройства: темп задает график, режим
+        # CONSUMER не действует
+        self.pacer.mode = PaceMode.FIXED
+        self.paused = True
+        logging.info(f"[{self.name}] LOAD PROFILE {self.profile.name}: "
+                     f"{len(self.profile.phases)} phases, "
+                     f"{self.profile.duration:.0f} s")
+        self.begin(monotonic())
+
+    def begin(self, now: float):
+        self.phase_start = now
+        self.phase_total = self.pacer.total
+        phase = self.phase
+        logging.info(f"[{self.name}] PHASE {phase.name}: "
+                     f"{phase.rate:g} -> {phase.to:g} codes/min "
+                     f"for {phase.duration:g} s")
+        self.apply(phase.rate_at(0))
+        self.timer = self.loop.call_at(
+            now + phase.next_change(0), self.update
+        )
+
+    def apply(self, rate: float):
+        pacer = self.pacer
+        if not rate:
+            if pacer.running:
+                pacer.stop()
+                self.paused = True
+            return
+        pacer.set_interval(60 / rate)
+        if self.paused:
+            self.paused = False
+            pacer.start()
+
+    def update(self):
+        self.timer = None
+        if not self.pacer.running and not self.paused:
+            # Источник кончился: график больше не нужен
+            return
+        phase = self.phase
+        end = self.phase_start + phase.duration
+        now = monotonic()
+        if now < end:
+            elapsed = now - self.phase_start
+            self.apply(phase.rate_at(elapsed))
+            self.timer = self.loop.call_at(
+                self.phase_start + phase.next_change(elapsed), self.update
+            )
+            return
+        self.report(end)
+        if self.index + 1 < len(self.profile.phases):
+            self.index += 1
+        elif self.profile.repeat:
+            self.index = 0
+        else:
+            logging.info(f"[{self.name}] LOAD PROFILE "
+                         f"{self.profile.name} finished at "
+                         f"{phase.to:g} codes/min")
+            self.apply(phase.to)
+            return
+        # Следующий участок начинается с конца прошлого, а не с момента
+        # вызова
+        self.begin(end)
+
+    def report(self, end: float):
+        phase = self.phase
+        achieved = (
+            (self.pacer.total - self.phase_total) * 60 /
+            (end - self.phase_start)
+        )
+        share = f", {achieved / phase.target:.0%}" if phase.target else ""
+        logging.info(f"[{self.name}] PHASE {phase.name} DONE: "
+                     f"{achieved:.1f} codes/min "
+                     f"(target {phase.target:g}{share})")
+
+
+_profile: LoadProfile | None = None
+
+
+def configure(profile: str | None = None):
+    # Вызывается до создания устройств: график по умолчанию для камер и
+    # принтеров-источников, у которых нет своего
+    global _profile
+    _profile = load_profile(profile) if profile else None
+
+
+def driver(loop: EventLoop, name: str, pacer: Pacer,
+           profile: LoadProfile | None = None) -> ProfileDriver | None:
+    profile = profile or _profile
+    return ProfileDriver(loop, name, pacer, profile) if profile else None
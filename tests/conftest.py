@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+from time import monotonic
+
+import pytest
+
+# Модули эмулятора лежат в корне репозитория, без пакета
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from event_loop import EventLoop  # noqa: E402
+
+
+@pytest.fixture
+def loop():
+    # Свой цикл на тест: таймеры и сокеты прошлых тестов не мешают
+    loop = EventLoop()
+    yield loop
+    for key in list(loop.selector.get_map().values()):
+        loop.forget(key.fileobj)
+        key.fileobj.close()
+    loop._wake_w.close()
+    loop.selector.close()
+
+
+@pytest.fixture
+def run_until(loop):
+    # Крутит цикл, пока не выполнится условие или не выйдет время
+    def run(condition, timeout: float = 2.0) -> bool:
+        deadline = monotonic() + timeout
+        while not condition():
+            if monotonic() >= deadline:
+                return False
+            loop.run_once(0.01)
+        return True
+    return run
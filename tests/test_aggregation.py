@@ -0,0 +1,96 @@
+import socket
+
+import pytest
+
+from aggregation import SEPARATOR_BYTES, BoxRouter, StackBuffer
+from channel import Channel, Overflow
+from devices import CameraClient, TcpExchanger
+
+
+SEP = SEPARATOR_BYTES
+
+
+def test_stack_buffer_collects_box():
+    stack = StackBuffer(3)
+    code = b'01'
+    assert not stack.add(code, b'@A' + SEP)
+    assert not stack.add(b'error', SEP, code=False)
+    assert stack.add(b'02')
+    parts, codes = stack.take()
+    assert parts == (b'01', b'@A' + SEP, b'error', SEP, b'02', SEP)
+    assert codes == 2
+    # Части - те же объекты, без копий КМ
+    assert parts[0] is code
+    assert len(stack) == 0
+    # Слоты переиспользуются следующей пачкой
+    stack.add(b'03')
+    assert stack.take() == ((b'03', SEP), 1)
+
+
+def test_stack_size_must_be_positive():
+    with pytest.raises(ValueError):
+        StackBuffer(0)
+
+
+def test_router_fills_boxes_in_turn():
+    buffers = [Channel('AGR_0', 10), Channel('AGR_1', 10)]
+    router = BoxRouter(buffers, {'AGR_0': 2, 'AGR_1': 3})
+    for n in range(7):
+        router.route(f'{n}')
+    assert buffers[0].snapshot() == ['0', '1', '5', '6']
+    assert buffers[1].snapshot() == ['2', '3', '4']
+
+
+def test_route_all_splits_stack_at_box_boundary():
+    buffers = [Channel('AGR_0', 10), Channel('AGR_1', 10)]
+    router = BoxRouter(buffers, 2)
+    router.route('0')
+    assert router.route_all(['1', '2', '3', '4']) == 4
+    assert buffers[0].snapshot() == ['0', '1', '4']
+    assert buffers[1].snapshot() == ['2', '3']
+
+
+def test_writable_accounts_for_box_boundary():
+    buffers = [Channel('AGR_0', 3), Channel('AGR_1', 1)]
+    router = BoxRouter(buffers, 2)
+    # Два КМ в AGR_0, третий уже в AGR_1, где места на один
+    assert router.writable(3)
+    assert not router.writable(4)
+    buffers[1].append('x')
+    assert not router.writable(3)
+    assert BoxRouter(
+        [Channel('AGR_0', 1, Overflow.DROP_OLDEST)], 1
+    ).writable(5)
+
+
+def test_full_buffer_refuses_and_keeps_box_position():
+    buffers = [Channel('AGR_0', 2), Channel('AGR_1', 10)]
+    router = BoxRouter(buffers, 3)
+    assert router.route_all(['0', '1', '2', '3']) == 2
+    assert (router.index, router.filled) == (0, 2)
+    assert router.route('2') is None
+    buffers[0].popleft()
+    assert router.route('2') is buffers[0]
+    assert router.route('3') is buffers[1]
+
+
+def test_camera_passes_raw_codes_with_quality_flags(loop):
+    codes = Channel('SER', 10)
+    codes.extend(['0104601', '0104602'])
+    box = Channel('AGR_0', 10)
+    camera = TcpExchanger('SER', codes, [box], listen_port=0, stack=1,
+                          add_code_quality=True, loop=loop)
+    sock, peer = socket.socketpair()
+    client = CameraClient(sock, camera.send_queue)
+    camera.connections[sock] = client
+    try:
+        assert camera.run() and camera.run()
+    finally:
+        sock.close()
+        peer.close()
+        camera.server.close()
+    # Флаг качества уходит только в сообщение камеры
+    assert [
+        (code, suffix[:1]) for code, suffix in client.queue
+    ] == [(b'0104601', b'@'), (b'0104602', b'@')]
+    assert box.snapshot() == ['0104601', '0104602']
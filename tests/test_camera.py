@@ -0,0 +1,208 @@
+import logging
+import re
+import socket
+
+import pytest
+
+from channel import Channel
+import devices
+from devices import IOV_BATCH, Backpressure, CameraClient, TcpExchanger
+from eventlog import DeviceLog
+from pacing import PaceMode
+
+
+@pytest.fixture
+def camera(loop):
+    # Камера на свободном порту; очереди клиентов проверяются без
+    # отправки: flush_all ждет следующего оборота цикла
+    cameras = []
+
+    def make(backpressure: Backpressure = Backpressure.BLOCK,
+             send_queue: int = 2, codes: Channel | None = None,
+             **kwargs) -> TcpExchanger:
+        exchanger = TcpExchanger(
+            'CAM', codes if codes is not None else Channel('CAM', 100),
+            [], listen_port=0, backpressure=backpressure,
+            send_queue=send_queue, loop=loop, **kwargs
+        )
+        cameras.append(exchanger)
+        return exchanger
+
+    yield make
+    for exchanger in cameras:
+        for sock in list(exchanger.connections):
+            sock.close()
+        exchanger.server.close()
+
+
+def attach(exchanger: TcpExchanger) -> tuple[CameraClient, socket.socket]:
+    sock, peer = socket.socketpair()
+    client = CameraClient(sock, exchanger.send_queue)
+    exchanger.connections[sock] = client
+    return client, peer
+
+
+SEP = b'\n\r'
+
+
+def messages(client: CameraClient) -> list[bytes]:
+    # Сообщение в очереди - части, которые уходят отдельными буферами
+    return [b''.join(parts) for parts in client.queue]
+
+
+def test_block_stops_camera_when_client_queue_full(camera):
+    codes = Channel('CAM', 100)
+    codes.extend(['01', '02', '03'])
+    exchanger = camera(Backpressure.BLOCK, 2, codes)
+    client, peer = attach(exchanger)
+    assert exchanger.run() and exchanger.run()
+    assert exchanger.blocked()
+    assert not exchanger.run()
+    assert messages(client) == [b'01\n\r', b'02\n\r']
+    assert len(codes) == 1
+    peer.close()
+
+
+def test_disconnect_drops_slow_client(camera):
+    exchanger = camera(Backpressure.DISCONNECT, 1)
+    client, peer = attach(exchanger)
+    exchanger.enqueue(b'01')
+    exchanger.enqueue(b'02')
+    assert client.sock not in exchanger.connections
+    assert client.sock.fileno() == -1
+    peer.close()
+
+
+def test_drop_oldest_keeps_newest(camera):
+    exchanger = camera(Backpressure.DROP_OLDEST, 2)
+    client, peer = attach(exchanger)
+    for payload in (b'01', b'02', b'03'):
+        exchanger.enqueue(payload)
+    assert messages(client) == [b'02', b'03']
+    assert client.dropped == 1
+    peer.close()
+
+
+def test_drop_oldest_keeps_partially_sent_message(camera):
+    exchanger = camera(Backpressure.DROP_OLDEST, 2)
+    client, peer = attach(exchanger)
+    exchanger.enqueue(b'01')
+    exchanger.enqueue(b'02')
+    client.offset = 1
+    exchanger.enqueue(b'03')
+    assert messages(client) == [b'01', b'03']
+    assert client.dropped == 1
+    peer.close()
+
+
+def test_drop_oldest_single_slot_drops_new_payload(camera):
+    # Очередь из одного частично отправленного сообщения: выбросить
+    # можно только новое
+    exchanger = camera(Backpressure.DROP_OLDEST, 1)
+    client, peer = attach(exchanger)
+    exchanger.enqueue(b'01')
+    client.offset = 1
+    exchanger.enqueue(b'02')
+    assert messages(client) == [b'01']
+    assert client.dropped == 1
+    client.offset = 0
+    exchanger.enqueue(b'03')
+    assert messages(client) == [b'03']
+    assert client.dropped == 2
+    peer.close()
+
+
+def test_client_receives_all_codes_in_order(loop, run_until, camera):
+    codes = Channel('CAM', 1000)
+    sent = [f'01046{n:09}' for n in range(500)]
+    codes.extend(sent)
+    exchanger = camera(Backpressure.BLOCK, 4, codes,
+                       pace_mode=PaceMode.CONSUMER)
+    exchanger.start()
+    port = exchanger.server.getsockname()[1]
+    peer = socket.create_connection(('127.0.0.1', port))
+    peer.setblocking(False)
+    received = bytearray()
+
+    def read():
+        try:
+            received.extend(peer.recv(65536))
+        except BlockingIOError:
+            pass
+        return received.count(b'\n\r') == len(sent)
+
+    assert run_until(read)
+    assert received.decode().split('\n\r')[:-1] == sent
+    exchanger.pacer.stop()
+    peer.close()
+
+
+def test_stack_message_with_quality_flags(camera):
+    codes = Channel('CAM', 10)
+    codes.extend(['01', '02', '03', '04'])
+    exchanger = camera(Backpressure.BLOCK, 4, codes, stack=3,
+                       add_code_quality=True)
+    client, peer = attach(exchanger)
+    assert exchanger.run() and exchanger.run() and exchanger.run()
+    # Пачка уходит одним сообщением, когда собрана целиком
+    (message,) = messages(client)
+    assert re.fullmatch(rb'01@[A-F]\n\r02@[A-F]\n\r03@[A-F]\n\r', message)
+    assert exchanger.run()
+    assert len(client.queue) == 1
+    peer.close()
+
+
+def test_stack_parts_sent_as_iovecs_across_partial_sends(
+        camera, run_until, monkeypatch):
+    # Части сообщений уходят отдельными буферами sendmsg, не больше
+    # IOV_BATCH за вызов; короб длиннее IOV_BATCH частей и частичные
+    # отправки не нарушают порядок байт
+    batches = []
+
+    def record(sock, batch):
+        batches.append(batch)
+        return send_batch(sock, batch)
+
+    send_batch = devices.send_batch
+    monkeypatch.setattr(devices, 'send_batch', record)
+    exchanger = camera(Backpressure.BLOCK, 10)
+    client, peer = attach(exchanger)
+    client.sock.setblocking(False)
+    client.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    box = tuple(
+        part for n in range(IOV_BATCH) for part in (f'{n:06}'.encode(), SEP)
+    )
+    exchanger.enqueue(*box)
+    exchanger.enqueue(b'tail', SEP)
+    exchanger.flush(client)
+    assert client.waiting
+    assert batches[0][0] is box[0]
+    expected = b''.join(box) + b'tail' + SEP
+    received = bytearray()
+
+    def read() -> bool:
+        try:
+            received.extend(peer.recv(65536, socket.MSG_DONTWAIT))
+        except BlockingIOError:
+            pass
+        return len(received) == len(expected)
+
+    assert run_until(read)
+    assert bytes(received) == expected
+    assert not client.queue and not client.offset and not client.waiting
+    assert max(map(len, batches)) <= IOV_BATCH
+    peer.close()
+
+
+def test_message_log_strips_only_written_events(caplog):
+    caplog.set_level(logging.INFO)
+    log = DeviceLog('CAM')
+    log.message('SENT', '01@A\n\r02@B\n\r', "[%s] SENT: %s", 'CAM')
+    assert caplog.records[0].getMessage() == "[CAM] SENT: 01@A\n\r02@B"
+    # Части сообщения из очереди клиента склеиваются только для записи
+    log.message('SENT', (b'01', b'@A' + SEP), "[%s] SENT: %s", 'CAM')
+    assert caplog.records[1].getMessage() == "[CAM] SENT: 01@A"
+    caplog.clear()
+    caplog.set_level(logging.WARNING)
+    log.message('SENT', '03@A\n\r', "[%s] SENT: %s", 'CAM')
+    assert not caplog.records
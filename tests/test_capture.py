@@ -0,0 +1,102 @@
+import socket
+
+from capture import CaptureWriter, Record, load_sessions, read_records
+from event_loop import listen_socket
+from replay import Replayer, Role
+
+
+def record_session(path, loop, port: int) -> None:
+    writer = CaptureWriter(path, loop)
+    conn = writer.open('PRN', port, ('127.0.0.1', 50000))
+    writer.rx(conn, b'~HS')
+    writer.tx(conn, b'0,0,0,0,0')
+    writer.rx(conn, b'^XA^FH^FD_7e1010460^FS^XZ')
+    writer.close(conn)
+    writer.stop()
+
+
+def test_sessions_round_trip(tmp_path, loop):
+    path = tmp_path / 'line.cap'
+    record_session(path, loop, 9100)
+    record_session(path, loop, 9101)
+    sessions = load_sessions(path)
+    assert len(sessions) == 2
+    connection = sessions[1].connections[1]
+    assert (connection.device, connection.port) == ('PRN', 9101)
+    assert [(kind, data) for _, kind, data in connection.chunks] == [
+        (Record.RX, b'~HS'),
+        (Record.TX, b'0,0,0,0,0'),
+        (Record.RX, b'^XA^FH^FD_7e1010460^FS^XZ'),
+    ]
+    assert connection.closed is not None
+    assert connection.size(Record.RX) == 28
+
+
+def test_truncated_tail_is_ignored(tmp_path, loop):
+    path = tmp_path / 'line.cap'
+    record_session(path, loop, 9100)
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+    records = list(read_records(path))
+    # Оборванная запись CLOSE отброшена, предыдущие целы
+    assert [kind for _, _, kind, _ in records] == [
+        Record.SESSION, Record.OPEN, Record.RX, Record.TX, Record.RX
+    ]
+
+
+def test_mes_replay_sends_recorded_requests(tmp_path, loop, run_until):
+    server = listen_socket('127.0.0.1', 0)
+    port = server.getsockname()[1]
+    path = tmp_path / 'line.cap'
+    record_session(path, loop, port)
+    received = bytearray()
+    peers = []
+
+    def accept():
+        sock, _ = server.accept()
+        sock.setblocking(False)
+        peers.append(sock)
+        loop.add_reader(sock, lambda: read(sock))
+
+    def read(sock: socket.socket):
+        data = sock.recv(65536)
+        if data:
+            received.extend(data)
+            sock.send(b'0,0,0,0,0')
+            return
+        loop.forget(sock)
+        sock.close()
+
+    loop.add_reader(server, accept)
+    replayer = Replayer(load_sessions(path)[0], Role.MES, speed=0,
+                        loop=loop)
+    replayer.start()
+    assert run_until(lambda: not replayer.pending)
+    assert bytes(received) == b'~HS^XA^FH^FD_7e1010460^FS^XZ'
+    assert replayer.report()['PRN']['received'] > 0
+
+
+def test_device_replay_answers_mes(tmp_path, loop, run_until):
+    probe = listen_socket('127.0.0.1', 0)
+    port = probe.getsockname()[1]
+    probe.close()
+    path = tmp_path / 'line.cap'
+    record_session(path, loop, port)
+    replayer = Replayer(load_sessions(path)[0], Role.DEVICE, speed=0,
+                        loop=loop)
+    replayer.start()
+    mes = socket.create_connection(('127.0.0.1', port))
+    mes.setblocking(False)
+    mes.send(b'~HS')
+    received = bytearray()
+
+    def read():
+        try:
+            received.extend(mes.recv(65536))
+        except BlockingIOError:
+            pass
+        return received == b'0,0,0,0,0'
+
+    assert run_until(read)
+    mes.close()
+    assert run_until(lambda: not replayer.pending)
@@ -0,0 +1,74 @@
+import pytest
+
+from channel import Channel, Overflow
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        Channel('BAD', 0)
+
+
+def test_fifo_across_ring_wrap():
+    channel = Channel('RING', 3)
+    channel.extend(['a', 'b'])
+    assert channel.popleft() == 'a'
+    channel.extend(['c', 'd'])
+    assert channel.snapshot() == ['b', 'c', 'd']
+    assert list(channel) == ['b', 'c', 'd']
+    assert [channel.popleft() for _ in range(3)] == ['b', 'c', 'd']
+    with pytest.raises(IndexError):
+        channel.popleft()
+
+
+def test_block_refuses_when_full():
+    channel = Channel('BLOCK', 2, Overflow.BLOCK)
+    assert channel.extend(['a', 'b', 'c']) == 2
+    assert not channel.writable()
+    assert not channel.append('c')
+    assert channel.snapshot() == ['a', 'b']
+    assert channel.dropped == 0
+
+
+def test_drop_oldest_evicts_head():
+    lost = []
+    channel = Channel('OLDEST', 2, Overflow.DROP_OLDEST)
+    channel.on_drop(lost.append)
+    assert channel.writable()
+    assert channel.extend(['a', 'b', 'c']) == 3
+    assert channel.snapshot() == ['b', 'c']
+    assert lost == ['a']
+    assert channel.dropped == 1
+
+
+def test_drop_newest_discards_item():
+    lost = []
+    channel = Channel('NEWEST', 2, Overflow.DROP_NEWEST)
+    channel.on_drop(lost.append)
+    assert channel.extend(['a', 'b', 'c']) == 3
+    assert channel.snapshot() == ['a', 'b']
+    assert lost == ['c']
+    assert channel.stats()['dropped'] == 1
+
+
+def test_listeners_fire_on_transitions():
+    events = []
+    channel = Channel('EVENTS', 2)
+    channel.on_data(lambda: events.append('data'))
+    channel.on_space(lambda: events.append('space'))
+    channel.append('a')
+    channel.append('b')
+    # Данные - только при переходе из пустого, место - из полного
+    assert events == ['data']
+    channel.popleft()
+    channel.popleft()
+    assert events == ['data', 'space']
+
+
+def test_stats_track_flow():
+    channel = Channel('STATS', 4)
+    channel.extend(['a', 'b', 'c'])
+    channel.popleft()
+    assert channel.stats() == {
+        'depth': 2, 'capacity': 4, 'high_water': 3, 'dropped': 0,
+        'total_in': 3, 'total_out': 1,
+    }
@@ -0,0 +1,51 @@
+import json
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+from event_loop import listen_socket
+
+
+EMULATOR = Path(__file__).resolve().parent.parent / 'line_emulator.py'
+
+
+def test_no_command_prints_help():
+    done = subprocess.run([sys.executable, str(EMULATOR)],
+                          capture_output=True, text=True, timeout=30)
+    assert done.returncode == 0
+    assert done.stdout.startswith('usage:')
+
+
+def test_ctrl_c_stops_line_without_traceback(tmp_path):
+    probe = listen_socket('127.0.0.1', 0)
+    port = probe.getsockname()[1]
+    probe.close()
+    topology = tmp_path / 'line.json'
+    topology.write_text(json.dumps({
+        'buffers': [{'name': 'GEN'}],
+        'printers': [{'name': 'GEN', 'buffer': 'GEN', 'generate': 10}],
+        'cameras': [{'name': 'SER', 'port': port, 'source': 'GEN'}],
+    }), encoding='utf-8')
+    process = subprocess.Popen(
+        [sys.executable, str(EMULATOR), 's', '-tp', str(topology)],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    try:
+        for line in process.stdout:
+            if line.startswith('READY'):
+                break
+        process.send_signal(signal.SIGINT)
+        output = process.communicate(timeout=30)[0]
+    finally:
+        process.kill()
+    assert process.returncode == 0
+    assert 'Traceback' not in output
+
+
+def test_agr_count_limited_by_port_plan():
+    # Шестая камера агрегации заняла бы порт VERIF
+    done = subprocess.run([sys.executable, str(EMULATOR), 's', '-a', '6'],
+                          capture_output=True, text=True, timeout=30)
+    assert done.returncode == 2
+    assert 'invalid choice: 6' in done.stderr
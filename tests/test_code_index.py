@@ -0,0 +1,69 @@
+import pytest
+
+from code_index import (
+    AGGREGATED, PRINTED, SENT, BloomFilter, CodeIndex, HashTable, IndexMode,
+    code_key
+)
+
+
+def codes(count: int, prefix: str = '0104600000000') -> list[str]:
+    return [f'{prefix}{n:07}21x' for n in range(count)]
+
+
+@pytest.mark.parametrize('mode', [IndexMode.HASH, IndexMode.BLOOM])
+def test_counts_duplicates_and_unsent(mode):
+    index = CodeIndex(mode, 1000)
+    for code in codes(10):
+        index.printed(code)
+    for code in codes(8):
+        index.sent(code)
+    index.printed(codes(1)[0])
+    index.sent(codes(2)[1])
+    for code in codes(4):
+        index.aggregated(code)
+    index.aggregated(codes(1)[0])
+    assert index.counts == {
+        'printed': 10, 'sent': 8, 'dropped': 0, 'aggregated': 4,
+        'duplicate_printed': 1, 'duplicate_sent': 1,
+        'duplicate_aggregated': 1, 'unsent': 2,
+    }
+    assert index.state(codes(1)[0]) == ['printed', 'sent', 'aggregated']
+
+
+def test_hash_table_grows_without_losing_flags():
+    table = HashTable(16)
+    slots = len(table.keys)
+    keys = [code_key(code) for code in codes(200)]
+    for key in keys:
+        table.add(key, PRINTED)
+    for key in keys[::2]:
+        table.add(key, SENT)
+    assert len(table.keys) > slots
+    assert table.count == 200
+    assert [table.get(key) for key in keys[:4]] == [
+        PRINTED | SENT, PRINTED, PRINTED | SENT, PRINTED
+    ]
+
+
+@pytest.mark.parametrize('stages, bound', [
+    ((PRINTED, SENT), 0.003),
+    ((PRINTED, SENT, AGGREGATED), 0.008),
+])
+def test_bloom_false_duplicates_stay_bounded(stages, bound):
+    # Фильтр заполнен до расчетной емкости: новые КМ ошибочно
+    # считаются напечатанными не чаще bound
+    capacity = 20000
+    bloom = BloomFilter(capacity)
+    for code in codes(capacity):
+        key = code_key(code)
+        for flag in stages:
+            bloom.add(key, flag)
+    fresh = codes(capacity, prefix='0104699999999')
+    false = sum(
+        bool(bloom.get(code_key(code)) & PRINTED) for code in fresh
+    )
+    assert false / capacity <= bound
+    # Ложных пропусков у фильтра Блума не бывает
+    assert all(
+        bloom.get(code_key(code)) & PRINTED for code in codes(capacity)
+    )
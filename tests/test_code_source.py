@@ -0,0 +1,103 @@
+from channel import Channel
+from code_source import MmapCodeSource
+from devices import FilePrinterEmul
+
+
+def write_codes(tmp_path, data: bytes):
+    path = tmp_path / 'codes.txt'
+    path.write_bytes(data)
+    return path
+
+
+def drain(source: MmapCodeSource) -> list[str]:
+    codes = []
+    while source:
+        codes.append(source.popleft())
+    return codes
+
+
+def test_position_points_after_last_issued_code(tmp_path):
+    path = write_codes(tmp_path, b"01\n02\n03\n")
+    source = MmapCodeSource(path, read_ahead=2)
+    assert source.position == 0
+    assert source.popleft() == '01'
+    assert source.position == 3
+    assert source.popleft() == '02'
+    # Буфер опережает выдачу, но позиция - по выданному коду
+    assert source.position == 6
+    assert drain(source) == ['03']
+    assert source.position == 9
+
+
+def test_resume_from_saved_offset(tmp_path):
+    path = write_codes(tmp_path, b"01\n02\n03\n04\n")
+    source = MmapCodeSource(path, read_ahead=1)
+    source.popleft()
+    source.popleft()
+    saved = source.position
+    source.close()
+    assert drain(MmapCodeSource(path, saved)) == ['03', '04']
+    # seek - то же продолжение у открытого источника
+    source = MmapCodeSource(path)
+    drain(source)
+    source.seek(saved)
+    assert drain(source) == ['03', '04']
+
+
+def test_crlf_and_blank_lines_skipped(tmp_path):
+    path = write_codes(tmp_path, b"01\r\n\r\n\n02\r\n  \n03\r\n")
+    source = MmapCodeSource(path)
+    assert drain(source) == ['01', '02', '03']
+    assert source.position == source.size
+
+
+def test_last_line_without_newline(tmp_path):
+    path = write_codes(tmp_path, b"01\n02")
+    source = MmapCodeSource(path, read_ahead=1)
+    assert drain(source) == ['01', '02']
+    assert source.position == source.size == 5
+
+
+def test_empty_file(tmp_path):
+    source = MmapCodeSource(write_codes(tmp_path, b""))
+    assert not source
+    assert len(source) == 0
+    assert source.batch(10) == []
+    source.close()
+
+
+def test_len_estimates_remaining_codes(tmp_path):
+    # Строки одной длины: оценка по средней длине точна
+    path = write_codes(tmp_path, b"".join(
+        f"{n:08}\n".encode() for n in range(1000)
+    ))
+    source = MmapCodeSource(path, read_ahead=10)
+    assert len(source) == 1000
+    source.batch(250)
+    assert len(source) == 750
+
+
+def test_batch_stops_at_end_of_file(tmp_path):
+    path = write_codes(tmp_path, b"01\n02\n03\n")
+    source = MmapCodeSource(path, read_ahead=2)
+    assert source.batch(2) == ['01', '02']
+    assert source.batch(5) == ['03']
+    assert source.batch(5) == []
+
+
+def test_file_printer_fills_read_ahead_per_tick(tmp_path, loop):
+    # Один такт пополняет буфер камеры до read_ahead, а не по коду
+    path = write_codes(tmp_path, b"".join(
+        f"{n:08}\n".encode() for n in range(100)
+    ))
+    codes = Channel('CAM', 1000)
+    printer = FilePrinterEmul('FILE', codes, path, read_ahead=40,
+                              loop=loop)
+    assert printer.run()
+    assert len(codes) == 40
+    assert not printer.run()
+    codes.popleft()
+    assert printer.run()
+    assert list(codes)[-1] == f"{40:08}"
+    assert printer.stats()['count'] == 41
+    printer.source.close()
@@ -0,0 +1,113 @@
+import re
+
+import pytest
+
+from codegen import (
+    GTINS, CodeGenerator, gtin_check_digit, normalize_gtin, write_corpus
+)
+from label_parsers import GS
+
+
+@pytest.mark.parametrize('body, digit', [
+    # Примеры GS1: GTIN-13, UPC-A (GTIN-12), GTIN-8, GTIN-14
+    ('400638133393', '1'),
+    ('03600029145', '2'),
+    ('9638507', '4'),
+    ('1001234567890', '2'),
+])
+def test_check_digit_matches_gs1(body, digit):
+    assert gtin_check_digit(body) == digit
+
+
+@pytest.mark.parametrize('gtin, normalized', [
+    ('400638133393', '04006381333931'),
+    ('03600029145', '00036000291452'),
+    ('9638507', '00000096385074'),
+    ('10012345678902', '10012345678902'),
+])
+def test_normalize_pads_and_appends_check_digit(gtin, normalized):
+    assert normalize_gtin(gtin) == normalized
+
+
+def test_default_gtins_are_valid():
+    assert [normalize_gtin(gtin) for gtin in GTINS] == list(GTINS)
+
+
+@pytest.mark.parametrize('gtin, message', [
+    ('10012345678903', 'wrong check digit, expected 2'),
+    ('123456', '7 to 14 digits'),
+    ('100123456789021', '7 to 14 digits'),
+    ('0460393400079X', '7 to 14 digits'),
+])
+def test_invalid_gtin_rejected(gtin, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_gtin(gtin)
+    with pytest.raises(ValueError, match=message):
+        CodeGenerator([gtin])
+
+
+@pytest.mark.parametrize('tail, pattern', [
+    ('full', rf'0104603934000793210{{8}}\d{{5}}{GS}91.{{4}}{GS}92.{{44}}'),
+    ('short', rf'0104603934000793210{{8}}\d{{5}}{GS}93.{{4}}'),
+])
+def test_code_layout(tail, pattern):
+    codes = CodeGenerator(['04603934000793'], seed=1, tail=tail).batch(50)
+    assert all(re.fullmatch(pattern, code) for code in codes)
+    assert [code[18:31] for code in codes] == [
+        f"{serial:013}" for serial in range(50)
+    ]
+
+
+@pytest.mark.parametrize('gtin, ai', [
+    ('05060367340398', '3353'),
+    ('07808631857726', '3103'),
+])
+def test_weight_suffix_for_gtin_rules(gtin, ai):
+    codes = CodeGenerator([gtin], seed=2).batch(200)
+    for code in codes:
+        suffix = re.search(rf'{GS}{ai}(\d{{6}})$', code)
+        assert suffix is not None
+        assert 100 <= int(suffix.group(1)) <= 1000
+    # Без весов хвост заканчивается криптокодом
+    plain = CodeGenerator([gtin], seed=2, weights=False).batch(10)
+    assert not any(f"{GS}{ai}" in code for code in plain)
+
+
+def test_no_weight_suffix_for_other_gtins():
+    codes = CodeGenerator(['04603934000793'], seed=3).batch(100)
+    assert all(code.count(GS) == 2 for code in codes)
+
+
+def test_serial_exhaustion_raises_instead_of_wrapping():
+    generator = CodeGenerator(seed=4, serial_length=3, start=995)
+    assert len(generator.batch(5)) == 5
+    assert generator.serial == 1000
+    with pytest.raises(ValueError, match='exhausted at 1000'):
+        generator.batch(1)
+    # Пачка, не помещающаяся целиком, не выдается и не сдвигает номер
+    generator = CodeGenerator(seed=4, serial_length=3, start=998)
+    with pytest.raises(ValueError, match='exhausted at 998'):
+        generator.batch(3)
+    assert generator.serial == 998
+
+
+def test_fixed_seed_repeats_output():
+    def run(seed) -> list[str]:
+        generator = CodeGenerator(seed=seed, start=100)
+        return [code for codes in generator.batches(2500, 1000)
+                for code in codes]
+
+    codes = run(5)
+    assert codes == run(5)
+    assert codes != run(6)
+    assert len(set(codes)) == len(codes) == 2500
+
+
+def test_write_corpus(tmp_path):
+    path = tmp_path / 'dm.csv'
+    generator = CodeGenerator(seed=6)
+    assert write_corpus(path, generator, 25, batch=10) == 25
+    lines = path.read_text(encoding='utf-8').split('\n')
+    assert lines[-1] == ''
+    expected = CodeGenerator(seed=6).batches(25, 10)
+    assert lines[:-1] == [code for codes in expected for code in codes]
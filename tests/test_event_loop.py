@@ -0,0 +1,58 @@
+import socket
+from time import monotonic
+
+
+def test_timers_fire_in_deadline_order(loop, run_until):
+    fired = []
+    now = monotonic()
+    loop.call_at(now + 0.03, fired.append, 'late')
+    loop.call_at(now + 0.01, fired.append, 'early')
+    loop.call_soon(fired.append, 'soon')
+    assert run_until(lambda: len(fired) == 3)
+    assert fired == ['soon', 'early', 'late']
+
+
+def test_cancelled_timer_does_not_fire(loop, run_until):
+    fired = []
+    loop.call_later(0.01, fired.append, 'cancelled').cancel()
+    loop.call_later(0.02, fired.append, 'kept')
+    assert run_until(lambda: fired)
+    loop.run_once(0.02)
+    assert fired == ['kept']
+
+
+def test_reader_and_writer_share_socket(loop, run_until):
+    left, right = socket.socketpair()
+    left.setblocking(False)
+    received = []
+    writable = []
+    loop.add_reader(left, lambda: received.append(left.recv(100)))
+    loop.add_writer(left, lambda: writable.append(True))
+    right.send(b'ping')
+    assert run_until(lambda: received and writable)
+    assert received == [b'ping']
+    # Снятие писателя не отменяет читателя
+    loop.remove_writer(left)
+    right.send(b'pong')
+    assert run_until(lambda: len(received) == 2)
+    assert received[1] == b'pong'
+    loop.forget(left)
+    left.close()
+    right.close()
+
+
+def test_callback_error_does_not_stop_loop(loop, run_until):
+    fired = []
+
+    def broken():
+        raise RuntimeError('boom')
+
+    loop.call_soon(broken)
+    loop.call_soon(fired.append, 'after')
+    assert run_until(lambda: fired)
+
+
+def test_stop_from_callback(loop):
+    loop.call_later(0.01, loop.stop)
+    loop.run_forever()
+    assert not loop._running
@@ -0,0 +1,45 @@
+import logging
+from queue import Queue
+
+from eventlog import DeferredQueueHandler, DeviceLog
+
+
+def record(msg: str) -> logging.LogRecord:
+    return logging.LogRecord('root', logging.INFO, __file__, 0, msg,
+                             None, None)
+
+
+def test_full_log_queue_drops_and_reports():
+    queue = Queue(2)
+    handler = DeferredQueueHandler(queue)
+    for n in range(4):
+        handler.handle(record(f"event {n}"))
+    assert handler.dropped == 2
+    assert [queue.get().msg for _ in range(2)] == ["event 0", "event 1"]
+    handler.handle(record("event 4"))
+    summary = queue.get()
+    assert summary.levelno == logging.WARNING
+    assert summary.getMessage() == "2 log records dropped: log queue full"
+    assert queue.get().msg == "event 4"
+    assert handler.dropped == 0
+
+
+def test_debug_needs_debug_level(caplog):
+    caplog.set_level(logging.INFO)
+    log = DeviceLog('PRN')
+    log.debug("frame %s", 'text')
+    assert not caplog.records
+    assert log.suppressed == 0
+
+
+def test_debug_shares_event_rate_limit(caplog):
+    caplog.set_level(logging.DEBUG)
+    log = DeviceLog('PRN')
+    log.rate = log.tokens = 2
+    log.event('PRINTED', '01', "printed %s", '01')
+    log.debug("frame %s", 'a')
+    log.debug("frame %s", 'b')
+    assert [r.getMessage() for r in caplog.records] == [
+        "printed 01", "frame a"
+    ]
+    assert log.suppressed == 1
@@ -0,0 +1,99 @@
+import pytest
+
+from faults import (
+    BAD_CODES, GOOD_CODES, PROFILES, Fault, FaultInjector, device_rng
+)
+
+
+SAMPLES = 500_000
+
+
+def verdicts(injector: FaultInjector, count: int) -> tuple[list, ...]:
+    return (
+        [injector.fault() for _ in range(count)],
+        [injector.drop() for _ in range(count)],
+        [injector.quality() for _ in range(count)],
+    )
+
+
+def stationary_rate(percent: float, burst_percent: float,
+                    enter: float, exit: float) -> float:
+    # Доля кодов в плохом состоянии цепи Гилберта-Эллиотта
+    bad = enter / (enter + exit) if enter else 0.0
+    return ((1 - bad) * percent + bad * burst_percent) / 100
+
+
+@pytest.mark.parametrize('profile', ['flat', 'bursty', 'storm'])
+def test_same_seed_repeats_fault_sequence(profile):
+    # Пачки меньше выборки: повторяется и стык пачек
+    def make() -> FaultInjector:
+        return FaultInjector('DMSER', 5, 3, 10, PROFILES[profile],
+                             seed=42, batch=1000)
+
+    assert verdicts(make(), 5000) == verdicts(make(), 5000)
+
+
+def test_streams_depend_on_device_and_seed():
+    def make(name: str, seed: int) -> FaultInjector:
+        return FaultInjector(name, 5, 3, 10, PROFILES['bursty'], seed=seed)
+
+    base = verdicts(make('AGR_0', 1), 2000)
+    assert verdicts(make('AGR_1', 1), 2000) != base
+    assert verdicts(make('AGR_0', 2), 2000) != base
+    assert device_rng('AGR_0', 'codes', 1).random() == \
+        device_rng('AGR_0', 'codes', 1).random()
+
+
+@pytest.mark.parametrize('profile', ['flat', 'bursty'])
+def test_long_run_rates_match_stationary_rates(profile):
+    fault_profile = PROFILES[profile]
+    injector = FaultInjector('DMSER', 2, 1, 10, fault_profile, seed=7)
+    faults, drops, grades = verdicts(injector, SAMPLES)
+    error_rate = stationary_rate(
+        2, fault_profile.burst_error_percent,
+        fault_profile.burst_enter, fault_profile.burst_exit
+    )
+    drop_rate = stationary_rate(
+        1, fault_profile.burst_drop_percent,
+        fault_profile.burst_enter, fault_profile.burst_exit
+    )
+    measured = sum(fault is not Fault.NONE for fault in faults) / SAMPLES
+    assert measured == pytest.approx(error_rate, rel=0.1)
+    assert sum(drops) / SAMPLES == pytest.approx(drop_rate, rel=0.1)
+    # Брак качества пачками не идет
+    bad = sum(grade in BAD_CODES for grade in grades) / SAMPLES
+    assert bad == pytest.approx(0.1, rel=0.05)
+    assert set(grades) <= set(GOOD_CODES + BAD_CODES)
+
+
+def test_bursty_profile_raises_error_and_drop_rates():
+    def rates(profile: str) -> tuple[float, float]:
+        injector = FaultInjector('DMSER', 2, 1, profile=PROFILES[profile],
+                                 seed=11)
+        faults, drops, _ = verdicts(injector, SAMPLES // 5)
+        errors = sum(fault is not Fault.NONE for fault in faults)
+        return errors / len(faults), sum(drops) / len(drops)
+
+    flat_errors, flat_drops = rates('flat')
+    bursty_errors, bursty_drops = rates('bursty')
+    assert bursty_errors > 1.2 * flat_errors
+    assert bursty_drops > 1.2 * flat_drops
+
+
+def test_duplicate_share_splits_faults():
+    injector = FaultInjector('DMSER', 20, profile=PROFILES['storm'], seed=3)
+    faults = [injector.fault() for _ in range(SAMPLES // 5)]
+    duplicates = faults.count(Fault.DUPLICATE)
+    errors = faults.count(Fault.ERROR)
+    share = PROFILES['storm'].duplicate_share
+    assert duplicates / (duplicates + errors) == pytest.approx(
+        share, rel=0.1
+    )
+
+
+def test_zero_percent_never_faults():
+    injector = FaultInjector('DMSER', profile=PROFILES['storm'], seed=1)
+    faults, drops, grades = verdicts(injector, 20_000)
+    assert set(faults) == {Fault.NONE}
+    assert not any(drops)
+    assert set(grades) <= set(GOOD_CODES)
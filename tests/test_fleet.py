@@ -0,0 +1,71 @@
+import argparse
+import json
+from pathlib import Path
+
+import pytest
+
+import fleet
+from devices import MAX_AGR_COUNT, check_agr_count
+
+
+OPTIONS = {'read_interval': 0.05, 'agr_count': 3, 'topology': None}
+
+
+def write_config(tmp_path, lines) -> Path:
+    path = tmp_path / 'lines.json'
+    path.write_text(json.dumps(lines), encoding='utf-8')
+    return path
+
+
+def test_no_lines_config():
+    assert fleet.load_lines_config(None, OPTIONS) == []
+
+
+def test_lines_config_overrides(tmp_path):
+    lines = [{'read_interval': 0.1}, {}, {'agr_count': 0}]
+    path = write_config(tmp_path, lines)
+    assert fleet.load_lines_config(path, OPTIONS) == lines
+
+
+@pytest.mark.parametrize('lines, message', [
+    ({'read_interval': 0.1}, 'expected a list'),
+    ([{}, {'read_intreval': 0.1}], "line 1: unknown ['read_intreval']"),
+])
+def test_lines_config_rejected(tmp_path, lines, message):
+    path = write_config(tmp_path, lines)
+    with pytest.raises(ValueError, match=message.replace('[', r'\[')):
+        fleet.load_lines_config(path, OPTIONS)
+
+
+def test_summarize_adds_devices_across_lines():
+    latest = {
+        0: [{'name': 'DMSER', 'count': 10, 'clients': 1},
+            {'name': 'AGR_0', 'count': 4, 'clients': 0}],
+        1: [{'name': 'DMSER', 'count': 7, 'clients': 2}],
+    }
+    assert fleet.summarize(latest) == {
+        'DMSER': {'lines': 2, 'count': 17, 'clients': 3},
+        'AGR_0': {'lines': 1, 'count': 4, 'clients': 0},
+    }
+    assert fleet.summarize({}) == {}
+
+
+@pytest.mark.parametrize('count', range(MAX_AGR_COUNT + 1))
+def test_agr_count_within_port_plan(count):
+    # Последняя камера агрегации не доходит до порта VERIF (32)
+    check_agr_count(count)
+    assert 27 + count - 1 < 32
+
+
+@pytest.mark.parametrize('count', [-1, MAX_AGR_COUNT + 1, 9])
+def test_agr_count_colliding_with_verif_rejected(count):
+    with pytest.raises(ValueError, match='port 32 is VERIF'):
+        check_agr_count(count)
+
+
+def test_fleet_rejects_line_override_before_start(tmp_path):
+    # Ошибка описания линии видна до запуска процессов
+    path = write_config(tmp_path, [{}, {'agr_count': 6}])
+    args = argparse.Namespace(lines_config=path, **OPTIONS)
+    with pytest.raises(ValueError, match='agr_count 6'):
+        fleet.run_fleet(args)
@@ -0,0 +1,81 @@
+import pytest
+
+from framing import Dialect, FrameKind, FrameReader
+
+
+def split_feed(data: bytes, step: int, final: bool = True) -> list:
+    # Поток приходит кусками по step байт, как короткие чтения сокета
+    reader = FrameReader(size=16)
+    frames = []
+    for pos in range(0, len(data), step):
+        reader.feed(data[pos:pos + step])
+        frames.extend(reader.frames())
+    if final:
+        frames.extend(reader.frames(final=True))
+    return frames
+
+
+ZPL_JOB = b"^XA^FO50,50^BXN,5,200^FD010460123456789021abc^FS^XZ"
+ESC_JOB = b"\x1bA\x1bH0050\x1bV0050\x1bBX010460123456789021abc\x1bQ1\x1bZ"
+
+
+@pytest.mark.parametrize('step', [1, 2, 3, 7, 64])
+def test_zpl_jobs_across_chunks(step):
+    frames = split_feed(ZPL_JOB + b"\r\n" + ZPL_JOB, step)
+    assert frames == [(FrameKind.JOB, Dialect.ZPL, ZPL_JOB.decode())] * 2
+
+
+@pytest.mark.parametrize('step', [1, 2, 5, 64])
+def test_esc_jobs_across_chunks(step):
+    frames = split_feed(ESC_JOB + ESC_JOB, step)
+    assert frames == [(FrameKind.JOB, Dialect.ESC, ESC_JOB.decode())] * 2
+
+
+@pytest.mark.parametrize('step', [1, 4, 64])
+def test_line_job_ends_at_next_command(step):
+    # Построчное задание отдается по мере прихода целых строк, но не
+    # захватывает следующую за ним команду
+    line_job = (
+        b'SIZE 58 mm,40 mm\r\nDMATRIX 10,10,"0104601234"\r\nPRINT 1\r\n'
+    )
+    frames = split_feed(line_job + b"~HS" + ZPL_JOB, step)
+    lines = [frame for frame in frames if frame[1] is Dialect.LINE]
+    assert all(kind is FrameKind.JOB for kind, _, _ in lines)
+    assert [
+        line for _, _, text in lines for line in text.splitlines()
+    ] == line_job.decode().splitlines()
+    assert frames[len(lines):] == [
+        (FrameKind.STATUS, None, "~HS"),
+        (FrameKind.JOB, Dialect.ZPL, ZPL_JOB.decode()),
+    ]
+
+
+@pytest.mark.parametrize('step', [1, 3])
+def test_status_commands_without_terminator(step):
+    frames = split_feed(b"\x1b!?~HS~S,CHECK", step)
+    assert [text for _, _, text in frames] == ["\x1b!?", "~HS", "~S,CHECK"]
+    assert all(kind is FrameKind.STATUS for kind, _, _ in frames)
+
+
+def test_incomplete_job_waits_for_terminator():
+    reader = FrameReader(size=16)
+    reader.feed(ZPL_JOB[:-3])
+    assert list(reader.frames()) == []
+    reader.feed(ZPL_JOB[-3:])
+    assert list(reader.frames()) == [
+        (FrameKind.JOB, Dialect.ZPL, ZPL_JOB.decode())
+    ]
+    assert len(reader) == 0
+
+
+def test_final_flushes_unterminated_tail():
+    frames = split_feed(ZPL_JOB[:-3], 5)
+    assert frames == [(FrameKind.JOB, Dialect.ZPL, ZPL_JOB[:-3].decode())]
+
+
+def test_buffer_grows_for_long_job():
+    # Задание длиннее начального буфера не теряется при перекладке
+    job = b"^XA" + b"^FDx" * 500 + b"^XZ"
+    assert split_feed(job * 3, 13, final=False) == [
+        (FrameKind.JOB, Dialect.ZPL, job.decode())
+    ] * 3
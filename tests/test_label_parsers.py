@@ -0,0 +1,68 @@
+from random import Random
+
+import pytest
+
+import label_parsers
+from framing import Dialect
+from label_parsers import (
+    GS, PARSERS, RowRule, apply_gtin_rules, gtin_of, register_rule
+)
+
+
+CODE = '0104601234567890215abcDEF' + GS + '93Abcd'
+
+
+@pytest.mark.parametrize('dialect, text, code', [
+    (Dialect.LINE, f'BARCODE={CODE}', CODE),
+    (Dialect.LINE, f'DMATRIX 10,10,400,400,"{CODE}"\r', CODE),
+    (Dialect.LINE, f'BARCODE 10,10,"DMATRIX",1,2,"~1{CODE}"\r', CODE),
+    (Dialect.LINE, f'XRB0,0,4,0,48\r\n{CODE}\r\nW', CODE),
+    (Dialect.ESC, f'\x1bBR,24,24,2,5,250,0,1,{CODE}', CODE),
+    # _7e1 - FNC1 в hex-записи ZPL: перед AI 01 остается символ 1
+    (Dialect.ZPL, f'^XA^BXN,5,200\n^FH^FD_7e1{CODE}^FS\n^XZ', '1' + CODE),
+])
+def test_each_dialect_extracts_code(dialect, text, code):
+    assert PARSERS[dialect].parse(text) == ([code], False)
+
+
+def test_zpl_parser_ignores_line_rules():
+    codes, _ = PARSERS[Dialect.ZPL].parse(f'BARCODE={CODE}')
+    assert codes == []
+
+
+def test_quote_escape_in_tspl_field():
+    codes, _ = PARSERS[Dialect.LINE].parse(
+        'DMATRIX 10,10,400,400,"01046012~d034345"'
+    )
+    assert codes == ['01046012"345']
+
+
+def test_next_row_code_across_frames():
+    # Данные EZPL XRB могут прийти следующим кадром
+    parser = PARSERS[Dialect.LINE]
+    codes, pending = parser.parse('XRB0,0,4,0,48')
+    assert (codes, pending) == ([], True)
+    codes, pending = parser.parse(f'{CODE}\r\nW', pending)
+    assert (codes, pending) == ([CODE], False)
+
+
+def test_register_rule_extends_selected_dialects(monkeypatch):
+    monkeypatch.setattr(label_parsers, 'PARSERS', dict(PARSERS))
+    register_rule(
+        RowRule('qr', r'QR ', label_parsers._after_keyword),
+        [Dialect.LINE],
+    )
+    codes, _ = label_parsers.PARSERS[Dialect.LINE].parse(f'QR {CODE}')
+    assert codes == [CODE]
+    codes, _ = label_parsers.PARSERS[Dialect.ESC].parse(f'QR {CODE}')
+    assert codes == []
+
+
+def test_gtin_rules_append_measure_ai():
+    assert gtin_of('0105060367340398215abc') == '05060367340398'
+    assert gtin_of('\x1d0105060367340398215abc') == '05060367340398'
+    code = apply_gtin_rules('0105060367340398215abc', Random(1))
+    head, ai = code.split(GS)
+    assert head == '0105060367340398215abc'
+    assert ai.startswith('3353') and 100 <= int(ai[4:]) <= 1000
+    assert apply_gtin_rules(CODE) == CODE
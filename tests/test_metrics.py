@@ -0,0 +1,91 @@
+import socket
+
+from metrics import MetricsServer, Registry
+
+
+def test_exposition_format():
+    registry = Registry()
+    registry.counter('codes_total', 'Все КМ').labels().inc(3)
+    gauge = registry.gauge('depth', 'Глубина', ('device',))
+    gauge.labels('CAM').set_function(lambda: 7)
+    assert registry.render() == (
+        '# HELP codes_total Все КМ\n'
+        '# TYPE codes_total counter\n'
+        'codes_total 3\n'
+        '# HELP depth Глубина\n'
+        '# TYPE depth gauge\n'
+        'depth{device="CAM"} 7\n'
+    )
+
+
+def test_labelled_counters_are_separate_series():
+    registry = Registry()
+    dropped = registry.counter('dropped_total', 'Потери',
+                               ('device', 'reason'))
+    dropped.labels('CAM', 'drop_dm').inc()
+    dropped.labels('CAM', 'drop_dm').inc(2)
+    dropped.labels('AGR_0', 'backpressure').inc()
+    # Кавычки и переводы строк в значениях меток экранируются
+    dropped.labels('A"B', 'x\ny').inc()
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'dropped_total{device="CAM",reason="drop_dm"} 3',
+        'dropped_total{device="AGR_0",reason="backpressure"} 1',
+        'dropped_total{device="A\\"B",reason="x\\ny"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    seconds = registry.histogram('parse_seconds', 'Разбор', ('device',),
+                                 buckets=(0.1, 1.0))
+    child = seconds.labels('PRN')
+    for value in (0.05, 0.1, 0.5, 2.0):
+        child.observe(value)
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'parse_seconds_bucket{device="PRN",le="0.1"} 2',
+        'parse_seconds_bucket{device="PRN",le="1.0"} 3',
+        'parse_seconds_bucket{device="PRN",le="+Inf"} 4',
+        'parse_seconds_sum{device="PRN"} 2.65',
+        'parse_seconds_count{device="PRN"} 4',
+    ]
+
+
+def test_histogram_without_labels():
+    registry = Registry()
+    registry.histogram('latency', 'Задержка', buckets=(1.0,)).labels()
+    assert registry.render().splitlines()[2:] == [
+        'latency_bucket{le="1.0"} 0',
+        'latency_bucket{le="+Inf"} 0',
+        'latency_sum 0.0',
+        'latency_count 0',
+    ]
+
+
+def test_server_time_accounted_to_metrics(loop, run_until):
+    # Обработчики сервера - partial от его методов: время цикла
+    # относится к METRICS, а не к <other>
+    registry = Registry()
+    registry.counter('codes_total', 'Все КМ').labels().inc()
+    server = MetricsServer(0, registry, loop=loop)
+    server.start()
+    loop.enable_cpu_accounting()
+    client = socket.create_connection(('127.0.0.1', server.port))
+    client.sendall(b'GET /metrics HTTP/1.1\r\n\r\n')
+    response = b''
+
+    def closed() -> bool:
+        nonlocal response
+        try:
+            data = client.recv(4096, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return False
+        response += data
+        return not data
+
+    assert run_until(closed)
+    client.close()
+    assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert response.endswith(b'codes_total 1\n')
+    assert set(loop.cpu_time) == {'METRICS'}
@@ -0,0 +1,130 @@
+from time import monotonic
+
+import pytest
+
+from pacing import IDLE_POLL, MAX_BURST, PaceMode, Pacer
+
+
+class Source:
+    # emit() для Pacer: отдает коды, пока они есть, и запоминает
+    # дедлайн, к которому относится каждая передача
+    def __init__(self, codes: int):
+        self.codes = codes
+        self.calls = 0
+        self.deadlines = []
+        self.pacer = None
+
+    def emit(self) -> bool:
+        self.calls += 1
+        if not self.codes:
+            return False
+        self.codes -= 1
+        self.deadlines.append(self.pacer.deadline)
+        return True
+
+
+def make_pacer(loop, codes: int, interval: float,
+               mode: PaceMode = PaceMode.FIXED) -> tuple[Pacer, Source]:
+    source = Source(codes)
+    source.pacer = Pacer(loop, 'TEST', interval, source.emit, mode)
+    return source.pacer, source
+
+
+def test_fixed_emits_on_interval_grid(loop, run_until):
+    pacer, source = make_pacer(loop, 5, 0.02)
+    pacer.start()
+    assert run_until(lambda: pacer.total == 5)
+    # Дедлайны считаются от старта, а не от момента вызова
+    assert source.deadlines == pytest.approx(
+        [pacer.started + 0.02 * n for n in range(1, 6)]
+    )
+    assert monotonic() - pacer.started >= 0.1
+
+
+def test_fixed_late_loop_catches_up_within_burst(loop):
+    pacer, _ = make_pacer(loop, 1000, 0.001)
+    pacer.start()
+    pacer.deadline -= 1.0
+    pacer.timer.cancel()
+    pacer.tick()
+    assert pacer.total == MAX_BURST
+    # Остаток опоздания отброшен: следующий код через интервал
+    assert pacer.deadline > monotonic()
+
+
+def test_fixed_idle_backs_off_and_wakes(loop, run_until):
+    pacer, source = make_pacer(loop, 0, 0.001)
+    pacer.start()
+    loop.run_once(0.01)
+    assert pacer.idle
+    run_until(lambda: False, timeout=0.2)
+    # Без работы опрос не чаще IDLE_POLL, а не каждый интервал
+    assert source.calls <= 0.2 / IDLE_POLL + 2
+    source.codes = 3
+    woken = monotonic()
+    pacer.wake()
+    assert run_until(lambda: pacer.total == 3)
+    assert source.deadlines[0] >= woken
+    assert monotonic() - woken < IDLE_POLL
+
+
+def test_fixed_wake_keeps_cadence_when_busy(loop, run_until):
+    pacer, _ = make_pacer(loop, 100, 0.05)
+    pacer.start()
+    deadline = pacer.deadline
+    pacer.wake()
+    loop.run_once(0)
+    assert pacer.total == 0
+    assert pacer.deadline == deadline
+
+
+def test_consumer_drains_and_polls_when_empty(loop, run_until):
+    pacer, source = make_pacer(loop, 250, 0.1, PaceMode.CONSUMER)
+    pacer.start()
+    assert run_until(lambda: pacer.total == 250, timeout=0.5)
+    calls = source.calls
+    loop.run_once(0.01)
+    # Пусто: следующий опрос через IDLE_POLL
+    assert pacer.timer.deadline - monotonic() > IDLE_POLL / 2
+    source.codes = 1
+    pacer.wake()
+    assert run_until(lambda: pacer.total == 251, timeout=IDLE_POLL / 2)
+    assert source.calls == calls + 2
+
+
+def test_stop_from_emit_cancels_timer(loop, run_until):
+    pacer, source = make_pacer(loop, 2, 0.01)
+
+    def emit():
+        if not source.codes:
+            pacer.stop()
+            return False
+        return Source.emit(source)
+
+    pacer.emit = emit
+    pacer.start()
+    assert run_until(lambda: not pacer.running)
+    assert pacer.total == 2
+    assert pacer.timer is None
+
+
+def test_set_interval_keeps_gap_from_previous_code(loop):
+    pacer, _ = make_pacer(loop, 100, 1.0)
+    pacer.start()
+    deadline = pacer.deadline
+    pacer.set_interval(2.0)
+    assert pacer.deadline == pytest.approx(deadline + 1.0)
+    assert pacer.timer.deadline == pacer.deadline
+
+
+def test_shorter_interval_does_not_burst(loop):
+    pacer, _ = make_pacer(loop, 1000, 10.0)
+    pacer.start()
+    # Предыдущий код был 9 с назад: по новому интервалу следующий уже
+    # просрочен, но догонять пропущенное нечего
+    pacer.deadline = monotonic() + 1.0
+    changed = monotonic()
+    pacer.set_interval(0.01)
+    assert pacer.deadline >= changed
+    loop.run_once(0)
+    assert pacer.total <= 1
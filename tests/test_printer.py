@@ -0,0 +1,126 @@
+import socket
+
+import pytest
+
+from channel import Channel
+from devices import PrinterClient, PrinterEmul
+
+
+ESC_JOB = "\x1bA\x1bBR,24,24,2,5,250,0,1,{}\r\n\x1bQ1\x1bZ"
+CODES = ["0104601234567890215abcd", "0104601234567890216efgh"]
+
+
+@pytest.fixture
+def printer(loop):
+    # Принтер на свободном порту без трассировки и журнала
+    printer = PrinterEmul('PRN', Channel('PRN', 100), 0, loop=loop,
+                          traced=False)
+    printer.start()
+    yield printer
+    for sock in list(printer.connections):
+        sock.close()
+
+
+@pytest.fixture
+def connect(printer, run_until):
+    # Настоящий TCP-клиент: данные идут через receive() и FrameReader
+    peers = []
+
+    def make() -> tuple[socket.socket, PrinterClient]:
+        peer = socket.create_connection(('127.0.0.1',
+                                         printer.server.getsockname()[1]))
+        peers.append(peer)
+        assert run_until(lambda: printer.connections)
+        client = next(iter(printer.connections.values()))
+        return peer, client
+
+    yield make
+    for peer in peers:
+        peer.close()
+
+
+def read_reply(peer: socket.socket, size: int, run_until) -> bytes:
+    data = b""
+
+    def received() -> bool:
+        nonlocal data
+        try:
+            data += peer.recv(4096, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            pass
+        return len(data) >= size
+
+    assert run_until(received)
+    return data
+
+
+def test_pipelined_status_commands_answered_in_order(printer, connect,
+                                                     run_until):
+    # Несколько запросов статуса в одном сегменте: ответ на каждый
+    peer, _ = connect()
+    peer.sendall(b"\x1b!?~HS~S,CHECK~S,LABEL")
+    expected = b"\x00" + b"0,0,0,0,0" + b"00" + b"0"
+    assert read_reply(peer, len(expected), run_until) == expected
+
+
+def test_job_split_across_reads_with_status_between(printer, connect,
+                                                    run_until):
+    # Задание приходит частями, между заданиями опрос буфера
+    peer, client = connect()
+    first = ESC_JOB.format(CODES[0]).encode()
+    second = ESC_JOB.format(CODES[1]).encode()
+    chunks = [
+        first[:10],
+        first[10:] + b"~HS" + second[:7],
+        second[7:],
+    ]
+    # Хвост каждой части ждет следующего чтения в FrameReader
+    pending = [10, 7, 0]
+    for chunk, tail in zip(chunks, pending):
+        peer.sendall(chunk)
+        assert run_until(lambda: len(client.reader) == tail)
+    # Кадр ~HS сначала печатает разобранную этикетку, затем отвечает
+    # пустым буфером; второе задание разобрано после склейки
+    assert read_reply(peer, 9, run_until) == b"0,0,0,0,0"
+    assert printer.i == 3
+    assert list(printer.dm_list) == CODES[:1]
+    assert list(client.print_buffer) == CODES[1:]
+
+
+def test_partial_send_is_flushed_by_writer(printer, loop, run_until):
+    sock, peer = socket.socketpair()
+    sock.setblocking(False)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    client = PrinterClient(sock)
+    printer.connections[sock] = client
+    data = bytes(range(256)) * 4096
+    printer.send(client, data)
+    # Сокет принял только часть, остаток ждет записи
+    assert client.tx
+    assert len(client.tx) < len(data)
+    # Новые ответы встают за хвостом, а не обгоняют его
+    printer.send(client, b"00")
+    received = bytearray()
+
+    def drained() -> bool:
+        try:
+            received.extend(peer.recv(65536, socket.MSG_DONTWAIT))
+        except BlockingIOError:
+            pass
+        return len(received) == len(data) + 2
+
+    assert run_until(drained, timeout=5.0)
+    assert bytes(received) == data + b"00"
+    assert not client.tx
+    peer.close()
+
+
+def test_send_failure_disconnects_client(printer):
+    sock, peer = socket.socketpair()
+    sock.setblocking(False)
+    client = PrinterClient(sock)
+    printer.connections[sock] = client
+    peer.close()
+    printer.send(client, b"00")
+    assert sock not in printer.connections
+    assert sock.fileno() == -1
@@ -0,0 +1,121 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from channel import Overflow
+from topology import load_topology
+
+
+TOPOLOGIES = Path(__file__).resolve().parent.parent / 'topologies'
+
+
+def line(**changes) -> dict:
+    # Минимальная линия: принтер, буфер и камера сериализации
+    data = {
+        'buffers': [{'name': 'PRN'}],
+        'printers': [{'name': 'PRN', 'port': 9101, 'buffer': 'PRN'}],
+        'cameras': [{'name': 'SER', 'port': 23, 'source': 'PRN'}],
+    }
+    data.update(changes)
+    return data
+
+
+def load(tmp_path: Path, data: dict):
+    path = tmp_path / 'line.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return load_topology(path)
+
+
+@pytest.mark.parametrize('path', sorted(TOPOLOGIES.glob('*.toml')),
+                         ids=lambda path: path.name)
+def test_bundled_topologies_load(path):
+    assert load_topology(path).cameras
+
+
+def test_defaults_fill_buffers_and_cameras(tmp_path):
+    topology = load(tmp_path, line(defaults={
+        'buffer_size': 50, 'overflow': 'drop_oldest', 'read_interval': 0.5,
+    }))
+    assert topology.buffers['PRN']['size'] == 50
+    assert topology.buffers['PRN']['overflow'] is Overflow.DROP_OLDEST
+    assert topology.cameras[0]['read_interval'] == 0.5
+    assert topology.ports == [9101, 23]
+
+
+PRINTER = {'name': 'PRN', 'port': 9101, 'buffer': 'PRN'}
+SER = {'name': 'SER', 'port': 23, 'source': 'PRN'}
+
+
+@pytest.mark.parametrize('changes, error', [
+    ({'lines': []}, "unknown sections ['lines']"),
+    ({'cameras': [{**SER, 'speed': 1}]}, "unknown ['speed']"),
+    ({'cameras': [{'name': 'SER', 'source': 'PRN'}]}, "port is required"),
+    ({'cameras': [{**SER, 'port': '23'}]}, "port must be int"),
+    ({'cameras': [{**SER, 'port': True}]}, "port must be int"),
+    ({'buffers': [{'name': 'PRN', 'overflow': 'spill'}]},
+     "overflow must be one of"),
+    ({'buffers': [{'name': 'PRN', 'size': 0}]}, "size must be positive"),
+    ({'buffers': [{'name': 'PRN'}, {'name': 'PRN'}]}, "defined twice"),
+    ({'printers': [], 'cameras': [], 'buffers': []}, "no devices"),
+    ({'cameras': [{**SER, 'name': 'PRN'}]}, "device PRN is defined twice"),
+    ({'cameras': [{**SER, 'port': 9101}]}, "already used by PRN"),
+    ({'cameras': [{**SER, 'port': 70000}]}, "out of range"),
+    ({'cameras': [{**SER, 'source': 'BOX'}]}, "unknown buffer BOX"),
+    ({'cameras': [{**SER, 'stack': 0}]}, "stack must be positive"),
+    ({'cameras': [{**SER, 'drop_percent': 101}]}, "within 0..100"),
+    ({'cameras': [{**SER, 'file': 'dm.csv'}]},
+     "exactly one of source and file"),
+    ({'printers': [{'name': 'PRN', 'buffer': 'PRN'}]}, "port is required"),
+    ({'printers': [{**PRINTER, 'interval': 0}]}, "interval must be positive"),
+    ({'printers': [{'name': 'PRN', 'buffer': 'PRN', 'generate': 10,
+                    'interval': -0.1}]}, "interval must be positive"),
+    ({'printers': [{'name': 'PRN', 'buffer': 'PRN', 'generate': 10,
+                    'port': 9101}]}, "generator has no port"),
+    ({'printers': [{'name': 'PRN', 'port': 9101}]},
+     "buffer PRN: expected one device writing to it, got none"),
+    ({'printers': [PRINTER, {**PRINTER, 'name': 'PRN2', 'port': 9102}]},
+     "expected one device writing to it, got ['PRN', 'PRN2']"),
+    ({'cameras': [SER, {**SER, 'name': 'SER2', 'port': 24}]},
+     "expected one camera reading it, got ['SER', 'SER2']"),
+    ({'buffers': [{'name': 'PRN'}, {'name': 'BOX'}]},
+     "buffer BOX: expected one device writing to it, got none"),
+])
+def test_validation_errors(tmp_path, changes, error):
+    with pytest.raises(ValueError) as raised:
+        load(tmp_path, line(**changes))
+    assert error in str(raised.value)
+
+
+def test_two_cameras_cannot_share_a_target(tmp_path):
+    data = line(
+        buffers=[{'name': 'A'}, {'name': 'B'}, {'name': 'BOX'}],
+        printers=[
+            {'name': 'PRN_A', 'port': 9101, 'buffer': 'A'},
+            {'name': 'PRN_B', 'port': 9102, 'buffer': 'B'},
+        ],
+        cameras=[
+            {'name': 'SER_A', 'port': 23, 'source': 'A',
+             'targets': ['BOX']},
+            {'name': 'SER_B', 'port': 24, 'source': 'B',
+             'targets': ['BOX']},
+            {'name': 'AGR', 'port': 27, 'source': 'BOX', 'stack': 4},
+        ],
+    )
+    with pytest.raises(ValueError, match=r"expected one device writing"):
+        load(tmp_path, data)
+
+
+def test_loop_between_buffers(tmp_path):
+    data = line(
+        buffers=[{'name': 'PRN'}, {'name': 'BOX'}],
+        cameras=[
+            {'name': 'SER', 'port': 23, 'source': 'PRN',
+             'targets': ['BOX']},
+            {'name': 'AGR', 'port': 27, 'source': 'BOX',
+             'targets': ['PRN']},
+        ],
+        printers=[{'name': 'LEVEL_1', 'port': 9101}],
+    )
+    with pytest.raises(ValueError, match="part of a loop"):
+        load(tmp_path, data)
@@ -0,0 +1,74 @@
+from tracing import LOST, Tracer
+
+
+def test_stages_and_done(loop):
+    tracer = Tracer(10.0, loop)
+    tracer.stamp('01', 'PRN:printed')
+    tracer.stamp('01', 'PRN:buffered')
+    tracer.stamp('01', 'CAM:sent')
+    tracer.done('01')
+    assert not tracer.codes and not tracer.traces
+    assert tracer._stages[('PRN:buffered', 'CAM:sent')].count == 1
+    assert tracer._totals[('PRN:printed', 'CAM:sent')].count == 1
+
+
+def test_duplicate_codes_keep_separate_traces(loop):
+    tracer = Tracer(10.0, loop)
+    tracer.stamp('01', 'PRN:printed')
+    tracer.stamp('01', 'PRN:printed')
+    assert len(tracer.codes['01']) == 2
+    tracer.stamp('01', 'PRN:buffered')
+    first, second = tracer.codes['01']
+    assert first.path == ('PRN:printed', 'PRN:buffered')
+    assert second.path == ('PRN:printed',)
+    tracer.stamp('01', 'CAM:sent')
+    tracer.done('01')
+    # Повтор, напечатанный позже, продолжает свой путь
+    assert tracer.codes['01'] == [second]
+    tracer.stamp('01', 'PRN:buffered')
+    assert second.path == ('PRN:printed', 'PRN:buffered')
+
+
+def test_lost_drops_oldest_repeat(loop):
+    tracer = Tracer(10.0, loop)
+    tracer.stamp('01', 'PRN:buffered')
+    tracer.stamp('01', 'PRN:buffered')
+    second = tracer.codes['01'][1]
+    before = LOST.labels('BUF:overflow').value
+    tracer.lost('01', 'BUF:overflow')
+    assert tracer.codes['01'] == [second]
+    assert LOST.labels('BUF:overflow').value == before + 1
+
+
+def test_sweep_parks_only_stale_traces(loop):
+    tracer = Tracer(10.0, loop)
+    for code in ('01', '02', '03'):
+        tracer.stamp(code, 'PRN:buffered')
+    stale = [tracer.codes['01'][0], tracer.codes['02'][0]]
+    for trace in stale:
+        trace.last -= 20.0
+    tracer.sweep()
+    assert [t.code for t in tracer.parked.values()] == ['01', '02']
+    assert [t.code for t in tracer.traces.values()] == ['03']
+    assert tracer.stuck == {'PRN:buffered': 2}
+    # Повторная проверка не пересчитывает уже зависшие
+    tracer.sweep()
+    assert tracer.stuck == {'PRN:buffered': 2}
+    tracer.stamp('01', 'CAM:sent')
+    assert tracer.stuck == {'PRN:buffered': 1}
+    # Продвинутая трасса теперь последняя в порядке проверки
+    assert [t.code for t in tracer.traces.values()] == ['03', '01']
+    tracer.done('02')
+    assert tracer.stuck == {'PRN:buffered': 0}
+    assert not tracer.parked
+    tracer.stop()
+
+
+def test_sweep_stops_at_first_fresh_trace(loop):
+    tracer = Tracer(10.0, loop)
+    tracer.stamp('01', 'PRN:buffered')
+    tracer.stamp('02', 'PRN:buffered')
+    # Трассы за первой свежей не проверяются: они не старше ее
+    tracer.codes['02'][0].last -= 20.0
+    tracer.sweep()
+    assert not tracer.parked
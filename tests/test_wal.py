@@ -0,0 +1,110 @@
+from pathlib import Path
+
+import pytest
+
+from channel import Channel, Overflow
+from wal import Journal, load_state
+
+
+class Line:
+    # Буфер с камерой, которая набирает пачку в held и снимает ее из
+    # журнала после отправки, и позиция источника
+    def __init__(self, directory: Path, loop, size: int = 10,
+                 overflow: Overflow = Overflow.BLOCK):
+        self.journal = Journal(directory, loop=loop)
+        self.buffer = Channel('BUF', size, overflow)
+        self.held: list[str] = []
+        self.stage = self.journal.channel(self.buffer, self.held)
+        self.position = 0
+        self.journal.cursor(
+            'GEN', lambda: self.position,
+            lambda value: setattr(self, 'position', int(value))
+        )
+        self.journal.start()
+
+    def take(self, count: int):
+        for _ in range(count):
+            self.held.append(self.buffer.popleft())
+
+    def sent(self):
+        self.stage.pop(len(self.held))
+        self.held.clear()
+
+    def crash(self):
+        # Все отданные пачки дописаны, новый снимок не делается
+        self.journal.commit()
+        self.journal.stop()
+
+
+def segment(directory: Path) -> Path:
+    segments = list(directory.glob('wal-*.log'))
+    assert len(segments) == 1
+    return segments[0]
+
+
+@pytest.fixture
+def journals():
+    started = []
+    yield started
+    for line in started:
+        line.journal.stop()
+
+
+def restart(directory, loop, journals, **kwargs) -> Line:
+    line = Line(directory, loop, **kwargs)
+    journals.append(line)
+    return line
+
+
+def test_replay_after_torn_tail(tmp_path, loop, journals):
+    line = restart(tmp_path, loop, journals)
+    line.buffer.extend(['a', 'b', 'c', 'd'])
+    line.position = 4
+    line.take(2)
+    line.sent()
+    line.crash()
+    # Сбой посреди записи пачки: последняя строка без перевода строки
+    with open(segment(tmp_path), 'a', encoding='utf-8') as f:
+        f.write('+BUF\te')
+    state = load_state(tmp_path)
+    assert list(state.stages['BUF']) == ['c', 'd']
+    assert state.cursors == {'GEN': '4'}
+    line = restart(tmp_path, loop, journals)
+    assert line.buffer.snapshot() == ['c', 'd']
+    assert line.position == 4
+
+
+def test_held_codes_return_to_buffer_front(tmp_path, loop, journals):
+    line = restart(tmp_path, loop, journals)
+    line.buffer.extend(['a', 'b', 'c'])
+    # Пачка собрана, но не отправлена до сбоя
+    line.take(2)
+    line.crash()
+    line = restart(tmp_path, loop, journals)
+    assert line.buffer.snapshot() == ['a', 'b', 'c']
+
+
+def test_evicted_code_behind_held_stack(tmp_path, loop, journals):
+    line = restart(tmp_path, loop, journals, size=2,
+                   overflow=Overflow.DROP_OLDEST)
+    line.buffer.extend(['a', 'b', 'c'])
+    # a вытеснен, b выбран камерой
+    line.take(1)
+    # В буфере c и d, e вытесняет c: в журнале перед ним выбранный b
+    line.buffer.extend(['d', 'e'])
+    line.crash()
+    assert list(load_state(tmp_path).stages['BUF']) == ['b', 'd', 'e']
+
+
+def test_restart_writes_fresh_snapshot(tmp_path, loop, journals):
+    line = restart(tmp_path, loop, journals)
+    line.buffer.extend(['a', 'b'])
+    line.crash()
+    before = segment(tmp_path).name
+    line = restart(tmp_path, loop, journals)
+    line.journal.stop()
+    # Восстановленное состояние - в новом снимке, старый сегмент удален
+    assert segment(tmp_path).name != before
+    state = load_state(tmp_path)
+    assert list(state.stages['BUF']) == ['a', 'b']
+    assert state.records == 0
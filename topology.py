@@ -0,0 +1,461 @@
+import json
+import logging
+from enum import Enum
+from pathlib import Path
+
+import faults
+import schedules
+from channel import CHANNEL_SIZE, Channel, Overflow
+from code_source import MmapCodeSource
+from codegen import GTINS, CodeGenerator, normalize_gtin
+from faults import FaultProfile
+from devices import (
+    FILE_PRINT_INTERVAL, SEND_QUEUE, Backpressure, FilePrinterEmul,
+    GeneratorPrinterEmul, PalletPrinter, PrinterEmul, TcpExchanger
+)
+from pacing import PaceMode
+
+
+MAX_PORT = 65535
+
+# Поля разделов описания линии: тип и значение по умолчанию. Поле без
+# значения по умолчанию обязательно. Значения [defaults] подставляются
+# вместо умолчаний одноименных полей буферов и камер
+DEFAULTS_FIELDS = {
+    'buffer_size': (int, CHANNEL_SIZE),
+    'overflow': (Overflow, Overflow.BLOCK),
+    'read_interval': (float, 0.15),
+    'pace_mode': (PaceMode, PaceMode.FIXED),
+    'backpressure': (Backpressure, Backpressure.BLOCK),
+    'fault_profile': (str, None),
+    'load_profile': (str, None),
+}
+BUFFER_FIELDS = {
+    'name': (str, ...),
+    'size': (int, None),
+    'overflow': (Overflow, None),
+}
+PRINTER_FIELDS = {
+    'name': (str, ...),
+    'port': (int, None),
+    # Буфер, в который попадают напечатанные КМ. Без буфера принтер
+    # паллетный: последние этикетки хранятся, но их никто не читает
+    'buffer': (str, None),
+    # КМ берутся из файла, а не печатаются MES (порт не нужен)
+    'file': (str, None),
+    'offset': (int, 0),
+    # ...или синтезируются: количество КМ, -1 - без ограничения
+    'generate': (int, 0),
+    'gtins': (list, None),
+    'serial_start': (int, 0),
+    'interval': (float, FILE_PRINT_INTERVAL),
+    # График нагрузки файла или генератора вместо interval
+    'load_profile': (str, None),
+}
+CAMERA_FIELDS = {
+    'name': (str, ...),
+    'port': (int, ...),
+    # Откуда камера читает КМ: буфер принтера или предыдущей камеры...
+    'source': (str, None),
+    # ...или файл (отбраковка)
+    'file': (str, None),
+    'offset': (int, 0),
+    # Буферы следующих камер, КМ раскладываются по ним по очереди
+    'targets': (list, []),
+    'stack': (int, 1),
+    'read_interval': (float, None),
+    'pace_mode': (PaceMode, None),
+    'backpressure': (Backpressure, None),
+    'send_queue': (int, SEND_QUEUE),
+    'can_stop': (bool, False),
+    # 0 - без ошибок
+    'error_percent': (float, 0.0),
+    'drop_percent': (float, 0.0),
+    'quality': (bool, False),
+    'bad_quality_percent': (float, 0.15),
+    'fault_profile': (str, None),
+    # График нагрузки вместо read_interval
+    'load_profile': (str, None),
+}
+SECTIONS = ('defaults', 'buffers', 'printers', 'cameras')
+
+
+def _read(path: Path) -> dict:
+    suffix = path.suffix.lower()
+    if suffix == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if suffix == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError(
+                f"{path}: TOML topology requires Python 3.11+"
+            ) from None
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if suffix in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(
+                f"{path}: YAML topology requires PyYAML"
+            ) from None
+        with open(path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f)
+    raise ValueError(f"{path}: expected a .toml, .json or .yaml file")
+
+
+def _convert(where: str, field: str, kind: type, value):
+    if issubclass(kind, Enum):
+        try:
+            return kind(value)
+        except ValueError:
+            raise ValueError(
+                f"{where}: {field} must be one of "
+                f"{[m.value for m in kind]}, got {value!r}"
+            ) from None
+    # bool - подкласс int, но true вместо номера порта - ошибка
+    if kind is not bool and isinstance(value, bool):
+        ok = False
+    elif kind is float:
+        ok = isinstance(value, (int, float))
+    else:
+        ok = isinstance(value, kind)
+    if not ok:
+        raise ValueError(
+            f"{where}: {field} must be {kind.__name__}, got {value!r}"
+        )
+    return float(value) if kind is float else value
+
+
+def _fields(where: str, item, spec: dict, defaults: dict) -> dict:
+    if not isinstance(item, dict):
+        raise ValueError(f"{where}: expected a table of fields")
+    unknown = set(item) - set(spec)
+    if unknown:
+        raise ValueError(f"{where}: unknown {sorted(unknown)}")
+    fields = {}
+    for field, (kind, default) in spec.items():
+        if field in item:
+            fields[field] = _convert(where, field, kind, item[field])
+        elif default is ...:
+            raise ValueError(f"{where}: {field} is required")
+        elif default is None and field in defaults:
+            fields[field] = defaults[field]
+        else:
+            fields[field] = default
+    return fields
+
+
+class Topology:
+    # Описание линии из файла: устройства, порты, буферы между ними и
+    # настройки сбоев. Проверяется целиком при загрузке, до создания
+    # устройств и открытия портов
+    def __init__(self, path: Path, buffers: dict[str, dict],
+                 printers: list[dict], cameras: list[dict]):
+        self.path = path
+        self.buffers = buffers
+        self.printers = printers
+        self.cameras = cameras
+
+    @property
+    def ports(self) -> list[int]:
+        return [
+            device['port'] for device in (*self.printers, *self.cameras)
+            if device['port'] is not None
+        ]
+
+
+def load_topology(path: Path) -> Topology:
+    data = _read(path)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a table of sections")
+    unknown = set(data) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"{path}: unknown sections {sorted(unknown)}")
+    raw = _fields(f"{path}: defaults", data.get('defaults', {}),
+                  DEFAULTS_FIELDS, {})
+    defaults = {
+        'size': raw['buffer_size'], 'overflow': raw['overflow'],
+        'read_interval': raw['read_interval'],
+        'pace_mode': raw['pace_mode'], 'backpressure': raw['backpressure'],
+        'fault_profile': raw['fault_profile'],
+        'load_profile': raw['load_profile'],
+    }
+
+    def section(name: str, spec: dict) -> list[dict]:
+        items = data.get(name, [])
+        if not isinstance(items, list):
+            raise ValueError(f"{path}: {name} must be a list")
+        return [
+            _fields(f"{path}: {name}[{n}]", item, spec, defaults)
+            for n, item in enumerate(items)
+        ]
+
+    buffers: dict[str, dict] = {}
+    for buffer in section('buffers', BUFFER_FIELDS):
+        if buffer['name'] in buffers:
+            raise ValueError(f"{path}: buffer {buffer['name']} "
+                             "is defined twice")
+        if buffer['size'] < 1:
+            raise ValueError(f"{path}: buffer {buffer['name']}: "
+                             "size must be positive")
+        buffers[buffer['name']] = buffer
+    printers = section('printers', PRINTER_FIELDS)
+    cameras = section('cameras', CAMERA_FIELDS)
+    if not printers and not cameras:
+        raise ValueError(f"{path}: no devices")
+
+    names: set[str] = set()
+    ports: dict[int, str] = {}
+    for device in (*printers, *cameras):
+        name = device['name']
+        if name in names:
+            raise ValueError(f"{path}: device {name} is defined twice")
+        names.add(name)
+        port = device['port']
+        if port is None:
+            continue
+        if not 0 < port <= MAX_PORT:
+            raise ValueError(f"{path}: {name}: port {port} is out of range")
+        if port in ports:
+            raise ValueError(f"{path}: {name}: port {port} is already "
+                             f"used by {ports[port]}")
+        ports[port] = name
+
+    def resolve(where: str, value: str) -> Path:
+        # Пути в описании - относительно файла описания
+        file = path.parent / value
+        if not file.exists():
+            raise ValueError(f"{where}: {file} does not exist")
+        return file
+
+    def check_load_profile(where: str, device: dict):
+        value = device['load_profile']
+        if value is None:
+            return
+        if value not in schedules.PROFILES:
+            value = str(path.parent / value)
+        try:
+            device['load_profile'] = schedules.load_profile(value)
+        except ValueError as e:
+            raise ValueError(f"{where}: {e}") from None
+
+    def check_buffer(where: str, name: str):
+        if name not in buffers:
+            raise ValueError(f"{where}: unknown buffer {name}")
+
+    writers: dict[str, list[str]] = {name: [] for name in buffers}
+    readers: dict[str, list[str]] = {name: [] for name in buffers}
+    for printer in printers:
+        where = f"{path}: printer {printer['name']}"
+        if printer['file'] is not None and printer['generate']:
+            raise ValueError(f"{where}: file and generate are exclusive")
+        if printer['file'] is not None:
+            if printer['buffer'] is None:
+                raise ValueError(f"{where}: file printer needs a buffer")
+            if printer['port'] is not None:
+                raise ValueError(f"{where}: file printer has no port")
+            printer['file'] = resolve(where, printer['file'])
+        elif printer['generate']:
+            if printer['buffer'] is None:
+                raise ValueError(f"{where}: generator needs a buffer")
+            if printer['port'] is not None:
+                raise ValueError(f"{where}: generator has no port")
+            try:
+                printer['gtins'] = [
+                    normalize_gtin(str(gtin))
+                    for gtin in printer['gtins'] or GTINS
+                ]
+            except ValueError as e:
+                raise ValueError(f"{where}: {e}") from None
+        elif printer['port'] is None:
+            raise ValueError(f"{where}: port is required")
+        else:
+            # Темп печати задает MES; значение из [defaults] не действует
+            printer['load_profile'] = None
+        if printer['interval'] <= 0:
+            raise ValueError(f"{where}: interval must be positive")
+        check_load_profile(where, printer)
+        if printer['buffer'] is not None:
+            check_buffer(where, printer['buffer'])
+            writers[printer['buffer']].append(printer['name'])
+
+    for camera in cameras:
+        where = f"{path}: camera {camera['name']}"
+        if (camera['source'] is None) == (camera['file'] is None):
+            raise ValueError(f"{where}: exactly one of source and file "
+                             "is required")
+        if camera['file'] is not None:
+            camera['file'] = resolve(where, camera['file'])
+        else:
+            check_buffer(where, camera['source'])
+            readers[camera['source']].append(camera['name'])
+        targets = camera['targets']
+        if not all(isinstance(target, str) for target in targets):
+            raise ValueError(f"{where}: targets must be buffer names")
+        if len(set(targets)) != len(targets):
+            raise ValueError(f"{where}: duplicate targets")
+        for target in targets:
+            check_buffer(where, target)
+            writers[target].append(camera['name'])
+        if camera['stack'] < 1:
+            raise ValueError(f"{where}: stack must be positive")
+        if camera['read_interval'] < 0 or camera['send_queue'] < 1:
+            raise ValueError(f"{where}: read_interval and send_queue "
+                             "must be positive")
+        for field in ('error_percent', 'drop_percent',
+                      'bad_quality_percent'):
+            if not 0 <= camera[field] <= 100:
+                raise ValueError(f"{where}: {field} must be within 0..100")
+        check_load_profile(where, camera)
+        if camera['fault_profile'] is not None:
+            value = camera['fault_profile']
+            if value not in faults.PROFILES:
+                value = str(path.parent / value)
+            try:
+                camera['fault_profile'] = faults.load_profile(value)
+            except ValueError as e:
+                raise ValueError(f"{where}: {e}") from None
+
+    for name in buffers:
+        # Несколько писателей перемешали бы коробы в буфере
+        if len(writers[name]) != 1:
+            raise ValueError(
+                f"{path}: buffer {name}: expected one device writing to "
+                f"it, got {writers[name] or 'none'}"
+            )
+        if len(readers[name]) != 1:
+            raise ValueError(
+                f"{path}: buffer {name}: expected one camera reading it, "
+                f"got {readers[name] or 'none'}"
+            )
+
+    # КМ не должны возвращаться в буфер, из которого уже прочитаны
+    downstream = {
+        camera['source']: camera['targets'] for camera in cameras
+        if camera['source'] is not None
+    }
+    for start in downstream:
+        seen = set()
+        stack = list(downstream[start])
+        while stack:
+            name = stack.pop()
+            if name == start:
+                raise ValueError(f"{path}: buffer {start} is part of a loop")
+            if name not in seen:
+                seen.add(name)
+                stack.extend(downstream.get(name, ()))
+
+    return Topology(path, buffers, printers, cameras)
+
+
+class Line:
+    # Устройства линии, построенные по описанию Topology
+    def __init__(self, topology: Topology, port_offset: int = 0):
+        self.topology = topology
+        self.buffers = {
+            name: Channel(name, buffer['size'], buffer['overflow'])
+            for name, buffer in topology.buffers.items()
+        }
+        self.printers: dict[
+            str, PrinterEmul | FilePrinterEmul | GeneratorPrinterEmul
+        ] = {}
+        self.pallet_printers: dict[str, PalletPrinter] = {}
+        self.cameras: dict[str, TcpExchanger] = {}
+        self.sources: dict[str, MmapCodeSource] = {}
+        for printer in topology.printers:
+            name = printer['name']
+            if printer['file'] is not None:
+                device = FilePrinterEmul(
+                    name, self.buffers[printer['buffer']], printer['file'],
+                    printer['interval'], printer['offset'],
+                    load_profile=printer['load_profile']
+                )
+                self.sources[name] = device.source
+                self.printers[name] = device
+            elif printer['generate']:
+                generator = CodeGenerator(
+                    printer['gtins'],
+                    faults.device_rng(name, 'codes').getrandbits(64),
+                    start=printer['serial_start']
+                )
+                self.printers[name] = GeneratorPrinterEmul(
+                    name, self.buffers[printer['buffer']], generator,
+                    max(printer['generate'], 0), printer['interval'],
+                    load_profile=printer['load_profile']
+                )
+            elif printer['buffer'] is not None:
+                self.printers[name] = PrinterEmul(
+                    name, self.buffers[printer['buffer']],
+                    printer['port'] + port_offset
+                )
+            else:
+                self.pallet_printers[name] = PalletPrinter(
+                    printer['port'] + port_offset, name
+                )
+        # КМ передаются следующей камере коробами размером ее пачки
+        stacks = {
+            camera['source']: camera['stack'] for camera in topology.cameras
+            if camera['source'] is not None
+        }
+        for camera in topology.cameras:
+            name = camera['name']
+            if camera['file'] is not None:
+                codes = MmapCodeSource(camera['file'], camera['offset'])
+                self.sources[name] = codes
+            else:
+                codes = self.buffers[camera['source']]
+            profile: FaultProfile | None = camera['fault_profile']
+            self.cameras[name] = TcpExchanger(
+                name=name,
+                codes_to_send=codes,
+                transfer_buffer=[
+                    self.buffers[target] for target in camera['targets']
+                ],
+                listen_port=camera['port'] + port_offset,
+                timeout=camera['read_interval'],
+                can_stop=camera['can_stop'],
+                gen_errors=bool(camera['error_percent']),
+                error_percent=camera['error_percent'],
+                stack=camera['stack'],
+                box_size={
+                    target: stacks[target] for target in camera['targets']
+                },
+                drop_dm_percent=camera['drop_percent'],
+                add_code_quality=camera['quality'],
+                bad_codes_percent=camera['bad_quality_percent'],
+                pace_mode=camera['pace_mode'],
+                backpressure=camera['backpressure'],
+                send_queue=camera['send_queue'],
+                fault_profile=profile,
+                load_profile=camera['load_profile']
+            )
+
+    def run(self):
+        logging.info(f"Line topology {self.topology.path}: "
+                     f"{len(self.printers) + len(self.pallet_printers)} "
+                     f"printers, {len(self.cameras)} cameras, "
+                     f"{len(self.buffers)} buffers")
+        for name, printer in self.printers.items():
+            if isinstance(printer, FilePrinterEmul):
+                logging.info(f"{name} source file path "
+                             f"{printer.dm_file_path}...")
+            elif isinstance(printer, GeneratorPrinterEmul):
+                logging.info(f"{name} generates codes for GTIN "
+                             f"{', '.join(printer.generator.gtins)}...")
+            else:
+                logging.info(f"Started {name} printer at "
+                             f"port {printer.port}...")
+            printer.start()
+        for pallet_printer in self.pallet_printers.values():
+            pallet_printer.run()
+        for name, camera in self.cameras.items():
+            logging.info(f"Started {name} camera at port {camera.port}...")
+            camera.start(delay=isinstance(camera.codes, Channel))
+
+    def report_positions(self):
+        for name, source in self.sources.items():
+            logging.info(f'<{name}> позиция в {source.path}: '
+                         f'{source.position}')
@@ -0,0 +1,224 @@
+import logging
+from itertools import count
+from time import monotonic
+
+from event_loop import EventLoop, get_event_loop
+from metrics import REGISTRY, Histogram
+
+
+# Через сколько секунд без продвижения код считается зависшим
+STUCK_AFTER = 10.0
+# Задержки этапов бывают и микросекундными, и многосекундными
+TRACE_BUCKETS = (
+    0.0001, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0,
+)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'emulator_trace_stage_seconds',
+    'Время между соседними точками пути КМ', ('from', 'to'), TRACE_BUCKETS
+)
+TOTAL_SECONDS = REGISTRY.histogram(
+    'emulator_trace_total_seconds',
+    'Время от первой до последней точки пути КМ', ('first', 'last'),
+    TRACE_BUCKETS
+)
+LOST = REGISTRY.counter(
+    'emulator_trace_lost_total', 'Потерянные КМ по месту потери', ('point',)
+)
+STUCK = REGISTRY.gauge(
+    'emulator_trace_stuck', 'Зависшие КМ по последней пройденной точке',
+    ('point',)
+)
+ACTIVE = REGISTRY.gauge(
+    'emulator_trace_active', 'КМ, путь которых еще не завершен'
+)
+
+
+class CodeTrace:
+    __slots__ = ('seq', 'code', 'path', 'first', 'last', 'stuck')
+
+    def __init__(self, seq: int, code: str, point: str, now: float):
+        # seq меняется при каждой отметке: по нему трасса лежит в
+        # Tracer.traces в порядке последнего продвижения
+        self.seq = seq
+        self.code = code
+        # Пройденные точки по порядку
+        self.path = (point,)
+        self.first = now
+        self.last = now
+        self.stuck = False
+
+
+class Tracer:
+    # Путь КМ по линии: каждое устройство отмечает точку (например
+    # PRNSER:printed, PRNSER:buffered, DMSER:sent, AGR_0:queued,
+    # AGR_0:sent), время между соседними точками попадает в гистограмму.
+    # Завершенные коды удаляются.
+    # PRNSER:printed -> PRNSER:buffered - ожидание следующего фрейма MES,
+    # дальше - очереди и темп эмулятора.
+    # У повторов одного КМ свои трассы: отметка продвигает самую старую
+    # трассу кода, еще не прошедшую эту точку, или начинает новую
+    def __init__(self, stuck_after: float = STUCK_AFTER,
+                 loop: EventLoop | None = None):
+        self.loop = loop or get_event_loop()
+        self.stuck_after = stuck_after
+        # Независшие трассы по seq: порядок вставки совпадает с порядком
+        # last, поэтому проверка зависших идет только по старым
+        self.traces: dict[int, CodeTrace] = {}
+        # Зависшие трассы по seq
+        self.parked: dict[int, CodeTrace] = {}
+        # Трассы кода в порядке появления
+        self.codes: dict[str, list[CodeTrace]] = {}
+        self._seq = count()
+        self._stages: dict[tuple[str, str], Histogram] = {}
+        self._totals: dict[tuple[str, str], Histogram] = {}
+        self.stuck: dict[str, int] = {}
+        ACTIVE.labels().set_function(
+            lambda: len(self.traces) + len(self.parked)
+        )
+        self.timer = self.loop.call_later(stuck_after / 2, self.sweep)
+
+    def stamp(self, code: str, point: str):
+        now = monotonic()
+        traces = self.codes.get(code)
+        trace = None
+        if traces is not None:
+            for candidate in traces:
+                if point not in candidate.path:
+                    trace = candidate
+                    break
+        if trace is None:
+            trace = CodeTrace(next(self._seq), code, point, now)
+            if traces is None:
+                self.codes[code] = [trace]
+            else:
+                traces.append(trace)
+            self.traces[trace.seq] = trace
+            return
+        key = (trace.path[-1], point)
+        histogram = self._stages.get(key)
+        if histogram is None:
+            histogram = self._stages[key] = STAGE_SECONDS.labels(*key)
+        histogram.observe(now - trace.last)
+        if trace.stuck:
+            self._unstuck(trace)
+        else:
+            del self.traces[trace.seq]
+        trace.path += (point,)
+        trace.last = now
+        trace.seq = next(self._seq)
+        self.traces[trace.seq] = trace
+
+    def _forget(self, trace: CodeTrace):
+        traces = self.codes[trace.code]
+        traces.remove(trace)
+        if not traces:
+            del self.codes[trace.code]
+        if trace.stuck:
+            self._unstuck(trace)
+        else:
+            del self.traces[trace.seq]
+
+    def done(self, code: str):
+        # Завершается трасса, отмеченная последней
+        traces = self.codes.get(code)
+        if not traces:
+            return
+        trace = max(traces, key=lambda t: t.seq)
+        self._forget(trace)
+        key = (trace.path[0], trace.path[-1])
+        histogram = self._totals.get(key)
+        if histogram is None:
+            histogram = self._totals[key] = TOTAL_SECONDS.labels(*key)
+        histogram.observe(trace.last - trace.first)
+
+    def lost(self, code: str, point: str):
+        # Из буфера теряется самый старый повтор кода
+        traces = self.codes.get(code)
+        if traces:
+            self._forget(traces[0])
+        LOST.labels(point).inc()
+        logging.debug("<TRACE> LOST at %s: %s", point, code)
+
+    def missed(self, code: str, point: str):
+        # Камера не прочитала КМ (drop_dm), но он идет дальше на агрегацию:
+        # учитывается как потерянный для MES, трассировка продолжается
+        self.stamp(code, point)
+        LOST.labels(point).inc()
+
+    def _unstuck(self, trace: CodeTrace):
+        trace.stuck = False
+        self.stuck[trace.path[-1]] -= 1
+        del self.parked[trace.seq]
+
+    def sweep(self):
+        self.timer = self.loop.call_later(self.stuck_after / 2, self.sweep)
+        deadline = monotonic() - self.stuck_after
+        stale = []
+        for trace in self.traces.values():
+            if trace.last >= deadline:
+                break
+            stale.append(trace)
+        new: dict[str, int] = {}
+        for trace in stale:
+            del self.traces[trace.seq]
+            self.parked[trace.seq] = trace
+            trace.stuck = True
+            point = trace.path[-1]
+            new[point] = new.get(point, 0) + 1
+        for point, number in new.items():
+            if point not in self.stuck:
+                self.stuck[point] = 0
+                STUCK.labels(point).set_function(
+                    lambda p=point: self.stuck[p]
+                )
+            self.stuck[point] += number
+            logging.warning(
+                f"<TRACE> STUCK: {number} codes at {point} "
+                f"for more than {self.stuck_after:g}s"
+            )
+
+    def report(self):
+        for (first, last), histogram in self._stages.items():
+            logging.info(
+                f"<TRACE> {first} -> {last}: {histogram.count} codes, "
+                f"mean {histogram.sum / histogram.count * 1000:.2f} ms, "
+                f"p99 <= {quantile(histogram, 0.99) * 1000:g} ms"
+            )
+        for (point, _), child in LOST.children.items():
+            logging.info(f"<TRACE> LOST at {point}: {child.value}")
+        stuck = {p: n for p, n in self.stuck.items() if n}
+        if stuck:
+            logging.info(f"<TRACE> STUCK now: {stuck}")
+
+    def stop(self):
+        self.timer.cancel()
+
+
+def quantile(histogram: Histogram, q: float) -> float:
+    # Верхняя граница корзины, в которую попадает квантиль
+    rank = q * histogram.count
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        if cumulative >= rank:
+            return bound
+    return float('inf')
+
+
+_tracer: Tracer | None = None
+
+
+def configure(enabled: bool, stuck_after: float = STUCK_AFTER):
+    # Вызывается до создания устройств, как capture.configure
+    global _tracer
+    if _tracer is not None:
+        _tracer.stop()
+        _tracer = None
+    if enabled:
+        _tracer = Tracer(stuck_after)
+
+
+def tracer() -> Tracer | None:
+    return _tracer
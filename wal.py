@@ -0,0 +1,406 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from queue import SimpleQueue
+from time import monotonic, perf_counter
+from typing import Callable
+
+from channel import Channel
+from event_loop import EventLoop, get_event_loop
+
+
+# Журнал линии: каталог со снимком состояния и сегментом журнала
+# wal-<номер снимка>.log, в который дописываются перемещения КМ после
+# снимка. Записи - строки:
+#   +ЭТАП\tКМ      КМ попал в конец очереди этапа
+#   -ЭТАП[\tN]     N КМ (по умолчанию 1) ушли из начала очереди
+#   -ЭТАП\t1\tK    ушел КМ номер K от начала (вытеснен из буфера)
+#   ~ЭТАП          очередь этапа закрыта (клиент принтера отключился)
+#   @ИСТОЧНИК\tЗНАЧЕНИЕ  позиция источника КМ (файла, генератора)
+MAGIC = 'PLEWAL1'
+SNAPSHOT = 'snapshot'
+# Записи копятся в памяти и раз в COMMIT_INTERVAL одной пачкой пишутся
+# и fsync-аются в отдельном потоке
+COMMIT_INTERVAL = 0.05
+# Сегмент журнала сжимается в снимок по времени или числу записей
+SNAPSHOT_INTERVAL = 60.0
+SNAPSHOT_RECORDS = 1000000
+
+
+class Stage:
+    # Очередь КМ (FIFO), перемещения которой пишутся в журнал. items
+    # возвращает содержимое для снимка, restore заполняет очередь при
+    # восстановлении
+    __slots__ = ('name', 'items', 'restore', 'held', 'append',
+                 'push_prefix', 'pop_record', 'clear_record')
+
+    def __init__(self, journal: 'Journal', name: str,
+                 items: Callable[[], list[str]],
+                 restore: Callable[[list[str]], None] | None = None,
+                 held: list[str] | None = None):
+        if '\t' in name or '\n' in name:
+            raise ValueError(f"bad journal stage name {name!r}")
+        self.name = name
+        self.items = items
+        self.restore = restore
+        # КМ, уже выбранные читателем, но еще не ушедшие из очереди в
+        # журнале (собираемая пачка камеры)
+        self.held = held
+        # Список ожидающих записей не подменяется при фиксации, поэтому
+        # метод append можно сохранить
+        self.append = journal.pending.append
+        self.push_prefix = f"+{name}\t"
+        self.pop_record = f"-{name}\n"
+        self.clear_record = f"~{name}\n"
+
+    def push(self, code: str):
+        self.append(f"{self.push_prefix}{code}\n")
+
+    def pop(self, count: int = 1):
+        if count == 1:
+            self.append(self.pop_record)
+        else:
+            self.append(f"-{self.name}\t{count}\n")
+
+    def drop(self):
+        # Вытеснен первый КМ буфера: в журнале перед ним еще выбранные
+        # читателем КМ
+        if self.held:
+            self.append(f"-{self.name}\t1\t{len(self.held)}\n")
+        else:
+            self.append(self.pop_record)
+
+    def clear(self):
+        self.append(self.clear_record)
+
+
+class State:
+    # Очереди этапов и позиции источников, прочитанные из снимка и
+    # сегмента журнала
+    def __init__(self, seq: int = 0):
+        self.seq = seq
+        self.stages: dict[str, deque[str]] = {}
+        self.cursors: dict[str, str] = {}
+        self.records = 0
+
+    def apply(self, record: str):
+        op = record[0]
+        name, _, value = record[1:].partition('\t')
+        if op == '+':
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = deque()
+            stage.append(value)
+        elif op == '-':
+            stage = self.stages.get(name)
+            count, _, at = value.partition('\t')
+            if at:
+                if stage is not None and int(at) < len(stage):
+                    del stage[int(at)]
+                else:
+                    logging.warning(f"<WAL> {name}: no code at {at}")
+            else:
+                for _ in range(int(count) if count else 1):
+                    if not stage:
+                        logging.warning(f"<WAL> {name}: empty stage")
+                        break
+                    stage.popleft()
+        elif op == '~':
+            self.stages.pop(name, None)
+        elif op == '@':
+            self.cursors[name] = value
+        else:
+            raise ValueError(f"bad journal record {record!r}")
+        self.records += 1
+
+    @property
+    def codes(self) -> int:
+        return sum(len(stage) for stage in self.stages.values())
+
+
+def _read_lines(path: Path) -> list[str]:
+    # Последняя строка без перевода строки - недописанная пачка
+    # при сбое, она отбрасывается
+    with open(path, 'r', encoding='utf-8', newline='\n') as f:
+        lines = f.read().split('\n')
+    if lines[-1]:
+        logging.warning(f"<WAL> {path}: truncated record at the end")
+    return lines[:-1]
+
+
+def load_state(directory: Path) -> State:
+    snapshot = directory / SNAPSHOT
+    state = State()
+    if snapshot.exists():
+        lines = _read_lines(snapshot)
+        magic, _, seq = lines[0].partition(' ') if lines else ('', '', '')
+        if magic != MAGIC or not seq.isdigit():
+            raise ValueError(f"{snapshot}: not a journal snapshot")
+        state.seq = int(seq)
+        n = 1
+        while n < len(lines):
+            line = lines[n]
+            name, _, value = line[1:].partition('\t')
+            if line[0] == '@':
+                state.cursors[name] = value
+                n += 1
+            elif line[0] == '#':
+                count = int(value)
+                state.stages[name] = deque(lines[n + 1:n + 1 + count])
+                n += 1 + count
+            else:
+                raise ValueError(f"{snapshot}: bad line {n + 1}")
+    segment = directory / f"wal-{state.seq}.log"
+    if segment.exists():
+        apply = state.apply
+        for record in _read_lines(segment):
+            if record:
+                apply(record)
+    return state
+
+
+class JournalWriter(threading.Thread):
+    # Поток записи: пачка записей - write и один fsync (групповая
+    # фиксация); снимок пишется во временный файл, fsync и os.replace,
+    # после чего начинается новый сегмент, а старый удаляется
+    def __init__(self, directory: Path, seq: int):
+        super().__init__(name='JournalWriter', daemon=True)
+        self.directory = directory
+        self.queue: SimpleQueue = SimpleQueue()
+        self.seq = seq
+        self.file = open(self.segment(seq), 'a', encoding='utf-8',
+                         newline='\n')
+
+    def segment(self, seq: int) -> Path:
+        return self.directory / f"wal-{seq}.log"
+
+    def run(self):
+        queue = self.queue
+        while 1:
+            item = queue.get()
+            if item is None:
+                break
+            if isinstance(item, list):
+                self.file.write(''.join(item))
+                # Все пачки, накопившиеся за время fsync, - одним fsync
+                if queue.empty():
+                    self.sync()
+            else:
+                self.sync()
+                self.write_snapshot(*item)
+        self.sync()
+        self.file.close()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def write_snapshot(self, seq: int, stages: dict[str, list[str]],
+                       cursors: dict[str, str]):
+        started = perf_counter()
+        tmp = self.directory / f"{SNAPSHOT}.tmp"
+        with open(tmp, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(f"{MAGIC} {seq}\n")
+            for name, value in cursors.items():
+                f.write(f"@{name}\t{value}\n")
+            for name, codes in stages.items():
+                f.write(f"#{name}\t{len(codes)}\n")
+                if codes:
+                    f.write('\n'.join(codes))
+                    f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.directory / SNAPSHOT)
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.directory, os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        old = self.seq
+        self.file.close()
+        self.seq = seq
+        self.file = open(self.segment(seq), 'a', encoding='utf-8',
+                         newline='\n')
+        self.segment(old).unlink(missing_ok=True)
+        logging.debug(
+            "<WAL> snapshot %d: %d codes in %.3f s", seq,
+            sum(len(codes) for codes in stages.values()),
+            perf_counter() - started
+        )
+
+
+class Journal:
+    # Журнал перемещений КМ между очередями линии. Устройства
+    # регистрируют очереди (stage, channel) и позиции источников
+    # (cursor) при создании; start() после создания всей линии
+    # восстанавливает их из прошлого запуска и сразу пишет новый снимок
+    def __init__(self, directory: Path,
+                 commit_interval: float = COMMIT_INTERVAL,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL,
+                 snapshot_records: int = SNAPSHOT_RECORDS,
+                 loop: EventLoop | None = None):
+        self.directory = directory
+        self.loop = loop or get_event_loop()
+        self.commit_interval = commit_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_records = snapshot_records
+        directory.mkdir(parents=True, exist_ok=True)
+        started = perf_counter()
+        self.recovered = load_state(directory)
+        if self.recovered.records or self.recovered.stages:
+            logging.info(
+                f"<WAL> {directory}: {self.recovered.codes} codes in "
+                f"{len(self.recovered.stages)} stages, "
+                f"{self.recovered.records} records after snapshot "
+                f"{self.recovered.seq}, read in "
+                f"{perf_counter() - started:.2f} s"
+            )
+        for path in directory.glob('wal-*.log'):
+            if path.name != f"wal-{self.recovered.seq}.log":
+                path.unlink()
+        self.seq = self.recovered.seq
+        self.pending: list[str] = []
+        self.records = 0
+        self.stages: dict[str, Stage] = {}
+        # Префикс этапов -> куда вернуть их КМ (очереди клиентов принтера
+        # после перезапуска попадают в буфер принтера)
+        self.fallbacks: dict[str, Callable[[list[str]], None]] = {}
+        self.cursors: dict[str, tuple[Callable[[], object],
+                                      Callable[[str], None]]] = {}
+        self.cursor_values: dict[str, str] = {}
+        self.last_snapshot = monotonic()
+        self.timer = None
+        self.writer = JournalWriter(directory, self.seq)
+        self.writer.start()
+
+    def stage(self, name: str, items: Callable[[], list[str]],
+              restore: Callable[[list[str]], None] | None = None,
+              held: list[str] | None = None) -> Stage:
+        if name in self.stages:
+            raise ValueError(f"journal stage {name} is registered twice")
+        stage = self.stages[name] = Stage(self, name, items, restore, held)
+        return stage
+
+    def channel(self, channel: Channel, held: list[str]) -> Stage:
+        # Буфер журналирует добавления и вытесненные КМ сам, выборку -
+        # читатель (камера), когда КМ отправлены. До отправки КМ лежат в
+        # held и после сбоя возвращаются в начало буфера
+        stage = self.stage(
+            channel.name, lambda: held + channel.snapshot(),
+            lambda codes: self.restore_channel(channel, codes), held
+        )
+        channel.journal = stage
+        return stage
+
+    def restore_channel(self, channel: Channel, codes: list[str]):
+        # Восстановленные КМ уже есть в журнале - повторно не пишутся
+        stage, channel.journal = channel.journal, None
+        try:
+            restored = channel.extend(codes)
+        finally:
+            channel.journal = stage
+        if restored < len(codes):
+            logging.warning(f"<WAL> {channel.name}: "
+                            f"{len(codes) - restored} codes do not fit")
+
+    def fallback(self, prefix: str, restore: Callable[[list[str]], None]):
+        self.fallbacks[prefix] = restore
+
+    def remove(self, stage: Stage):
+        stage.clear()
+        self.stages.pop(stage.name, None)
+
+    def cursor(self, name: str, get: Callable[[], object],
+               restore: Callable[[str], None]):
+        self.cursors[name] = (get, restore)
+
+    def start(self):
+        recovered = self.recovered
+        for name, (_, restore) in self.cursors.items():
+            if name in recovered.cursors:
+                restore(recovered.cursors[name])
+        left = dict(recovered.stages)
+        for name, stage in self.stages.items():
+            codes = left.pop(name, None)
+            if codes and stage.restore is not None:
+                stage.restore(list(codes))
+        for name, codes in left.items():
+            restore = self.fallbacks.get(name.partition('#')[0])
+            if restore is None:
+                logging.warning(f"<WAL> {name}: {len(codes)} codes "
+                                "of an unknown stage are dropped")
+            elif codes:
+                restore(list(codes))
+        self.recovered = State()
+        # Восстановленное состояние - сразу в новый снимок, прочитанный
+        # сегмент больше не нужен
+        self.snapshot()
+        self.timer = self.loop.call_later(self.commit_interval, self.commit)
+
+    def commit(self):
+        self.timer = self.loop.call_later(self.commit_interval, self.commit)
+        pending = self.pending
+        for name, (get, _) in self.cursors.items():
+            value = str(get())
+            if self.cursor_values.get(name) != value:
+                self.cursor_values[name] = value
+                pending.append(f"@{name}\t{value}\n")
+        if pending:
+            self.records += len(pending)
+            self.writer.queue.put(pending[:])
+            pending.clear()
+        if (
+            self.records >= self.snapshot_records or
+            monotonic() - self.last_snapshot >= self.snapshot_interval
+        ):
+            self.snapshot()
+
+    def snapshot(self):
+        # Содержимое очередей копируется (ссылки на строки) в цикле
+        # событий, файл пишет поток записи после уже отданных пачек
+        if self.pending:
+            self.writer.queue.put(self.pending[:])
+            self.pending.clear()
+        self.seq += 1
+        stages = {name: stage.items() for name, stage in self.stages.items()}
+        cursors = {name: str(get()) for name, (get, _) in self.cursors.items()}
+        self.cursor_values = dict(cursors)
+        self.writer.queue.put((self.seq, stages, cursors))
+        self.records = 0
+        self.last_snapshot = monotonic()
+
+    def stop(self):
+        if not self.writer.is_alive():
+            return
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            self.writer.queue.put(self.pending[:])
+            self.pending.clear()
+        self.writer.queue.put(None)
+        self.writer.join()
+
+
+_journal: Journal | None = None
+
+
+def configure(directory: Path | None,
+              commit_interval: float = COMMIT_INTERVAL,
+              snapshot_interval: float = SNAPSHOT_INTERVAL):
+    # Вызывается до создания устройств, как tracing.configure
+    global _journal
+    if _journal is not None:
+        _journal.stop()
+        _journal = None
+    if directory is not None:
+        _journal = Journal(directory, commit_interval, snapshot_interval)
+        atexit.register(_journal.stop)
+
+
+def journal() -> Journal | None:
+    return _journal